@@ -1,6 +1,6 @@
 """
 video_translator - automatically generate transcription and compress subtitle with video
-Translator haven't been implemented yet
+with offline machine translation of the subtitles, see machine_translation
 """
 
 __version__ = "0.1.0"
@@ -8,10 +8,19 @@ __author__ = "Calc1te"
 
 from .single_video_translation import VideoTranslator, Device
 from .ass_subtitle_generator import AssStyle, AssGenerator
+from .model_pool import ModelPool, get_model_pool
+from .machine_translation import MachineTranslator, TranslationBackend, TranslationCache, get_backend, register_backend
 
 __all__ = [
     "VideoTranslator",
     "Device",
     "AssStyle",
     "AssGenerator",
+    "ModelPool",
+    "get_model_pool",
+    "MachineTranslator",
+    "TranslationBackend",
+    "TranslationCache",
+    "get_backend",
+    "register_backend",
 ]
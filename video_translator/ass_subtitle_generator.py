@@ -1,9 +1,8 @@
 from typing import List, Tuple
 from pathlib import Path
 import textwrap
-import json
 import re
-from .utils import Transcription
+from .utils import Transcription, TranscriptionTable, format_HMS, second_to_HMS
 
 
 UNICODE_ESCAPE_RE = re.compile(r"\\(?:u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8})")
@@ -22,31 +21,6 @@ def restore_raw_unicode_escapes(text: str) -> str:
     return UNICODE_ESCAPE_RE.sub(replace, text)
 
 
-def restore_json_encoded_ass(content: str) -> str:
-    stripped = content.lstrip("\ufeff")
-    if not (stripped.startswith('"') and stripped.endswith('"')):
-        return restore_raw_unicode_escapes(content)
-
-    try:
-        decoded = json.loads(stripped)
-    except json.JSONDecodeError:
-        return restore_raw_unicode_escapes(content)
-
-    if isinstance(decoded, str):
-        return restore_raw_unicode_escapes(decoded)
-    return restore_raw_unicode_escapes(content)
-
-
-def repair_ass_file(path: str | Path) -> bool:
-    ass_path = Path(path)
-    content = ass_path.read_text(encoding="utf-8-sig")
-    repaired = restore_json_encoded_ass(content)
-    if repaired == content:
-        return False
-    ass_path.write_text(repaired, encoding="utf-8-sig")
-    return True
-
-
 class AssStyle:
     def __init__(
         self,
@@ -121,53 +95,98 @@ class AssStyle:
             f"{self.margin_l},{self.margin_r},{self.margin_v},{self.encoding}"
         )
 
-class AssGenerator:
-    def __init__(self, file_name : str, transcriptions : list[Transcription], styles : List[AssStyle]|None = None):
-        self.file_name = file_name
-        self.info_header = textwrap.dedent('''\
-            [Script Info]
-            ; Script generated by whisper_video_translator
-            ; By Calc1te
-            Title: {_Title}
-            ScriptType: v4.00+
-            WrapStyle: 0
-            ScaledBorderAndShadow: yes
-            YCbCr Matrix: TV.709
-            PlayResX: {_VidResX}
-            PlayResY: {_VidResY}
-        ''')
-        styles_header = textwrap.dedent('''\
-            \n[V4+ Styles]
-Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-        ''')
+INFO_HEADER = textwrap.dedent('''\
+    [Script Info]
+    ; Script generated by whisper_video_translator
+    ; By Calc1te
+    Title: {title}
+    ScriptType: v4.00+
+    WrapStyle: 0
+    ScaledBorderAndShadow: yes
+    YCbCr Matrix: TV.709
+    PlayResX: {res_x}
+    PlayResY: {res_y}
+''')
+STYLES_HEADER = '[V4+ Styles]\nFormat: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding\n'
+EVENTS_HEADER = '[Events]\nFormat: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n'
+
+# rows formatted per batch when a whole table is written, keeps memory flat for long tracks
+WRITE_BATCH = 4096
+
+
+def dialogue_text(text: str) -> str:
+    # one event per line: real line breaks become ASS hard breaks
+    return restore_raw_unicode_escapes(text).replace('\r\n', '\n').replace('\n', '\\N')
+
+
+class AssWriter:
+    """Writes an .ass file front to back: header and styles on open, then one Dialogue line per write().
+
+    Lines go straight to a buffered file handle, so nothing but the current line is held in
+    memory and the file can be appended to while transcription is still running.
+    """
+
+    def __init__(self, path: str | Path, res_x: int, res_y: int, title: str,
+                 styles: List[AssStyle] | None = None):
         if styles is None:
-            default = AssStyle()
             print('Warning: No subtitle style given, using a default one...')
-            styles = [default]
-        self.styles = styles_header + "\n".join(s.to_ass() for s in styles)
-
-        events_header = textwrap.dedent('''\
-            \n[Events]
-Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
-        ''')
-        self.events = events_header + "\n".join(
-            f'Dialogue: 0, {t.start}, {t.end}, {styles[0].name},,0,0,0,,{restore_raw_unicode_escapes(t.text)}'
-            for t in transcriptions
-        )
+            styles = [AssStyle()]
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.style = styles[0].name
+        self.count = 0
+        self._file = open(self.path, 'w', encoding='utf-8-sig', buffering=1 << 16)
+        self._file.write(INFO_HEADER.format(title=title, res_x=res_x, res_y=res_y))
+        self._file.write(STYLES_HEADER)
+        self._file.writelines(f'{s.to_ass()}\n' for s in styles)
+        self._file.write(EVENTS_HEADER)
+
+    def write(self, start: str, end: str, text: str):
+        self._file.write(f'Dialogue: 0, {start}, {end}, {self.style},,0,0,0,,{dialogue_text(text)}\n')
+        self.count += 1
+
+    def write_segment(self, start: float, end: float, text: str):
+        self.write(second_to_HMS(start), second_to_HMS(end), text)
+
+    def write_table(self, transcriptions: TranscriptionTable | List[Transcription]):
+        if not isinstance(transcriptions, TranscriptionTable):
+            transcriptions = TranscriptionTable.from_segments((t.start_calc, t.end_calc, t.text) for t in transcriptions)
+        texts = transcriptions.texts
+        for lo in range(0, len(transcriptions), WRITE_BATCH):
+            hi = min(lo + WRITE_BATCH, len(transcriptions))
+            starts = format_HMS(transcriptions.starts[lo:hi])
+            ends = format_HMS(transcriptions.ends[lo:hi])
+            for start, end, text in zip(starts, ends, texts[lo:hi]):
+                self.write(start, end, text)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self) -> 'AssWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
+class AssGenerator:
+    def __init__(self, file_name : str, transcriptions : TranscriptionTable | list[Transcription], styles : List[AssStyle]|None = None):
+        self.file_name = file_name
+        self.transcriptions = transcriptions
+        self.styles = styles
+
+    def default_title(self) -> str:
+        return f"{self.file_name} by Calc1te's whisper ass generator"
+
     def save(self, ResX : int, ResY : int, Title = None, output_dir: str | Path | None = None):
         subtitle_dir = Path(output_dir) if output_dir is not None else Path('ass')
-        subtitle_dir.mkdir(parents=True, exist_ok=True)
         path = subtitle_dir / f'{self.file_name}.ass'
-        _Title = f"{self.file_name} by Calc1te's whisper ass generator" if Title is None else Title
-        
-        info_text = self.info_header.format(_Title = _Title, _VidResX = ResX, _VidResY = ResY)
-
-        content = "\n".join([info_text.strip(), self.styles.strip(), self.events.strip()])
-
-        with open(path, "w", encoding="utf-8-sig") as f:
-            f.write(content)
+        with AssWriter(path, ResX, ResY, Title or self.default_title(), self.styles) as writer:
+            writer.write_table(self.transcriptions)
 
         print(f"Subtitle saved to: {path}")
         return path
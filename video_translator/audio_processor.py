@@ -1,7 +1,14 @@
 import numpy as np
+from dataclasses import dataclass
 from pathlib import Path
 import wave
-from typing import List, Tuple
+from typing import Iterator, List, Tuple
+from .ffmpeg_runner import FFmpegRunner
+
+# whisper works on 16kHz mono, so that is what the in-memory stream decodes to
+STREAM_SAMPLE_RATE = 16000
+# ~23ms, the same window as the default 1024 samples at 44.1kHz
+STREAM_FRAME_SIZE = 372
 
 def rms_to_db(rms) -> float:
     return 20 * np.log10(rms + 1e-10)
@@ -24,7 +31,93 @@ def cluster(periods: List[Tuple[float, float]], time_threshold: float = 0.2) ->
 
     return clustered
 
-def detect_no_sound_period(audio: Path|str, threshold_db: int = -40, frame_size: int = 1024) -> List[Tuple[float, float]]:
+class SilenceDetector:
+    """Incremental quiet-frame detector, fed with normalized mono float blocks of any size."""
+
+    def __init__(self, sample_rate: int, threshold_db: int = -40, frame_size: int = 1024):
+        self.sample_rate = sample_rate
+        self.threshold_db = threshold_db
+        self.frame_size = frame_size
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._frame_offset = 0  # frame index of self._pending[0]
+        # quiet runs as [first_frame, last_frame] pairs, the last one may still grow
+        self._runs: List[List[int]] = []
+
+    def feed(self, samples: np.ndarray):
+        buf = np.concatenate([self._pending, samples]) if len(self._pending) else samples
+        # a frame only counts once at least one sample follows it, like the old range() did
+        n_frames = max(0, (len(buf) - 1) // self.frame_size)
+        if n_frames:
+            frames = buf[:n_frames * self.frame_size].reshape(n_frames, self.frame_size)
+            rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1) + 1e-10)
+            quiet = np.flatnonzero(rms_to_db(rms) < self.threshold_db) + self._frame_offset
+            self._add_quiet_frames(quiet)
+        self._pending = buf[n_frames * self.frame_size:].copy()
+        self._frame_offset += n_frames
+
+    def _add_quiet_frames(self, quiet: np.ndarray):
+        if len(quiet) == 0:
+            return
+        breaks = np.flatnonzero(np.diff(quiet) > 1)
+        starts = quiet[np.concatenate(([0], breaks + 1))]
+        ends = quiet[np.concatenate((breaks, [len(quiet) - 1]))]
+        first = 0
+        if self._runs and self._runs[-1][1] + 1 == starts[0]:
+            self._runs[-1][1] = int(ends[0])
+            first = 1
+        self._runs.extend([int(s), int(e)] for s, e in zip(starts[first:], ends[first:]))
+
+    def result(self) -> List[Tuple[float, float]]:
+        fs = self.frame_size
+        periods = [(s * fs / self.sample_rate, (e + 1) * fs / self.sample_rate) for s, e in self._runs]
+        return cluster(periods)
+
+def pcm_to_mono(data: bytes, sample_width: int, n_channels: int) -> np.ndarray:
+    """Decode interleaved little-endian PCM of any width/channel count to mono float32 in [-1, 1]."""
+    if sample_width == 1:
+        samples = np.frombuffer(data, dtype=np.uint8).astype(np.int16) - 128
+    elif sample_width == 2:
+        samples = np.frombuffer(data, dtype='<i2')
+    elif sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = np.where(samples & 0x800000, samples - 0x1000000, samples)
+    elif sample_width == 4:
+        samples = np.frombuffer(data, dtype='<i4')
+    else:
+        raise ValueError(f'unsupported sample width {sample_width}')
+    full_scale = float(1 << (8 * sample_width - 1))
+
+    if n_channels > 1:
+        # truncate the channel mean like the old int16 downmix did
+        samples = np.trunc(samples.reshape(-1, n_channels).mean(axis=1))
+    return (samples / full_scale).astype(np.float32)
+
+def stream_pcm(media: Path|str, sample_rate: int = STREAM_SAMPLE_RATE, chunk_seconds: float = 10.0) -> Iterator[np.ndarray]:
+    # ffmpeg -i movie.mp4 -vn -ac 1 -ar 16000 -f s16le pipe:1
+    cmd = ['ffmpeg', '-i', str(media), '-vn', '-ac', '1', '-ar', str(sample_rate),
+           '-f', 's16le', '-acodec', 'pcm_s16le', 'pipe:1']
+    chunk_bytes = int(sample_rate * chunk_seconds) * 2
+    runner = FFmpegRunner(cmd, raw_stdout=True).start()
+    try:
+        leftover = b''
+        while True:
+            data = runner.stdout.read(chunk_bytes)
+            if not data:
+                break
+            data = leftover + data
+            usable = len(data) - len(data) % 2
+            leftover = data[usable:]
+            if usable:
+                yield np.frombuffer(data[:usable], dtype=np.int16)
+    except BaseException:
+        # consumer stopped early (or failed), don't leave ffmpeg running
+        runner.kill()
+        raise
+    runner.wait()
+
+def detect_no_sound_period(audio: Path|str, threshold_db: int = -40, frame_size: int = 1024,
+                           block_frames: int = 1 << 20) -> List[Tuple[float, float]]:
     audio_path = Path(audio) if isinstance(audio, str) else audio
     
     try:
@@ -32,49 +125,62 @@ def detect_no_sound_period(audio: Path|str, threshold_db: int = -40, frame_size:
             n_channels = wav_file.getnchannels()
             sample_width = wav_file.getsampwidth()
             frame_rate = wav_file.getframerate()
-            n_frames = wav_file.getnframes()
-            
-            audio_data = wav_file.readframes(n_frames)
-        
-        audio_np = np.frombuffer(audio_data, dtype=np.int16)
-        
-        if n_channels == 2:
-            audio_np = audio_np.reshape(-1, 2).mean(axis=1).astype(np.int16)
-        
-        quiet_frames = []
-        for i in range(0, len(audio_np) - frame_size, frame_size):
-            frame = audio_np[i:i + frame_size].astype(np.float32) / 32768.0 # normalize rsm to [-1, 1]
-            rms = np.sqrt(np.mean(frame ** 2) + 1e-10 )
-            db = rms_to_db(rms)
-            
-            if db < threshold_db:
-                quiet_frames.append(i)
-        
-        silent_periods = []
-        if quiet_frames:
-            start_frame = quiet_frames[0]
-            prev_frame = quiet_frames[0]
-            
-            for frame_idx in quiet_frames[1:]:
-                if frame_idx - prev_frame > frame_size:
-                    end_frame = prev_frame + frame_size
-                    start_time = start_frame / frame_rate
-                    end_time = end_frame / frame_rate
-                    silent_periods.append((start_time, end_time))
-                    start_frame = frame_idx
-                prev_frame = frame_idx
-            
-            end_frame = prev_frame + frame_size
-            start_time = start_frame / frame_rate
-            end_time = end_frame / frame_rate
-            silent_periods.append((start_time, end_time))
-            silent_periods_clustered = cluster(silent_periods)
-        return silent_periods_clustered #type:ignore
+
+            # read in bounded blocks so memory stays flat however long the file is
+            detector = SilenceDetector(frame_rate, threshold_db, frame_size)
+            while True:
+                data = wav_file.readframes(block_frames)
+                if not data:
+                    break
+                detector.feed(pcm_to_mono(data, sample_width, n_channels))
+        return detector.result()
     
     except wave.Error as e:
         raise ValueError(f"Cannot read WAV file: {e}")
     except Exception as e:
         raise Exception(f"Error occurred when processing: {e}")
     
+@dataclass
+class TrimPolicy:
+    trim_tail: bool = True
+    trim_head: bool = False
+    # segments that would end up shorter than this keep their original timing
+    min_duration: float = 0.0
+
+def trim_silences(starts: np.ndarray, ends: np.ndarray, silent_periods: List[Tuple[float, float]],
+                  policy: TrimPolicy | None = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Move segment edges that fall inside a silent period to that period's border.
+
+    silent_periods must be sorted and non-overlapping (what detect_no_sound_period returns),
+    so the silence around each edge is found with one searchsorted over the start column.
+    """
+    policy = policy or TrimPolicy()
+    starts = np.asarray(starts, dtype=np.float64)
+    ends = np.asarray(ends, dtype=np.float64)
+    new_starts, new_ends = starts.copy(), ends.copy()
+    if len(silent_periods) == 0 or len(starts) == 0:
+        return new_starts, new_ends
+
+    silences = np.asarray(silent_periods, dtype=np.float64)
+    sil_starts, sil_ends = silences[:, 0], silences[:, 1]
+
+    def containing(t: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        idx = np.searchsorted(sil_starts, t, side='left') - 1
+        safe = np.clip(idx, 0, None)
+        inside = (idx >= 0) & (t < sil_ends[safe])
+        return inside, safe
+
+    if policy.trim_tail:
+        inside, idx = containing(ends)
+        new_ends[inside] = sil_starts[idx[inside]]
+    if policy.trim_head:
+        inside, idx = containing(starts)
+        new_starts[inside] = sil_ends[idx[inside]]
+
+    too_short = (new_ends - new_starts < policy.min_duration) | (new_ends <= new_starts)
+    new_starts[too_short] = starts[too_short]
+    new_ends[too_short] = ends[too_short]
+    return new_starts, new_ends
+
 if __name__ == '__main__':
     print(detect_no_sound_period('wav/0604.mp4_audio.wav'))
\ No newline at end of file
@@ -0,0 +1,174 @@
+import glob
+import hashlib
+import json
+import logging
+import time
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List
+
+from .single_video_translation import VideoTranslator, Device
+from .machine_translation import TranslationStream
+from .model_pool import get_model_pool
+from .utils import VIDEO_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ClipResult:
+    path: str
+    # the name its work files get, differs from the file name when another input shares that
+    name: str | None = None
+    status: str = 'pending'
+    error: str | None = None
+    cached: bool = False
+    subtitle_file: str | None = None
+    output_file: str | None = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    metrics: Dict[str, Any] | None = None
+
+
+def collect_inputs(patterns: Iterable[str]) -> List[Path]:
+    """Expand directories and glob patterns into a sorted, de-duplicated list of video files."""
+    found: Dict[Path, None] = {}
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            candidates = sorted(p for p in path.iterdir() if p.is_file())
+        elif path.exists():
+            candidates = [path]
+        else:
+            candidates = [Path(p) for p in sorted(glob.glob(pattern, recursive=True))]
+        for candidate in candidates:
+            if candidate.suffix.lower().lstrip('.') in VIDEO_EXTENSIONS:
+                found[candidate.resolve()] = None
+    return list(found)
+
+
+def work_names(inputs: List[Path]) -> List[str]:
+    """One unique file name per input for the shared work_dir: the base name, plus a hash of
+    the folder when several inputs (say a/intro.mp4 and b/intro.mp4) have the same one."""
+    counts = Counter(path.name for path in inputs)
+    names: List[str] = []
+    for i, path in enumerate(inputs):
+        name = path.name
+        if counts[name] > 1:
+            tag = hashlib.blake2b(str(path.resolve().parent).encode(), digest_size=4).hexdigest()
+            name = f'{path.stem}_{tag}{path.suffix}'
+            if name in names:
+                # the very same file listed twice
+                name = f'{path.stem}_{tag}_{i}{path.suffix}'
+        names.append(name)
+    return names
+
+
+def _timed(result: ClipResult, stage: str, fn, *args):
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        result.timings[stage] = round(time.perf_counter() - start, 3)
+
+
+def _extract(make_translator: Callable[[], VideoTranslator], result: ClipResult) -> VideoTranslator:
+    translator = make_translator()
+    result.cached = translator.load_cached_transcription()
+    if not result.cached:
+        _timed(result, 'extract', translator.get_audio_stream)
+    _timed(result, 'probe', translator.get_resolution)
+    return translator
+
+
+def _burn(translator: VideoTranslator, result: ClipResult, translation: TranslationStream | None = None):
+    try:
+        if translation is not None:
+            _timed(result, 'subtitle', translator.generate_translated_subtitle, translation)
+        else:
+            _timed(result, 'subtitle', translator.generate_subtitle)
+        result.subtitle_file = str(translator.ass_path)
+        _timed(result, 'burn', translator.compress_subtitle)
+        result.output_file = str(translator.output_path)
+        result.status = 'completed'
+    except Exception as e:
+        logger.error(f'burning {result.path} failed: {e}')
+        result.status, result.error = 'failed', str(e)
+    finally:
+        # drop the decoded audio as soon as the clip is done
+        translator.audio = None
+        result.metrics = translator.metrics.to_dict()
+
+
+def run_batch(inputs: List[Path], model_size: str, device: Device = Device.cpu, compute_type: str | None = None,
+              work_dir: str | Path | None = None, summary_path: str | Path | None = None,
+              **translator_options: Any) -> List[ClipResult]:
+    """Translate many clips with one shared model.
+
+    The stages overlap: while clip N is transcribing, clip N+1 is already being extracted
+    and clip N-1 is being burned, each on its own thread.
+    """
+    names = work_names(inputs)
+    results = [ClipResult(str(path), name) for path, name in zip(inputs, names)]
+    if not inputs:
+        logger.warning('no video files to process')
+        return results
+    compute_type = compute_type or ('float16' if device == Device.cuda else 'int8')
+
+    def make_translator(i: int) -> Callable[[], VideoTranslator]:
+        # built when its clip is extracted, not all up front
+        return lambda: VideoTranslator(inputs[i], model_size, device=device, compute_type=compute_type,
+                                       work_dir=work_dir, name=names[i], **translator_options)
+
+    # hold one reference for the whole batch so the model never leaves the pool in between clips
+    pool = get_model_pool()
+    pool.acquire(model_size, device.value, compute_type)
+    batch_start = time.perf_counter()
+    burns: List[Future] = []
+    try:
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='extract') as extract_pool, \
+             ThreadPoolExecutor(max_workers=1, thread_name_prefix='burn') as burn_pool:
+            next_extract = extract_pool.submit(_extract, make_translator(0), results[0])
+            for i, result in enumerate(results):
+                logger.info(f'[{i + 1}/{len(results)}] {result.path}')
+                extraction = next_extract
+                if i + 1 < len(results):
+                    next_extract = extract_pool.submit(_extract, make_translator(i + 1), results[i + 1])
+                translator = None
+                try:
+                    translator = extraction.result()
+                    # machine translation runs alongside whisper, its results are collected when burning
+                    streamed = translator.streamed_translation() if translator.machine_translator is not None else nullcontext()
+                    with streamed as translation:
+                        if not result.cached:
+                            _timed(result, 'transcribe', translator.whisper_transcription)
+                            translator.save_cached_transcription()
+                    _timed(result, 'trim', translator.remove_silent_tail)
+                except Exception as e:
+                    logger.error(f'processing {result.path} failed: {e}')
+                    result.status, result.error = 'failed', str(e)
+                    if translator is not None:
+                        result.metrics = translator.metrics.to_dict()
+                        translator.release_model()
+                    continue
+                translator.release_model()
+                burns.append(burn_pool.submit(_burn, translator, result, translation))
+            for burn in burns:
+                burn.result()
+    finally:
+        pool.release(model_size, device.value, compute_type)
+
+    if summary_path is not None:
+        summary = {
+            'model_size': model_size,
+            'device': device.value,
+            'total_seconds': round(time.perf_counter() - batch_start, 3),
+            'completed': sum(r.status == 'completed' for r in results),
+            'failed': sum(r.status == 'failed' for r in results),
+            'clips': [asdict(r) for r in results],
+        }
+        Path(summary_path).write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding='utf-8')
+        logger.info(f'batch summary written to {summary_path}')
+    return results
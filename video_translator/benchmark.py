@@ -0,0 +1,361 @@
+"""Offline CPU benchmarks for the pipeline stages, on synthetic fixtures and a stub whisper model.
+
+    python -m video_translator.benchmark --duration 600 --output bench.json
+
+Every run writes one JSON file (stage timings, throughput, peak memory, commit), so runs
+on different commits can be diffed directly.
+"""
+import argparse
+import gc
+import json
+import logging
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+import wave
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from .ass_subtitle_generator import AssGenerator, AssStyle
+from .audio_processor import detect_no_sound_period, trim_silences, STREAM_SAMPLE_RATE
+from .machine_translation import MachineTranslator, StubBackend
+from .metrics import peak_rss_mb
+from .model_pool import ModelPool
+from .single_video_translation import VideoTranslator
+from .subtitle_burner import ENCODE_PROFILES
+from .utils import TranscriptionTable, format_HMS, second_to_HMS
+
+logger = logging.getLogger(__name__)
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+# fixtures
+
+def synth_wav(path: str | Path, duration: float, speech_ratio: float = 0.6, sample_rate: int = STREAM_SAMPLE_RATE,
+              seed: int = 0) -> List[Tuple[float, float]]:
+    """Write a mono 16-bit WAV of alternating "speech" bursts and near-silent gaps.
+
+    Speech is a few harmonics under a syllable-rate envelope plus noise, the gaps are noise
+    far below the -40 dB silence threshold. Returns the speech spans in seconds.
+    """
+    rng = np.random.default_rng(seed)
+    spans = []
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        t = 0.0
+        while t < duration:
+            speech = min(float(rng.uniform(2.0, 8.0)), duration - t)
+            silence = speech * (1 - speech_ratio) / max(speech_ratio, 1e-3)
+            n = int(speech * sample_rate)
+            x = np.arange(n) / sample_rate
+            pitch = rng.uniform(100, 250)
+            voiced = sum(np.sin(2 * np.pi * pitch * k * x) / k for k in range(1, 5))
+            envelope = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(3, 6) * x)
+            samples = 0.25 * envelope * voiced + 0.02 * rng.standard_normal(n)
+            wav.writeframes(_to_pcm16(samples))
+            spans.append((t, t + speech))
+            t += speech
+            gap = min(silence, duration - t)
+            if gap > 0:
+                wav.writeframes(_to_pcm16(1e-4 * rng.standard_normal(int(gap * sample_rate))))
+                t += gap
+    return spans
+
+
+def _to_pcm16(samples: np.ndarray) -> bytes:
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+
+def synth_video(path: str | Path, audio: str | Path, duration: float, size: str = '640x360', rate: int = 25):
+    """Encode an ffmpeg test pattern with the synthetic WAV as its soundtrack."""
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate={rate}:duration={duration}',
+           '-i', str(audio), '-shortest', '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+           '-c:a', 'aac', str(path)]
+    subprocess.run(cmd, check=True)
+
+
+def synth_table(n: int, seed: int = 0) -> TranscriptionTable:
+    rng = np.random.default_rng(seed)
+    lengths = rng.uniform(1.0, 6.0, n)
+    gaps = rng.uniform(0.0, 2.0, n)
+    starts = np.cumsum(lengths + gaps) - lengths
+    texts = [f'segment {i} with a bit of text, 字幕 {i}' for i in range(n)]
+    return TranscriptionTable.from_arrays(starts, starts + lengths, texts)
+
+
+def synth_silences(n: int, duration: float, seed: int = 0) -> List[Tuple[float, float]]:
+    """n sorted, non-overlapping silent periods spread over duration seconds."""
+    rng = np.random.default_rng(seed + 1)
+    step = duration / n
+    starts = np.arange(n) * step + rng.uniform(0.0, 0.5, n) * step
+    lengths = rng.uniform(0.1, 0.45, n) * step
+    return list(zip(starts.tolist(), (starts + lengths).tolist()))
+
+
+def scan_trim(starts: np.ndarray, ends: np.ndarray, silent_periods: List[Tuple[float, float]]) -> np.ndarray:
+    """The tail trim as it was before trim_silences: every segment walks the silences from the start."""
+    new_ends = ends.tolist()
+    for i, end in enumerate(new_ends):
+        for start_silent, end_silent in silent_periods:
+            if start_silent > end:
+                break
+            if start_silent < end < end_silent:
+                new_ends[i] = start_silent
+    return np.asarray(new_ends)
+
+
+# stub whisper
+
+class StubWord(NamedTuple):
+    start: float
+    end: float
+    word: str
+
+
+class StubSegment(NamedTuple):
+    start: float
+    end: float
+    text: str
+    words: List[StubWord] | None
+
+
+class StubInfo(NamedTuple):
+    language: str
+    language_probability: float
+    duration: float
+
+
+class StubModel:
+    """Deterministic stand-in for WhisperModel: one segment every `every` seconds, no decoding."""
+
+    def __init__(self, every: float = 3.0):
+        self.every = every
+
+    def transcribe(self, audio: Any, word_timestamps: bool = False, **_options):
+        if isinstance(audio, np.ndarray):
+            duration = len(audio) / STREAM_SAMPLE_RATE
+        else:
+            with wave.open(str(audio), 'rb') as wav:
+                duration = wav.getnframes() / wav.getframerate()
+
+        def segments():
+            for i, start in enumerate(np.arange(0.0, duration, self.every)):
+                end = min(duration, start + self.every)
+                words = None
+                if word_timestamps:
+                    step = (end - start) / 6
+                    words = [StubWord(start + k * step, start + (k + 1) * step, f' w{i}_{k}') for k in range(6)]
+                yield StubSegment(float(start), float(end), f' stub segment {i}', words)
+        return segments(), StubInfo('en', 1.0, duration)
+
+
+# measuring
+
+def _child_peak_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def measure(fn: Callable[[], Any], units: float, unit: str, repeat: int = 3,
+            setup: Callable[[], Any] | None = None) -> Dict[str, Any]:
+    """Best-of-repeat wall/CPU time, then one extra traced run for the peak Python heap."""
+    walls, cpus = [], []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        gc.collect()
+        wall, cpu = time.perf_counter(), time.process_time()
+        fn()
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    if setup is not None:
+        setup()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    best = min(walls)
+    return {
+        'wall': round(best, 6),
+        'wall_median': round(float(np.median(walls)), 6),
+        'cpu': round(min(cpus), 6),
+        'throughput': round(units / best, 3) if best > 0 else None,
+        'unit': f'{unit}/s',
+        'peak_heap_mb': round(peak / (1024 * 1024), 3),
+    }
+
+
+def measure_subprocess(fn: Callable[[], Any], units: float, unit: str) -> Dict[str, Any]:
+    """Single timed run of an ffmpeg stage; child peak RSS is the high-water mark over all children so far."""
+    wall = time.perf_counter()
+    fn()
+    wall = time.perf_counter() - wall
+    return {'wall': round(wall, 6), 'throughput': round(units / wall, 3), 'unit': f'{unit}/s',
+            'peak_child_rss_mb': _child_peak_mb()}
+
+
+def _git_commit() -> str | None:
+    try:
+        result = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def compare_trim(segments: int = 10000, silences: int = 50000, repeat: int = 3, seed: int = 0) -> Dict[str, Any]:
+    """Old per-segment scan vs trim_silences on the same synthetic table and silences.
+
+    The scan is quadratic, so it runs once and without the traced heap run.
+    """
+    table = synth_table(segments, seed)
+    periods = synth_silences(silences, float(table.ends[-1]), seed)
+    start = time.perf_counter()
+    scanned = scan_trim(table.starts, table.ends, periods)
+    scan_wall = time.perf_counter() - start
+    vectorized = measure(lambda: trim_silences(table.starts, table.ends, periods), segments, 'segments', repeat)
+    _, trimmed = trim_silences(table.starts, table.ends, periods)
+    if not np.array_equal(scanned, trimmed):
+        raise AssertionError('trim_silences and the reference scan disagree')
+    return {
+        'segments': segments,
+        'silences': silences,
+        'scan': {'wall': round(scan_wall, 6), 'throughput': round(segments / scan_wall, 3), 'unit': 'segments/s'},
+        'trim_silences': vectorized,
+        'speedup': round(scan_wall / vectorized['wall'], 1) if vectorized['wall'] > 0 else None,
+    }
+
+
+def run_benchmarks(fixture_dir: str | Path, duration: float = 600.0, speech_ratio: float = 0.6,
+                   segments: int = 20000, repeat: int = 3, with_ffmpeg: bool = True, seed: int = 0,
+                   trim_segments: int = 10000, trim_silence_count: int = 50000) -> Dict[str, Any]:
+    fixture_dir = Path(fixture_dir)
+    fixture_dir.mkdir(parents=True, exist_ok=True)
+    stub_pool = ModelPool(loader=lambda key: StubModel())
+    results: Dict[str, Any] = {}
+
+    # no checkpoints: every repeat has to transcribe again instead of replaying the journal
+    translator = VideoTranslator(fixture_dir / 'bench.mp4', 'stub', compute_type='int8', work_dir=fixture_dir,
+                                 model_pool=stub_pool, resume=False)
+    wav_path = translator.wav_dir / f'{translator.vid_name}_audio.wav'
+    spans = synth_wav(wav_path, duration, speech_ratio, seed=seed)
+    logger.info(f'fixture: {duration:.0f}s wav, {len(spans)} speech bursts, {segments} synthetic segments')
+
+    table = synth_table(segments, seed)
+    times = np.concatenate([table.starts, table.ends])
+    results['second_to_HMS'] = measure(lambda: [second_to_HMS(float(t)) for t in times], len(times), 'timestamps', repeat)
+    results['format_HMS'] = measure(lambda: format_HMS(times), len(times), 'timestamps', repeat)
+
+    results['silence'] = measure(lambda: detect_no_sound_period(wav_path), duration, 'audio_seconds', repeat)
+    silent_periods = detect_no_sound_period(wav_path)
+
+    def reset_table():
+        translator.transcriptions = synth_table(segments, seed)
+        translator.silent_periods = silent_periods
+    results['trim'] = measure(translator.remove_silent_tail, segments, 'segments', repeat, setup=reset_table)
+    if trim_segments and trim_silence_count:
+        comparison = compare_trim(trim_segments, trim_silence_count, repeat, seed)
+        results['trim_scan'] = comparison['scan']
+        results['trim_searchsorted'] = comparison['trim_silences']
+        logger.info(f'trim on {trim_segments} segments x {trim_silence_count} silences: '
+                    f'{comparison["speedup"]}x faster than the old scan')
+
+    styles = [AssStyle()]
+    results['ass'] = measure(lambda: AssGenerator('bench', table, styles).save(1920, 1080, output_dir=fixture_dir / 'ass'),
+                             segments, 'segments', repeat)
+    # deduping and token batching only, the stub backend costs nothing
+    results['machine_translation'] = measure(lambda: MachineTranslator(StubBackend(), 'en').translate(table.texts),
+                                             segments, 'segments', repeat)
+
+    results['transcribe_stub'] = measure(translator.whisper_transcription, duration, 'audio_seconds', repeat)
+    translator.word_timestamps = True
+    results['transcribe_stub_words'] = measure(translator.whisper_transcription, duration, 'audio_seconds', repeat)
+    translator.release_model()
+
+    if with_ffmpeg and shutil.which('ffmpeg') is not None:
+        # a shorter clip keeps the encode stages to seconds
+        clip_seconds = min(duration, 60.0)
+        media_dir = fixture_dir / 'media'
+        media_dir.mkdir(exist_ok=True)
+        clip_wav = media_dir / 'clip.wav'
+        synth_wav(clip_wav, clip_seconds, speech_ratio, seed=seed)
+        video = media_dir / 'clip.mp4'
+        synth_video(video, clip_wav, clip_seconds)
+        clip = VideoTranslator(video, 'stub', compute_type='int8', work_dir=media_dir, model_pool=stub_pool,
+                               resume=False)
+        results['extract'] = measure_subprocess(clip.get_audio_stream, clip_seconds, 'audio_seconds')
+        clip.whisper_transcription()
+        clip.remove_silent_tail()
+        clip.generate_subtitle(styles)
+        results['burn'] = measure_subprocess(lambda: clip.compress_subtitle('burn', ENCODE_PROFILES['fast']),
+                                             clip_seconds, 'video_seconds')
+        results['softsub'] = measure_subprocess(lambda: clip.compress_subtitle('softsub'), clip_seconds, 'video_seconds')
+        clip.release_model()
+    else:
+        results['extract'] = results['burn'] = results['softsub'] = 'skipped'
+
+    return {
+        'commit': _git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'params': {'duration': duration, 'speech_ratio': speech_ratio, 'segments': segments,
+                   'repeat': repeat, 'seed': seed, 'ffmpeg': with_ffmpeg,
+                   'trim_segments': trim_segments, 'trim_silences': trim_silence_count},
+        'peak_rss_mb': peak_rss_mb(),
+        'results': results,
+    }
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--duration", type=float, default=600.0, help="Length of the synthetic audio in seconds")
+    parser.add_argument("--speech-ratio", type=float, default=0.6, help="Share of the audio that is speech")
+    parser.add_argument("--segments", type=int, default=20000, help="Rows in the synthetic transcription table")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per stage, the best one is reported")
+    parser.add_argument("--trim-segments", type=int, default=10000, help="Segments in the old-vs-new trim comparison")
+    parser.add_argument("--trim-silences", type=int, default=50000,
+                        help="Silent periods in the old-vs-new trim comparison, 0 skips it (the old scan is slow)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixtures", default="bench_fixtures", help="Where the synthetic media is generated")
+    parser.add_argument("--no-ffmpeg", action="store_true", help="Skip the extract and burn stages")
+    parser.add_argument("--output", default="bench.json", help="JSON result file")
+
+
+def run(args: argparse.Namespace):
+    report = run_benchmarks(args.fixtures, args.duration, args.speech_ratio, args.segments, args.repeat,
+                            not args.no_ffmpeg, args.seed, args.trim_segments, args.trim_silences)
+    Path(args.output).write_text(json.dumps(report, indent=2), encoding='utf-8')
+    for stage, result in report['results'].items():
+        if isinstance(result, dict):
+            logger.info(f"{stage:<22} {result['wall']:10.4f}s  {result['throughput']:>14} {result['unit']}")
+        else:
+            logger.info(f'{stage:<22} {result}')
+    logger.info(f'results written to {args.output}')
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic media.")
+    add_arguments(parser)
+    run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
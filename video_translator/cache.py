@@ -0,0 +1,127 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from .utils import TranscriptionTable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'video_translator'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def make_cache_key(file_digest: str, model_size: str, compute_type: str, options: Dict[str, Any]) -> str:
+    settings = json.dumps({'model_size': model_size, 'compute_type': compute_type, **options}, sort_keys=True)
+    return hashlib.blake2b(f'{file_digest}:{settings}'.encode(), digest_size=20).hexdigest()
+
+
+class TranscriptionCache:
+    """On-disk cache of transcriptions and silent periods, addressed by input content + model settings.
+
+    Every entry is one .npz file with the times as float arrays, the texts as a single
+    utf-8 blob and the language whisper detected. Hits bump the file mtime and the oldest files are dropped once the
+    directory grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir: str | Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._digest_index_path = self.cache_dir / 'digests.json'
+        self._lock = threading.Lock()
+
+    def file_digest(self, path: str | Path) -> str:
+        """blake2b of the file bytes; remembered per path+size+mtime so unchanged files are hashed once."""
+        path = Path(path).resolve()
+        stat = path.stat()
+        with self._lock:
+            index = self._read_digest_index()
+            known = index.get(str(path))
+            if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+                return known['digest']
+
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(str(stat.st_size).encode())
+        with open(path, 'rb') as f:
+            while block := f.read(1 << 20):
+                digest.update(block)
+        hexdigest = digest.hexdigest()
+
+        with self._lock:
+            index = self._read_digest_index()
+            index[str(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': hexdigest}
+            tmp = self._digest_index_path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(index), encoding='utf-8')
+            os.replace(tmp, self._digest_index_path)
+        return hexdigest
+
+    def _read_digest_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            return json.loads(self._digest_index_path.read_text(encoding='utf-8'))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f'{key}.npz'
+
+    def get(self, key: str) -> Tuple[TranscriptionTable, List[Tuple[float, float]], str | None] | None:
+        path = self._entry_path(key)
+        try:
+            with np.load(path) as data:
+                starts, ends = data['starts'], data['ends']
+                blob, offsets = data['text_blob'].tobytes(), data['text_offsets']
+                silences = data['silences']
+                # entries written before the language was stored don't have it
+                language = str(data['language']) if 'language' in data.files else ''
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f'dropping unreadable cache entry {path}: {e}')
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)
+
+        texts = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(starts))]
+        silent_periods = [(float(s), float(e)) for s, e in silences]
+        return TranscriptionTable.from_arrays(starts, ends, texts), silent_periods, language or None
+
+    def put(self, key: str, transcriptions: TranscriptionTable, silent_periods: List[Tuple[float, float]],
+            language: str | None = None):
+        encoded = [text.encode('utf-8') for text in transcriptions.texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        path = self._entry_path(key)
+        tmp = path.with_suffix('.tmp.npz')
+        np.savez_compressed(
+            tmp,
+            starts=transcriptions.starts,
+            ends=transcriptions.ends,
+            text_blob=np.frombuffer(b''.join(encoded), dtype=np.uint8),
+            text_offsets=offsets,
+            silences=np.array(silent_periods, dtype=np.float64).reshape(-1, 2),
+            language=np.array(language or ''),
+        )
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for path in self.cache_dir.glob('*.npz'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            logger.info(f'evicted transcription cache entry {path.name}')
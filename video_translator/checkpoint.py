@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, IO, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def file_stamp(path: str | Path) -> Dict[str, Any] | None:
+    """Cheap identity of a file: size and mtime. None when it doesn't exist."""
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return None
+    return {'path': str(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def stamp_valid(stamp: Dict[str, Any] | None) -> bool:
+    return stamp is not None and file_stamp(stamp['path']) == stamp
+
+
+class JobManifest:
+    """Per-job record of finished pipeline stages, so a rerun picks up where the last one died.
+
+    The manifest is a small JSON file rewritten atomically after every stage. It holds the
+    input fingerprint (video stamp plus the transcription settings) and, per stage, its
+    outputs; files are stored as stamps and a stage only counts while they are unchanged.
+    Transcribed segments go to a JSONL journal next to it, one line per segment, appended
+    and flushed as whisper produces them. A torn last line from a crash is ignored.
+    """
+
+    def __init__(self, path: str | Path, fingerprint: Dict[str, Any]):
+        self.path = Path(path)
+        self.journal_path = self.path.with_suffix('.segments.jsonl')
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._journal: IO[str] | None = None
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            data = None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f'ignoring unreadable manifest {self.path}: {e}')
+            data = None
+        if data is not None and data.get('version') == MANIFEST_VERSION and data.get('fingerprint') == self.fingerprint:
+            self.stages = data.get('stages', {})
+            return
+        if data is not None:
+            logger.info(f'input or settings changed since {self.path.name} was written, starting over')
+        self.stages = {}
+        self.journal_path.unlink(missing_ok=True)
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        data = {'version': MANIFEST_VERSION, 'fingerprint': self.fingerprint, 'stages': self.stages}
+        tmp.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding='utf-8')
+        os.replace(tmp, self.path)
+
+    def get(self, stage: str) -> Dict[str, Any] | None:
+        """Recorded outputs of a finished stage, None if it never finished or one of its files changed."""
+        with self._lock:
+            outputs = self.stages.get(stage)
+            if outputs is None:
+                return None
+            if not all(stamp_valid(stamp) for stamp in outputs.get('files', {}).values()):
+                logger.info(f'{stage} checkpoint is stale, its files changed')
+                return None
+            return outputs
+
+    def record(self, stage: str, files: Dict[str, str | Path] | None = None, **outputs):
+        """Mark stage finished with its outputs; files are stamped now, so record after writing them."""
+        with self._lock:
+            entry = dict(outputs)
+            if files:
+                entry['files'] = {name: file_stamp(path) for name, path in files.items()}
+            self.stages[stage] = entry
+            self._save()
+
+    def invalidate(self, *stages: str):
+        with self._lock:
+            for stage in stages:
+                self.stages.pop(stage, None)
+                if stage == 'transcribe':
+                    self.stages.pop('language', None)
+                    self._close_journal()
+                    self.journal_path.unlink(missing_ok=True)
+            self._save()
+
+    # transcription journal
+
+    def journal_segments(self) -> List[Tuple[float, float, str]]:
+        """Segments from a previous run, oldest first; stops at the first torn or corrupt line."""
+        segments = []
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.endswith('\n'):
+                        break
+                    try:
+                        start, end, text = json.loads(line)
+                    except (ValueError, TypeError):
+                        break
+                    segments.append((float(start), float(end), text))
+        except FileNotFoundError:
+            pass
+        return segments
+
+    def append_segment(self, start: float, end: float, text: str):
+        with self._lock:
+            if self._journal is None:
+                self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+                self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            self._journal.write(json.dumps([start, end, text], ensure_ascii=False) + '\n')
+            # flushed per segment so a crash loses at most the line being written
+            self._journal.flush()
+
+    def restart_journal(self, segments: List[Tuple[float, float, str]]):
+        """Rewrite the journal with only these segments (drops a torn tail before appending to it)."""
+        with self._lock:
+            self._close_journal()
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.journal_path.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                for segment in segments:
+                    f.write(json.dumps(list(segment), ensure_ascii=False) + '\n')
+            os.replace(tmp, self.journal_path)
+            # the manifest carries the fingerprint the journal belongs to, without it the journal is dropped
+            self._save()
+
+    def _close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def close(self):
+        with self._lock:
+            self._close_journal()
@@ -1,16 +1,179 @@
 import argparse
+import json
 import logging
+import sys
+from pathlib import Path
 from .single_video_translation import VideoTranslator, Device
+from .cache import TranscriptionCache, DEFAULT_CACHE_DIR
+from .batch import collect_inputs, run_batch
+from . import benchmark
+from .subtitle_burner import BURN_MODES, ENCODE_PROFILES, EncodeProfile
+from .line_segmenter import LineLimits
+from .vad import VAD_MODES, VadOptions
+from .metrics import PROFILERS, profiled
+from .jobs import DEFAULT_OUTPUT_FOLDER, HEARTBEAT_INTERVAL, MAX_ATTEMPTS, RETRY_BACKOFF, JobRunner, Worker
+from .scheduler import JobScheduler
+from .task_store import open_task_store
+from .machine_translation import BACKENDS, DEFAULT_TOKEN_BUDGET, MachineTranslator, TranslationCache, get_backend
 
-def main():
-    logging.basicConfig(level=logging.INFO)
-    parser = argparse.ArgumentParser(description="Transcribe and burn subtitles.")
-    parser.add_argument("input", help="Path to input video")
+COMMANDS = ('translate', 'batch', 'bench', 'worker')
+
+def add_common_arguments(parser):
     parser.add_argument("--model", default="large-v3", help="Model size")
     parser.add_argument("--device", default="cpu", help="Device: cpu or cuda")
-    args = parser.parse_args()
-    vt = VideoTranslator(args.input, args.model, device=Device(args.device))
-    vt.singleVideoPipeline()
+    parser.add_argument("--stream-audio", action="store_true", help="Decode audio in memory instead of writing a WAV file")
+    parser.add_argument("--workers", type=int, default=1, help="Transcribe silence-split chunks in this many cpu processes")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR), help="Where finished transcriptions are cached")
+    parser.add_argument("--no-cache", action="store_true", help="Always run ffmpeg and whisper, ignore the cache")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore checkpoints of an earlier interrupted run and start over")
+    parser.add_argument("--burn-mode", choices=BURN_MODES, default="burn",
+                        help="burn: one re-encode, segments: re-encode keyframe-split parts in parallel, softsub: mux the ASS without re-encoding")
+    parser.add_argument("--encode-profile", choices=sorted(ENCODE_PROFILES), default=None, help="x264 preset/CRF bundle for burning")
+    parser.add_argument("--preset", default=None, help="x264 preset, overrides the profile")
+    parser.add_argument("--crf", type=int, default=None, help="x264 CRF, overrides the profile")
+    parser.add_argument("--encode-threads", type=int, default=None, help="Encoder threads per ffmpeg process")
+    parser.add_argument("--word-timestamps", action="store_true", help="Regroup whisper's words into short subtitle lines")
+    parser.add_argument("--max-line-width", type=int, default=LineLimits.max_width, help="Line width limit, CJK characters count double")
+    parser.add_argument("--max-line-duration", type=float, default=LineLimits.max_duration, help="Longest time one line stays on screen")
+    parser.add_argument("--vad", choices=VAD_MODES, default=None,
+                        help="Skip long silences before decoding: energy uses our silence detector, silero uses faster-whisper's vad_filter")
+    parser.add_argument("--vad-min-silence", type=float, default=VadOptions.min_silence, help="Shortest silence (s) the vad cuts out")
+    parser.add_argument("--burn-jobs", type=int, default=None, help="Parallel ffmpeg processes in segments mode")
+    parser.add_argument("--ffmpeg-timeout", type=float, default=None, help="Kill any single ffmpeg run after this many seconds")
+    parser.add_argument("--profile", nargs="?", const="cprofile", choices=PROFILERS, default=None,
+                        help="Profile the run (cprofile or pyinstrument) and report per-stage timings")
+    parser.add_argument("--translate-to", default=None, help="Machine-translate every line into this language (the model's code, or an ISO code like zh for NLLB/M2M models)")
+    parser.add_argument("--translate-from", default=None, help="Source language code for the translator, defaults to whisper's detected language")
+    parser.add_argument("--translator", default="ctranslate2",
+                        help=f"Translation backend: {', '.join(sorted(BACKENDS))} or an installed plugin")
+    parser.add_argument("--translator-model", default=None, help="Converted CTranslate2 model directory for the ctranslate2 backend")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET, help="Source tokens per translation batch")
+    parser.add_argument("--no-translation-cache", action="store_true", help="Translate every line again instead of reusing earlier translations")
+
+def encode_profile(args):
+    if args.encode_profile is None and args.preset is None and args.crf is None and args.encode_threads is None:
+        return None
+    base = ENCODE_PROFILES[args.encode_profile] if args.encode_profile else EncodeProfile()
+    return EncodeProfile(
+        codec=base.codec,
+        preset=args.preset or base.preset,
+        crf=base.crf if args.crf is None else args.crf,
+        threads=base.threads if args.encode_threads is None else args.encode_threads,
+    )
+
+def machine_translator(args):
+    if args.translate_to is None:
+        return None
+    options = {'model': args.translator_model, 'device': args.device} if args.translator == 'ctranslate2' else {}
+    if args.translator == 'ctranslate2' and args.translator_model is None:
+        raise SystemExit('--translator-model is required for the ctranslate2 backend')
+    cache = None if args.no_translation_cache else TranslationCache(Path(args.cache_dir) / 'translations.db')
+    try:
+        backend = get_backend(args.translator, **options)
+    except ImportError as e:
+        raise SystemExit(str(e))
+    return MachineTranslator(backend, args.translate_to, source=args.translate_from, cache=cache,
+                             token_budget=args.token_budget)
+
+def translator_options(args):
+    return {
+        'stream_audio': args.stream_audio,
+        'workers': args.workers,
+        'cache': None if args.no_cache else TranscriptionCache(args.cache_dir),
+        'burn_mode': args.burn_mode,
+        'encode_profile': encode_profile(args),
+        'burn_jobs': args.burn_jobs,
+        'word_timestamps': args.word_timestamps,
+        'line_limits': LineLimits(max_width=args.max_line_width, max_duration=args.max_line_duration),
+        'vad': args.vad,
+        'vad_options': VadOptions(min_silence=args.vad_min_silence),
+        'ffmpeg_timeout': args.ffmpeg_timeout,
+        'resume': not args.no_resume,
+        'machine_translator': machine_translator(args),
+    }
+
+def log_progress(label):
+    # one log line per 10% so long ffmpeg runs show they are alive
+    last = [-1]
+    def report(fraction):
+        step = int(fraction * 10)
+        if step > last[0]:
+            last[0] = step
+            logging.getLogger(__name__).info(f"{label} {fraction:.0%}")
+    return report
+
+def run_worker(args):
+    output_dir = Path(args.output_dir)
+    store = open_task_store(args.db or output_dir / 'tasks.db')
+    runner = JobRunner(store, output_dir, cache=None if args.no_cache else TranscriptionCache(output_dir / '.cache'),
+                       worker_id=args.worker_id, profiler=args.profile, max_attempts=args.max_attempts,
+                       retry_backoff=args.retry_backoff, heartbeat_interval=args.heartbeat)
+    worker = Worker(runner, JobScheduler(workers=args.jobs), poll_interval=args.poll_interval)
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        logging.getLogger(__name__).info("stopping, waiting for running jobs")
+        worker.stop()
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    argv = sys.argv[1:] if argv is None else argv
+    # `video-translator video.mp4` keeps working as a shortcut for `translate`
+    if argv and argv[0] not in COMMANDS and argv[0] not in ('-h', '--help'):
+        argv = ['translate', *argv]
+
+    parser = argparse.ArgumentParser(description="Transcribe and burn subtitles.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    translate = subparsers.add_parser("translate", help="Process a single video")
+    translate.add_argument("input", help="Path to input video")
+    add_common_arguments(translate)
+
+    batch = subparsers.add_parser("batch", help="Process many videos with one shared model")
+    batch.add_argument("inputs", nargs="+", help="Video files, directories or glob patterns")
+    batch.add_argument("--work-dir", default=None, help="Where wav/, ass/ and out/ are created")
+    batch.add_argument("--summary", default="batch_summary.json", help="JSON file with per-clip stage timings")
+    add_common_arguments(batch)
+
+    bench = subparsers.add_parser("bench", help="Benchmark the pipeline stages on synthetic media with a stub model")
+    benchmark.add_arguments(bench)
+
+    worker = subparsers.add_parser("worker", help="Run web server jobs taken from the shared task database")
+    worker.add_argument("--output-dir", default=str(DEFAULT_OUTPUT_FOLDER), help="The web server's outputs directory")
+    worker.add_argument("--db", default=None, help="Task database, defaults to OUTPUT_DIR/tasks.db")
+    worker.add_argument("--jobs", type=int, default=2, help="Jobs this worker runs at the same time")
+    worker.add_argument("--worker-id", default=None, help="Name shown on claimed tasks, defaults to host:pid")
+    worker.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS, help="Give up on a task after this many failures")
+    worker.add_argument("--retry-backoff", type=float, default=RETRY_BACKOFF, help="Seconds before the first retry, doubled after each failure")
+    worker.add_argument("--heartbeat", type=float, default=HEARTBEAT_INTERVAL, help="Seconds between heartbeats of a running task")
+    worker.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between looks at the queue when idle")
+    worker.add_argument("--no-cache", action="store_true", help="Don't use the shared transcription cache")
+    worker.add_argument("--profile", choices=PROFILERS, default=None, help="Profile every job into OUTPUT_DIR/.profiles")
+
+    args = parser.parse_args(argv)
+    if args.command == "worker":
+        run_worker(args)
+        return
+    if args.command == "bench":
+        benchmark.run(args)
+        return
+    if args.command == "batch":
+        inputs = collect_inputs(args.inputs)
+        with profiled(args.profile, Path(args.work_dir or '.') / 'batch_profile'):
+            results = run_batch(inputs, args.model, device=Device(args.device), work_dir=args.work_dir,
+                                summary_path=args.summary, **translator_options(args))
+        sys.exit(0 if all(r.status == 'completed' for r in results) else 1)
+
+    vt = VideoTranslator(args.input, args.model, device=Device(args.device), **translator_options(args))
+    vt.on_extract_progress = log_progress("extracting audio")
+    vt.on_burn_progress = log_progress("writing video")
+    stem = Path(vt.vid_name).stem
+    with profiled(args.profile, vt.out_dir / f'profile_{stem}'):
+        vt.singleVideoPipeline()
+    if args.profile:
+        metrics_path = vt.out_dir / f'metrics_{stem}.json'
+        metrics_path.write_text(json.dumps(vt.metrics.to_dict(), indent=2), encoding='utf-8')
+        logging.getLogger(__name__).info(f'stage timings (also in {metrics_path}):\n{vt.metrics.summary()}')
 
 if __name__ == "__main__":
     main()
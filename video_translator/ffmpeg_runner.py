@@ -0,0 +1,166 @@
+import logging
+import subprocess
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import IO, Callable, Deque, Dict, List
+
+from .utils import TaskCancelled
+
+logger = logging.getLogger(__name__)
+
+
+class FFmpegError(RuntimeError):
+    def __init__(self, message: str, returncode: int | None = None, log: str = ''):
+        super().__init__(f'{message}\n{log}' if log else message)
+        self.returncode = returncode
+        self.log = log
+
+
+class FFmpegTimeout(FFmpegError):
+    pass
+
+
+@dataclass
+class FFmpegProgress:
+    out_time: float = 0.0
+    # None when the input duration is unknown
+    fraction: float | None = None
+    speed: float | None = None
+    fps: float | None = None
+    done: bool = False
+
+
+def _parse_float(value: str | None) -> float | None:
+    if not value or value == 'N/A':
+        return None
+    try:
+        return float(value.rstrip('x'))
+    except ValueError:
+        return None
+
+
+class FFmpegRunner:
+    """Runs one ffmpeg command with its output pipes drained on background threads.
+
+    `-progress` key=value blocks are parsed into FFmpegProgress callbacks; every other line
+    lands in a ring buffer of the last `log_lines` lines, which is what errors report.
+    With raw_stdout the caller reads the media from `stdout` and progress moves to stderr.
+    wait() honours a timeout and a cancel event, killing ffmpeg in both cases.
+    """
+
+    def __init__(self, cmd: List[str], duration: float | None = None,
+                 on_progress: Callable[[FFmpegProgress], None] | None = None, timeout: float | None = None,
+                 cancel_event: threading.Event | None = None, log_lines: int = 200, raw_stdout: bool = False):
+        self.duration = duration
+        self.on_progress = on_progress
+        self.timeout = timeout
+        self.cancel_event = cancel_event
+        self.raw_stdout = raw_stdout
+        progress_pipe = 'pipe:2' if raw_stdout else 'pipe:1'
+        self.cmd = [cmd[0], '-nostdin', '-hide_banner', '-nostats', '-progress', progress_pipe, *cmd[1:]]
+        self.progress = FFmpegProgress()
+        self.process: subprocess.Popen | None = None
+        self._log: Deque[str] = deque(maxlen=log_lines)
+        self._fields: Dict[str, str] = {}
+        self._threads: List[threading.Thread] = []
+        self._started = 0.0
+
+    def start(self) -> 'FFmpegRunner':
+        self.process = subprocess.Popen(self.cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+        self._started = time.monotonic()
+        pipes = [self.process.stderr] if self.raw_stdout else [self.process.stdout, self.process.stderr]
+        for pipe in pipes:
+            thread = threading.Thread(target=self._drain, args=(pipe,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    @property
+    def stdout(self) -> IO[bytes]:
+        return self.process.stdout # type:ignore
+
+    def _drain(self, pipe: IO[bytes]):
+        for raw in iter(pipe.readline, b''):
+            line = raw.decode('utf-8', errors='replace').rstrip()
+            key, sep, value = line.partition('=')
+            if sep and key and ' ' not in key:
+                self._progress_field(key, value.strip())
+            elif line:
+                self._log.append(line)
+        pipe.close()
+
+    def _progress_field(self, key: str, value: str):
+        self._fields[key] = value
+        if key != 'progress':
+            return
+        fields, self._fields = self._fields, {}
+        # out_time_ms is microseconds as well, ffmpeg kept the old name for compatibility
+        micros = _parse_float(fields.get('out_time_us') or fields.get('out_time_ms'))
+        progress = FFmpegProgress(
+            out_time=micros / 1e6 if micros is not None else self.progress.out_time,
+            speed=_parse_float(fields.get('speed')),
+            fps=_parse_float(fields.get('fps')),
+            done=value == 'end',
+        )
+        if self.duration:
+            progress.fraction = 1.0 if progress.done else min(1.0, max(0.0, progress.out_time / self.duration))
+        self.progress = progress
+        if self.on_progress is not None:
+            try:
+                self.on_progress(progress)
+            except Exception as e:
+                logger.warning(f'ffmpeg progress callback failed: {e}')
+
+    def log_tail(self, lines: int | None = None) -> str:
+        log = list(self._log)
+        return '\n'.join(log[-lines:] if lines else log)
+
+    def kill(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+
+    def wait(self) -> int:
+        process = self.process
+        if process is None:
+            raise RuntimeError('ffmpeg runner was never started')
+        while True:
+            try:
+                process.wait(timeout=0.25)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                self.kill()
+                process.wait()
+                raise TaskCancelled(' '.join(self.cmd[:4]))
+            if self.timeout is not None and time.monotonic() - self._started > self.timeout:
+                self.kill()
+                process.wait()
+                raise FFmpegTimeout(f'ffmpeg timed out after {self.timeout:.0f}s', process.returncode,
+                                    self.log_tail(20))
+        for thread in self._threads:
+            thread.join(timeout=5)
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise TaskCancelled(' '.join(self.cmd[:4]))
+        if process.returncode != 0:
+            raise FFmpegError(f'ffmpeg exited with code {process.returncode}', process.returncode, self.log_tail(20))
+        return process.returncode
+
+    def __enter__(self) -> 'FFmpegRunner':
+        return self.start() if self.process is None else self
+
+    def __exit__(self, *exc):
+        self.kill()
+
+
+def run_ffmpeg(cmd: List[str], **kwargs) -> FFmpegRunner:
+    """Start cmd, wait for it and return the finished runner; raises FFmpegError on failure."""
+    runner = FFmpegRunner(cmd, **kwargs).start()
+    try:
+        runner.wait()
+    finally:
+        runner.kill()
+    return runner
@@ -0,0 +1,342 @@
+"""
+网页任务的执行逻辑，网页服务的工作线程和独立的 worker 进程共用
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+
+from .single_video_translation import VideoTranslator, Device
+from .cache import TranscriptionCache
+from .metrics import get_metrics_registry, profiled
+from .scheduler import JobScheduler
+from .task_store import TaskStore
+from .utils import TaskCancelled
+
+logger = logging.getLogger(__name__)
+
+# 和网页服务默认的 outputs/ 相同，worker 和网页服务在同一台机器上时不用另外配置
+DEFAULT_OUTPUT_FOLDER = Path(__file__).resolve().parent.parent / 'outputs'
+TERMINAL_STATUSES = {'completed', 'failed', 'cancelled', 'waiting_translation'}
+# 运行中的任务每隔这么多秒写一次心跳，并检查有没有取消请求
+HEARTBEAT_INTERVAL = 10
+# 连续这么多个心跳周期没有更新，就认为跑任务的进程已经没了
+STALE_HEARTBEATS = 6
+MAX_ATTEMPTS = 3
+# 第 n 次失败后等 RETRY_BACKOFF * 2**(n-1) 秒再重试
+RETRY_BACKOFF = 30
+
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class JobRunner:
+    """执行从任务库领取的任务，进度、事件和心跳都写回任务库"""
+
+    def __init__(self, store: TaskStore, output_folder: str | Path, cache: TranscriptionCache | None = None,
+                 worker_id: str | None = None, profiler: str | None = None, max_attempts: int = MAX_ATTEMPTS,
+                 retry_backoff: float = RETRY_BACKOFF, heartbeat_interval: float = HEARTBEAT_INTERVAL,
+                 on_event=None):
+        self.store = store
+        self.output_folder = Path(output_folder)
+        self.cache = cache
+        self.worker_id = worker_id or default_worker_id()
+        self.profiler = profiler
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.heartbeat_interval = heartbeat_interval
+        # 写入事件后调用，网页服务用它唤醒本进程的 SSE 连接
+        self.on_event = on_event
+        # 本进程正在运行的任务的 JobMetrics，任务结束后以 dict 形式写进任务
+        self.live_metrics = {}
+        self.metrics_registry = get_metrics_registry()
+
+    def push_event(self, task_id, event_type, data):
+        """记录一条任务事件"""
+        self.store.append_event(task_id, event_type, data)
+        if self.on_event is not None:
+            self.on_event()
+
+    def task_status(self, task_id, task=None):
+        if task is None:
+            task = self.store.get(task_id)
+        metrics = self.live_metrics.get(task_id)
+        return {
+            'task_id': task_id,
+            'status': task.get('status'),
+            'progress': task.get('progress', 0),
+            'message': task.get('message', ''),
+            'queue_position': self.store.queue_position(task_id) if task.get('status') == 'queued' else None,
+            'error': task.get('error'),
+            'attempts': task.get('attempts', 0),
+            'worker': task.get('worker'),
+            'translation_file': task.get('translation_file'),
+            'subtitle_file': task.get('subtitle_file'),
+            'output_file': task.get('output_file'),
+            'metrics': metrics.to_dict() if metrics is not None else task.get('metrics')
+        }
+
+    def update_task(self, task_id, **fields):
+        """更新任务状态，同时推送一条 status 事件"""
+        if not self.store.update(task_id, **fields):
+            return
+        self.push_event(task_id, 'status', self.task_status(task_id))
+
+    def execute(self, ctx, task):
+        """执行一个已经领取的任务；失败时按退避时间放回队列，超过次数才算失败"""
+        task_id = task['task_id']
+        if task.get('attempts', 0) >= self.max_attempts:
+            # 之前跑这个任务的进程反复中途消失
+            self.update_task(task_id, status='failed', error='处理进程多次中断', progress=0)
+            return
+        if task.get('cancel_requested'):
+            self.update_task(task_id, status='cancelled', message='已取消')
+            return
+        job = self.continue_with_translation if task.get('job') == 'translation' else self.process_video
+        stop = threading.Event()
+        outcome = 'failed'
+        heartbeat = threading.Thread(target=self._heartbeat, args=(ctx, task_id, stop), daemon=True)
+        heartbeat.start()
+        try:
+            with profiled(self.profiler, self.output_folder / '.profiles' / f'{job.__name__}_{task_id}'):
+                outcome = job(ctx, task_id, task)
+        except TaskCancelled:
+            logger.info(f"Task {task_id} cancelled")
+            self.update_task(task_id, status='cancelled', message='已取消')
+            outcome = 'cancelled'
+        except Exception as e:
+            if ctx.cancelled:
+                # 取消时被杀掉的 ffmpeg 也会报错
+                logger.info(f"Task {task_id} cancelled")
+                self.update_task(task_id, status='cancelled', message='已取消')
+                outcome = 'cancelled'
+            else:
+                outcome = self._retry_or_fail(task_id, task, e)
+        finally:
+            stop.set()
+            heartbeat.join()
+            metrics = self.live_metrics.pop(task_id, None)
+            if metrics is not None:
+                self.store.update(task_id, metrics=metrics.to_dict())
+                self.metrics_registry.record(metrics, outcome)
+
+    def _retry_or_fail(self, task_id, task, error):
+        """返回这次执行的结果：failed，或者放回队列时的 retried"""
+        attempts = task.get('attempts', 0) + 1
+        if attempts >= self.max_attempts:
+            logger.error(f"Task {task_id} failed: {str(error)}", exc_info=error)
+            self.update_task(task_id, status='failed', error=str(error), attempts=attempts, progress=0)
+            return 'failed'
+        delay = self.retry_backoff * 2 ** (attempts - 1)
+        logger.warning(f"Task {task_id} failed (attempt {attempts}/{self.max_attempts}), retrying in {delay:.0f}s: {error}")
+        self.update_task(task_id, status='queued', error=str(error), attempts=attempts, progress=0,
+                         not_before=time.time() + delay, message=f'第 {attempts} 次失败，{delay:.0f} 秒后重试...')
+        return 'retried'
+
+    def _heartbeat(self, ctx, task_id, stop):
+        # 取消请求可能发到了别的进程，这里是唯一能看到它的地方
+        while not stop.wait(self.heartbeat_interval):
+            task = self.store.get(task_id)
+            if (task is None or task.get('cancel_requested')) and not ctx.cancelled:
+                logger.info(f"Task {task_id} cancel requested")
+                ctx.cancel()
+            self.store.update(task_id, heartbeat=time.time())
+
+    def transcription_hooks(self, task_id, translator):
+        """把转录过程中的每个片段和提取 / 转录 / 压制的真实进度推送给前端"""
+        last = {}
+
+        def set_progress(progress):
+            # 只在百分比变化时写库
+            if progress != last.get('progress'):
+                last['progress'] = progress
+                self.update_task(task_id, progress=progress)
+
+        def on_segment(t):
+            self.push_event(task_id, 'segment', {'start': t.start, 'end': t.end, 'text': t.text})
+
+        def on_progress(fraction):
+            # 转录阶段占 60% 到 80% 的进度条
+            set_progress(60 + int(20 * fraction))
+
+        def on_extract_progress(fraction):
+            # 提取音频阶段占 30% 到 50%
+            set_progress(30 + int(20 * fraction))
+
+        def on_burn_progress(fraction):
+            # 压制阶段占 90% 到 99%
+            set_progress(90 + int(9 * fraction))
+
+        translator.on_segment = on_segment
+        translator.on_progress = on_progress
+        translator.on_extract_progress = on_extract_progress
+        translator.on_burn_progress = on_burn_progress
+
+    def process_video(self, ctx, task_id, task):
+        """转录视频，生成字幕并压制；manual_translate 时停在等待翻译。返回任务的最终状态"""
+        update_task = self.update_task
+        video_path = task['filepath']
+        manual_translate = task.get('manual_translate', False)
+        translator = None
+        try:
+            update_task(task_id, progress=10, error=None)
+
+            # 设置输出目录
+            output_dir = (self.output_folder / Path(video_path).stem).resolve()
+            output_dir.mkdir(parents=True, exist_ok=True)
+
+            # 创建转录器实例
+            translator = VideoTranslator(
+                video_path,
+                model_size=task['model_size'],
+                device=Device(task['device']),
+                verbose=True,
+                work_dir=output_dir,
+                cache=self.cache
+            )
+            ctx.on_cancel(translator.cancel)
+            self.live_metrics[task_id] = translator.metrics
+            self.transcription_hooks(task_id, translator)
+
+            update_task(task_id, progress=20, message='初始化环境...')
+            cached = translator.load_cached_transcription()
+
+            if not cached:
+                update_task(task_id, progress=30, message='提取音频...')
+                with ctx.stage('extract'):
+                    translator.get_audio_stream()
+
+            update_task(task_id, progress=50, message='获取视频分辨率...')
+            translator.get_resolution()
+
+            if not cached:
+                update_task(task_id, progress=60, message='生成转录...')
+                with ctx.stage('transcribe'):
+                    if manual_translate:
+                        translator.whisper_transcription()
+                    else:
+                        # 边转录边写字幕文件
+                        with translator.live_subtitle():
+                            translator.whisper_transcription()
+                translator.save_cached_transcription()
+            else:
+                update_task(task_id, message='命中转录缓存...')
+
+            if manual_translate:
+                update_task(task_id, progress=80, message='等待翻译...')
+                translator.split_transcription()
+                update_task(task_id, translation_file=str(translator.translation_file), status='waiting_translation', progress=100)
+                return 'waiting_translation'
+            else:
+                if cached:
+                    update_task(task_id, progress=80, message='生成字幕...')
+                    with ctx.stage('subtitle'):
+                        translator.generate_subtitle()
+                update_task(task_id, subtitle_file=str(translator.ass_path))
+
+                update_task(task_id, progress=90, message='压制字幕到视频...')
+                with ctx.stage('burn'):
+                    translator.compress_subtitle()
+
+                update_task(task_id, output_file=str(translator.output_path), status='completed', progress=100, message='完成！')
+                return 'completed'
+        finally:
+            # 模型归还到共享池，下一个任务可以直接复用
+            if translator is not None:
+                translator.release_model()
+
+    def continue_with_translation(self, ctx, task_id, task):
+        """使用上传的翻译文件继续处理，返回任务的最终状态"""
+        update_task = self.update_task
+        update_task(task_id, progress=50, message='加载翻译...', error=None)
+
+        output_dir = (self.output_folder / Path(task['filepath']).stem).resolve()
+        output_dir.mkdir(parents=True, exist_ok=True)
+        translator = VideoTranslator(
+            task['filepath'],
+            model_size=task['model_size'],
+            device=Device(task['device']),
+            work_dir=output_dir
+        )
+        ctx.on_cancel(translator.cancel)
+        self.live_metrics[task_id] = translator.metrics
+
+        update_task(task_id, progress=60, message='应用翻译...')
+        if not translator.load_from_translation_file(Path(task['translation_path'])):
+            raise Exception('无法加载翻译文件')
+
+        update_task(task_id, progress=80, message='生成字幕...')
+        with ctx.stage('subtitle'):
+            translator.generate_subtitle()
+        update_task(task_id, subtitle_file=str(translator.ass_path))
+
+        update_task(task_id, progress=90, message='压制字幕到视频...')
+        with ctx.stage('burn'):
+            translator.compress_subtitle()
+
+        update_task(task_id, output_file=str(translator.output_path), status='completed', progress=100, message='完成！')
+        return 'completed'
+
+
+class Worker:
+    """从任务库领取任务交给本进程的 JobScheduler，同时把失联进程的任务放回队列
+
+    只在有空闲工作线程时才领取，剩下的任务留在库里给其他 worker。
+    """
+
+    def __init__(self, runner: JobRunner, scheduler: JobScheduler, poll_interval: float = 1.0,
+                 stale_after: float | None = None):
+        self.runner = runner
+        self.scheduler = scheduler
+        self.poll_interval = poll_interval
+        self.stale_after = runner.heartbeat_interval * STALE_HEARTBEATS if stale_after is None else stale_after
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def wake(self):
+        """有新任务入库时调用，省掉一次轮询等待"""
+        self._wake.set()
+
+    def start(self) -> 'Worker':
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run_forever, name='task-claimer', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, wait: bool = True):
+        self._stopping.set()
+        self._wake.set()
+        if wait and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.scheduler.shutdown(wait=wait)
+
+    def run_forever(self):
+        store = self.runner.store
+        logger.info(f"Worker {self.runner.worker_id} polling for tasks")
+        next_stale_check = 0.0
+        while not self._stopping.is_set():
+            try:
+                if time.monotonic() >= next_stale_check:
+                    next_stale_check = time.monotonic() + self.runner.heartbeat_interval
+                    for task_id in store.requeue_stale(self.stale_after):
+                        logger.warning(f"Task {task_id} lost its worker, requeued")
+                        self.runner.update_task(task_id, message='处理进程失联，重新排队...')
+                while self.scheduler.active() < self.scheduler.workers:
+                    task = store.claim(self.runner.worker_id)
+                    if task is None:
+                        break
+                    logger.info(f"Claimed task {task['task_id']}")
+                    self.scheduler.submit(task['task_id'], self.runner.execute, task,
+                                          priority=task.get('priority', 0))
+            except Exception as e:
+                # 库暂时不可用（比如网络盘抖动）时不退出，下一轮再试
+                logger.error(f"Worker poll failed: {e}", exc_info=True)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
@@ -0,0 +1,104 @@
+import unicodedata
+from dataclasses import dataclass
+from typing import Iterable, List, NamedTuple, Tuple
+
+SENTENCE_ENDS = ('.', '?', '!', '。', '？', '！', '…')
+
+
+class Word(NamedTuple):
+    start: float
+    end: float
+    text: str
+
+
+@dataclass
+class LineLimits:
+    # width counts CJK / fullwidth characters as 2, everything else as 1
+    max_width: int = 42
+    max_duration: float = 7.0
+    # a pause between two words longer than this always starts a new line
+    max_gap: float = 0.8
+    # a detected silent period at least this long between two words does too
+    min_silence: float = 0.3
+
+
+def char_width(ch: str) -> int:
+    return 2 if unicodedata.east_asian_width(ch) in ('W', 'F') else 1
+
+
+def text_width(text: str) -> int:
+    if text.isascii():
+        return len(text)
+    return sum(char_width(ch) for ch in text)
+
+
+class LineSegmenter:
+    """Greedy one-pass regrouping of timed words into subtitle lines.
+
+    Words are fed in time order, possibly one whisper segment at a time, and finished lines
+    come back as soon as they are closed. Silent periods are walked with a single cursor,
+    so the whole pass is linear in words + silences.
+    """
+
+    def __init__(self, limits: LineLimits | None = None, silent_periods: List[Tuple[float, float]] | None = None):
+        self.limits = limits or LineLimits()
+        self.silent_periods = silent_periods or []
+        self._silence = 0
+        self._words: List[Word] = []
+        self._width = 0
+
+    def _silence_between(self, left: float, right: float) -> bool:
+        periods = self.silent_periods
+        while self._silence < len(periods) and periods[self._silence][1] <= left:
+            self._silence += 1
+        i = self._silence
+        # several short silences can sit in one gap, the cursor only ever moves forward
+        while i < len(periods) and periods[i][0] < right:
+            if min(periods[i][1], right) - max(periods[i][0], left) >= self.limits.min_silence:
+                return True
+            i += 1
+        return False
+
+    def _breaks_before(self, word: Word, width: int) -> bool:
+        prev = self._words[-1]
+        limits = self.limits
+        if prev.text.rstrip().endswith(SENTENCE_ENDS):
+            return True
+        if self._width + width > limits.max_width:
+            return True
+        if word.end - self._words[0].start > limits.max_duration:
+            return True
+        if word.start - prev.end > limits.max_gap:
+            return True
+        return bool(self.silent_periods) and self._silence_between(prev.end, word.start)
+
+    def _close(self) -> Tuple[float, float, str]:
+        words = self._words
+        line = (words[0].start, words[-1].end, ''.join(w.text for w in words).strip())
+        self._words = []
+        self._width = 0
+        return line
+
+    def feed(self, words: Iterable[Word]) -> List[Tuple[float, float, str]]:
+        lines = []
+        for word in words:
+            if not word.text.strip():
+                continue
+            width = text_width(word.text)
+            if self._words and self._breaks_before(word, width):
+                lines.append(self._close())
+            if not self._words:
+                # leading spaces vanish once the line is stripped
+                width = text_width(word.text.lstrip())
+            self._words.append(word)
+            self._width += width
+        return lines
+
+    def finish(self) -> List[Tuple[float, float, str]]:
+        return [self._close()] if self._words else []
+
+
+def resegment(words: Iterable[Word], limits: LineLimits | None = None,
+              silent_periods: List[Tuple[float, float]] | None = None) -> List[Tuple[float, float, str]]:
+    segmenter = LineSegmenter(limits, silent_periods)
+    return segmenter.feed(words) + segmenter.finish()
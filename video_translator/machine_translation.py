@@ -0,0 +1,394 @@
+import abc
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Type
+
+from .cache import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 2048
+DEFAULT_CACHE_ENTRIES = 200_000
+# third-party backends register themselves under this entry point group
+ENTRY_POINT_GROUP = 'video_translator.translators'
+# whisper's ISO 639-1 codes in NLLB's FLORES-200 form, for models that only know the latter
+NLLB_LANGUAGES = {
+    'af': 'afr_Latn', 'am': 'amh_Ethi', 'ar': 'arb_Arab', 'as': 'asm_Beng', 'az': 'azj_Latn', 'ba': 'bak_Cyrl',
+    'be': 'bel_Cyrl', 'bg': 'bul_Cyrl', 'bn': 'ben_Beng', 'bo': 'bod_Tibt', 'bs': 'bos_Latn', 'ca': 'cat_Latn',
+    'cs': 'ces_Latn', 'cy': 'cym_Latn', 'da': 'dan_Latn', 'de': 'deu_Latn', 'el': 'ell_Grek', 'en': 'eng_Latn',
+    'es': 'spa_Latn', 'et': 'est_Latn', 'eu': 'eus_Latn', 'fa': 'pes_Arab', 'fi': 'fin_Latn', 'fo': 'fao_Latn',
+    'fr': 'fra_Latn', 'gl': 'glg_Latn', 'gu': 'guj_Gujr', 'ha': 'hau_Latn', 'he': 'heb_Hebr', 'hi': 'hin_Deva',
+    'hr': 'hrv_Latn', 'ht': 'hat_Latn', 'hu': 'hun_Latn', 'hy': 'hye_Armn', 'id': 'ind_Latn', 'is': 'isl_Latn',
+    'it': 'ita_Latn', 'ja': 'jpn_Jpan', 'jw': 'jav_Latn', 'ka': 'kat_Geor', 'kk': 'kaz_Cyrl', 'km': 'khm_Khmr',
+    'kn': 'kan_Knda', 'ko': 'kor_Hang', 'lb': 'ltz_Latn', 'ln': 'lin_Latn', 'lo': 'lao_Laoo', 'lt': 'lit_Latn',
+    'lv': 'lvs_Latn', 'mg': 'plt_Latn', 'mi': 'mri_Latn', 'mk': 'mkd_Cyrl', 'ml': 'mal_Mlym', 'mn': 'khk_Cyrl',
+    'mr': 'mar_Deva', 'ms': 'zsm_Latn', 'mt': 'mlt_Latn', 'my': 'mya_Mymr', 'ne': 'npi_Deva', 'nl': 'nld_Latn',
+    'nn': 'nno_Latn', 'no': 'nob_Latn', 'oc': 'oci_Latn', 'pa': 'pan_Guru', 'pl': 'pol_Latn', 'ps': 'pbt_Arab',
+    'pt': 'por_Latn', 'ro': 'ron_Latn', 'ru': 'rus_Cyrl', 'sa': 'san_Deva', 'sd': 'snd_Arab', 'si': 'sin_Sinh',
+    'sk': 'slk_Latn', 'sl': 'slv_Latn', 'sn': 'sna_Latn', 'so': 'som_Latn', 'sq': 'als_Latn', 'sr': 'srp_Cyrl',
+    'su': 'sun_Latn', 'sv': 'swe_Latn', 'sw': 'swh_Latn', 'ta': 'tam_Taml', 'te': 'tel_Telu', 'tg': 'tgk_Cyrl',
+    'th': 'tha_Thai', 'tk': 'tuk_Latn', 'tl': 'tgl_Latn', 'tr': 'tur_Latn', 'tt': 'tat_Cyrl', 'uk': 'ukr_Cyrl',
+    'ur': 'urd_Arab', 'uz': 'uzn_Latn', 'vi': 'vie_Latn', 'yi': 'ydd_Hebr', 'yo': 'yor_Latn', 'yue': 'yue_Hant',
+    'zh': 'zho_Hans',
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough subword count for backends without a tokenizer: words plus one per CJK character."""
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return max(1, len(text.split()) + cjk)
+
+
+class TranslationBackend(abc.ABC):
+    """A machine translation model. Subclasses implement translate_batch, the rest is optional.
+
+    `identity` names the model for the cache: two backends with the same identity must give
+    the same output for the same input.
+    """
+
+    name = 'base'
+
+    @property
+    def identity(self) -> str:
+        return self.name
+
+    def count_tokens(self, text: str) -> int:
+        return estimate_tokens(text)
+
+    @abc.abstractmethod
+    def translate_batch(self, texts: List[str], source: str | None, target: str) -> List[str]:
+        ...
+
+
+BACKENDS: Dict[str, Type[TranslationBackend]] = {}
+
+
+def register_backend(cls: Type[TranslationBackend]) -> Type[TranslationBackend]:
+    BACKENDS[cls.name] = cls
+    return cls
+
+
+def get_backend(name: str, **options: Any) -> TranslationBackend:
+    """Instantiate a backend by name, looking at installed plugins if it isn't built in."""
+    if name not in BACKENDS:
+        from importlib.metadata import entry_points
+        for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+            if entry_point.name == name:
+                register_backend(entry_point.load())
+    if name not in BACKENDS:
+        raise ValueError(f'unknown translation backend {name!r}, choose from {", ".join(sorted(BACKENDS))}')
+    return BACKENDS[name](**options)
+
+
+@register_backend
+class StubBackend(TranslationBackend):
+    """Offline stand-in that tags each line with the target language; for tests and benchmarks."""
+
+    name = 'stub'
+
+    def __init__(self, delay: float = 0.0):
+        # seconds per batch, to make the pipeline overlap visible
+        self.delay = delay
+        self.calls = 0
+
+    def translate_batch(self, texts, source, target):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return [f'[{target}] {text.strip()}' for text in texts]
+
+
+@register_backend
+class CTranslate2Backend(TranslationBackend):
+    """Local CTranslate2 model (an OPUS-MT, M2M or NLLB conversion) with its Hugging Face tokenizer.
+
+    Multilingual models need the language codes they were trained with: NLLB wants e.g.
+    source='zho_Hans', target='eng_Latn', M2M wants '__zh__'/'__en__' style prefixes. Plain
+    ISO codes such as whisper's detected language are converted to those when the tokenizer
+    knows them. Set target_prefix=False for single-pair models such as OPUS-MT.
+    """
+
+    name = 'ctranslate2'
+
+    def __init__(self, model: str | Path, device: str = 'cpu', compute_type: str = 'default',
+                 beam_size: int = 4, target_prefix: bool = True, inter_threads: int = 1):
+        import ctranslate2
+        try:
+            from transformers import AutoTokenizer
+        except ImportError as e:
+            raise ImportError('the ctranslate2 translator needs the Hugging Face tokenizers, '
+                              "install them with: pip install 'video_translator[translate]'") from e
+        self.model = str(model)
+        self.beam_size = beam_size
+        self.target_prefix = target_prefix
+        self.translator = ctranslate2.Translator(self.model, device=device, compute_type=compute_type,
+                                                 inter_threads=inter_threads)
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model)
+        vocab = self.tokenizer.get_vocab()
+        self.language_style = 'nllb' if 'eng_Latn' in vocab else 'm2m' if '__en__' in vocab else None
+
+    @property
+    def identity(self) -> str:
+        return f'{self.name}:{Path(self.model).name}:beam{self.beam_size}'
+
+    def count_tokens(self, text):
+        return len(self.tokenizer.tokenize(text)) + 2
+
+    def language_token(self, code: str) -> str:
+        """The model's token for a language, accepting plain ISO codes like whisper's 'en'."""
+        if self.language_style == 'nllb':
+            if code in NLLB_LANGUAGES:
+                return NLLB_LANGUAGES[code]
+            if '_' not in code:
+                raise ValueError(f'no NLLB code known for language {code!r}, pass it in the form eng_Latn')
+        elif self.language_style == 'm2m' and not code.startswith('__'):
+            return f'__{code}__'
+        return code
+
+    def translate_batch(self, texts, source, target):
+        target = self.language_token(target)
+        if source is not None and hasattr(self.tokenizer, 'src_lang'):
+            # M2M's tokenizer takes the bare code as src_lang, NLLB's takes its token
+            source = self.language_token(source)
+            self.tokenizer.src_lang = source.strip('_') if self.language_style == 'm2m' else source
+        tokens = [self.tokenizer.convert_ids_to_tokens(self.tokenizer.encode(text)) for text in texts]
+        prefix = [[target]] * len(texts) if self.target_prefix else None
+        results = self.translator.translate_batch(tokens, target_prefix=prefix, beam_size=self.beam_size)
+        outputs = []
+        for result in results:
+            hypothesis = result.hypotheses[0]
+            if self.target_prefix and hypothesis[:1] == [target]:
+                hypothesis = hypothesis[1:]
+            outputs.append(self.tokenizer.decode(self.tokenizer.convert_tokens_to_ids(hypothesis),
+                                                 skip_special_tokens=True))
+        return outputs
+
+
+class TranslationCache:
+    """On-disk LRU of finished translations keyed by (model, language pair, source text).
+
+    One SQLite table; hits refresh the row's last-used time and inserts drop the least
+    recently used rows beyond max_entries. Shared by every job and process on the machine,
+    so a phrase that recurs across episodes is translated once.
+    """
+
+    def __init__(self, path: str | Path = DEFAULT_CACHE_DIR / 'translations.db', max_entries: int = DEFAULT_CACHE_ENTRIES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS translations '
+                           '(key BLOB PRIMARY KEY, translation TEXT NOT NULL, used REAL NOT NULL) WITHOUT ROWID')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS translations_used ON translations (used)')
+
+    @staticmethod
+    def key(identity: str, source: str | None, target: str, text: str) -> bytes:
+        return hashlib.blake2b(f'{identity}\0{source or ""}\0{target}\0{text}'.encode(), digest_size=16).digest()
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, str]:
+        found: Dict[bytes, str] = {}
+        now = time.time()
+        with self._lock:
+            # sqlite caps the number of bound parameters, 500 stays well below every default
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ', '.join('?' * len(chunk))
+                found.update(self._conn.execute(
+                    f'SELECT key, translation FROM translations WHERE key IN ({marks})', chunk).fetchall())
+            if found:
+                self._conn.executemany('UPDATE translations SET used = ? WHERE key = ?', ((now, k) for k in found))
+        return found
+
+    def put_many(self, items: Dict[bytes, str]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany('INSERT OR REPLACE INTO translations (key, translation, used) VALUES (?, ?, ?)',
+                                       ((k, v, now) for k, v in items.items()))
+                excess = self._conn.execute('SELECT count(*) FROM translations').fetchone()[0] - self.max_entries
+                if excess > 0:
+                    self._conn.execute('DELETE FROM translations WHERE key IN '
+                                       '(SELECT key FROM translations ORDER BY used LIMIT ?)', (excess,))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+
+
+def batch_by_tokens(texts: List[str], budget: int, count: Callable[[str], int]) -> Iterator[List[int]]:
+    """Indices of texts grouped so each group's token count stays within budget (an oversized text goes alone)."""
+    batch: List[int] = []
+    used = 0
+    for i, text in enumerate(texts):
+        tokens = count(text)
+        if batch and used + tokens > budget:
+            yield batch
+            batch, used = [], 0
+        batch.append(i)
+        used += tokens
+    if batch:
+        yield batch
+
+
+class MachineTranslator:
+    """Translates subtitle lines with a backend: dedupes, asks the cache, batches the rest by tokens."""
+
+    def __init__(self, backend: TranslationBackend, target: str, source: str | None = None,
+                 cache: TranslationCache | None = None, token_budget: int = DEFAULT_TOKEN_BUDGET):
+        self.backend = backend
+        self.target = target
+        self.source = source
+        self.cache = cache
+        self.token_budget = token_budget
+        self.stats = {'lines': 0, 'cached': 0, 'translated': 0, 'batches': 0}
+
+    @property
+    def identity(self) -> str:
+        return f'{self.backend.identity}:{self.source or "auto"}>{self.target}'
+
+    def translate(self, texts: List[str], source: str | None = None) -> List[str]:
+        source = source or self.source
+        stripped = [text.strip() for text in texts]
+        unique = list(dict.fromkeys(t for t in stripped if t))
+        done: Dict[str, str] = {}
+        keys = {}
+        if self.cache is not None and unique:
+            keys = {text: self.cache.key(self.backend.identity, source, self.target, text) for text in unique}
+            hits = self.cache.get_many(list(keys.values()))
+            done = {text: hits[key] for text, key in keys.items() if key in hits}
+        missing = [text for text in unique if text not in done]
+
+        fresh: Dict[str, str] = {}
+        for batch in batch_by_tokens(missing, self.token_budget, self.backend.count_tokens):
+            sources = [missing[i] for i in batch]
+            results = self.backend.translate_batch(sources, source, self.target)
+            if len(results) != len(sources):
+                raise RuntimeError(f'{self.backend.name} returned {len(results)} translations for {len(sources)} lines')
+            fresh.update(zip(sources, results))
+            self.stats['batches'] += 1
+        if self.cache is not None and fresh:
+            self.cache.put_many({keys[text]: translation for text, translation in fresh.items()})
+        done.update(fresh)
+
+        self.stats['lines'] += len(texts)
+        self.stats['cached'] += len(unique) - len(missing)
+        self.stats['translated'] += len(missing)
+        return [done.get(text, '') for text in stripped]
+
+
+class TranslationStream:
+    """Runs a MachineTranslator on a background thread over lines fed one at a time.
+
+    Lines queue up while transcription is still producing them; whenever the translator is
+    free it takes everything queued (up to one token budget) as the next batch. results()
+    yields translations in feed order, blocking only on the batch still in flight, so the
+    subtitle writer works through finished batches while later ones are translated.
+    """
+
+    def __init__(self, translator: MachineTranslator, source: str | None = None):
+        self.translator = translator
+        self.source = source
+        self._cond = threading.Condition()
+        self._pending: List[str] = []
+        self._results: List[str] = []
+        self.fed = 0
+        self._closed = False
+        self._error: BaseException | None = None
+        # wall and thread CPU time spent translating, for the job metrics
+        self.busy_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name='machine-translation', daemon=True)
+        self._thread.start()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def feed(self, text: str):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('translation stream is closed')
+            self._pending.append(text)
+            self.fed += 1
+            self._cond.notify_all()
+
+    def feed_many(self, texts: Iterable[str]):
+        texts = list(texts)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('translation stream is closed')
+            self._pending.extend(texts)
+            self.fed += len(texts)
+            self._cond.notify_all()
+
+    def close(self):
+        """No more lines; results() ends after the last one."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def cancel(self):
+        """Drop the lines not yet translated and stop after the batch in flight."""
+        with self._cond:
+            self._pending.clear()
+            self._closed = True
+            self._error = self._error or RuntimeError('translation cancelled')
+            self._cond.notify_all()
+
+    def _take_batch(self) -> List[str] | None:
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if not self._pending:
+                return None
+            count = self.translator.backend.count_tokens
+            taken, used = 0, 0
+            for text in self._pending:
+                tokens = count(text)
+                if taken and used + tokens > self.translator.token_budget:
+                    break
+                taken += 1
+                used += tokens
+            batch, self._pending = self._pending[:taken], self._pending[taken:]
+            return batch
+
+    def _run(self):
+        try:
+            while (batch := self._take_batch()) is not None:
+                start, cpu = time.perf_counter(), time.thread_time()
+                translations = self.translator.translate(batch, self.source)
+                self.busy_seconds += time.perf_counter() - start
+                self.cpu_seconds += time.thread_time() - cpu
+                with self._cond:
+                    self._results.extend(translations)
+                    self._cond.notify_all()
+        except BaseException as e:
+            logger.error(f'machine translation failed: {e}', exc_info=True)
+            with self._cond:
+                self._error = e
+                self._cond.notify_all()
+
+    def results(self) -> Iterator[str]:
+        i = 0
+        while True:
+            with self._cond:
+                # every fed line gets exactly one result, so closed and caught up means done
+                while i >= len(self._results) and self._error is None and not (self._closed and i >= self.fed):
+                    self._cond.wait()
+                if self._error is not None:
+                    raise RuntimeError(f'machine translation failed: {self._error}') from self._error
+                if i >= len(self._results):
+                    return
+                ready = self._results[i:]
+            for translation in ready:
+                yield translation
+            i += len(ready)
@@ -0,0 +1,95 @@
+import json
+import logging
+import subprocess
+import threading
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MediaInfo:
+    width: int | None = None
+    height: int | None = None
+    duration: float | None = None
+    fps: float | None = None
+    sample_rate: int | None = None
+    channels: int | None = None
+    channel_layout: str | None = None
+
+    @property
+    def has_audio(self) -> bool:
+        return self.sample_rate is not None
+
+    @classmethod
+    def from_ffprobe(cls, data: Dict[str, Any]) -> 'MediaInfo':
+        info = cls()
+        duration = data.get('format', {}).get('duration')
+        info.duration = float(duration) if duration not in (None, 'N/A') else None
+        for stream in data.get('streams', []):
+            if stream.get('codec_type') == 'video' and info.width is None:
+                info.width = stream.get('width')
+                info.height = stream.get('height')
+                info.fps = _parse_rate(stream.get('avg_frame_rate')) or _parse_rate(stream.get('r_frame_rate'))
+            elif stream.get('codec_type') == 'audio' and info.sample_rate is None:
+                info.sample_rate = int(stream['sample_rate']) if stream.get('sample_rate') else None
+                info.channels = stream.get('channels')
+                info.channel_layout = stream.get('channel_layout')
+        return info
+
+
+def _parse_rate(rate: str | None) -> float | None:
+    if not rate or rate == '0/0':
+        return None
+    num, _, den = rate.partition('/')
+    return float(num) / float(den or 1)
+
+
+# (resolved path, size, mtime_ns) -> MediaInfo, so every stage of every job probes a file once
+_probe_cache: Dict[Tuple[str, int, int], MediaInfo] = {}
+_probe_lock = threading.Lock()
+
+
+def probe_media(path: str | Path, record_dir: str | Path | None = None) -> MediaInfo:
+    """Run ffprobe once per input file version; record_dir keeps the result across processes."""
+    path = Path(path).resolve()
+    stat = path.stat()
+    key = (str(path), stat.st_size, stat.st_mtime_ns)
+    with _probe_lock:
+        if key in _probe_cache:
+            return _probe_cache[key]
+
+    record = Path(record_dir) / f'{path.name}.probe.json' if record_dir is not None else None
+    info = _read_record(record, key) if record is not None else None
+    if info is None:
+        cmd = [
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'format=duration:stream=codec_type,width,height,avg_frame_rate,r_frame_rate,'
+                             'sample_rate,channels,channel_layout',
+            '-of', 'json', str(path),
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f'ffprobe failed on {path}: {result.stderr.strip()}')
+        info = MediaInfo.from_ffprobe(json.loads(result.stdout))
+        if record is not None:
+            try:
+                record.write_text(json.dumps({'key': list(key), 'info': asdict(info)}), encoding='utf-8')
+            except OSError as e:
+                logger.warning(f'could not write probe record {record}: {e}')
+
+    with _probe_lock:
+        _probe_cache[key] = info
+    return info
+
+
+def _read_record(record: Path, key: Tuple[str, int, int]) -> MediaInfo | None:
+    try:
+        data = json.loads(record.read_text(encoding='utf-8'))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if tuple(data.get('key', ())) != key:
+        return None
+    return MediaInfo(**data['info'])
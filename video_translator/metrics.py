@@ -0,0 +1,203 @@
+import cProfile
+import functools
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+
+def cpu_seconds() -> float:
+    """CPU time of this process plus the children it has waited for (ffmpeg runs as one)."""
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    # ru_maxrss is KiB on linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+@dataclass
+class StageTiming:
+    wall: float = 0.0
+    cpu: float = 0.0
+    runs: int = 0
+    peak_rss_mb: float | None = None
+
+
+@dataclass
+class JobMetrics:
+    """Per-job stage timings. Stages may nest and repeat; repeated runs add up.
+
+    CPU time is process-wide, so on the web server it includes whatever other jobs were
+    doing at the same time.
+    """
+    stages: Dict[str, StageTiming] = field(default_factory=dict)
+    audio_duration: float | None = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        wall, cpu = time.perf_counter(), cpu_seconds()
+        try:
+            yield
+        finally:
+            timing = self.stages.setdefault(name, StageTiming())
+            timing.wall += time.perf_counter() - wall
+            timing.cpu += cpu_seconds() - cpu
+            timing.runs += 1
+            timing.peak_rss_mb = peak_rss_mb()
+
+    def add(self, name: str, wall: float, cpu: float, runs: int = 1):
+        """Account time measured elsewhere, e.g. by a background thread, as a stage."""
+        timing = self.stages.setdefault(name, StageTiming())
+        timing.wall += wall
+        timing.cpu += cpu
+        timing.runs += runs
+        timing.peak_rss_mb = peak_rss_mb()
+
+    @property
+    def real_time_factor(self) -> float | None:
+        """Transcription wall time per second of audio; below 1 is faster than real time."""
+        transcribe = self.stages.get('transcribe')
+        if transcribe is None or not self.audio_duration:
+            return None
+        return transcribe.wall / self.audio_duration
+
+    def to_dict(self) -> dict:
+        return {
+            # list() snapshots the dict, the web server reads it while the job thread adds stages
+            'stages': {name: {k: round(v, 3) if isinstance(v, float) else v for k, v in asdict(t).items()}
+                       for name, t in list(self.stages.items())},
+            'audio_duration': self.audio_duration,
+            'real_time_factor': None if self.real_time_factor is None else round(self.real_time_factor, 4),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+    def summary(self) -> str:
+        lines = [f'{name:<12} wall {t.wall:8.2f}s  cpu {t.cpu:8.2f}s  x{t.runs}' for name, t in self.stages.items()]
+        if self.real_time_factor is not None:
+            lines.append(f'real-time factor {self.real_time_factor:.3f} on {self.audio_duration:.1f}s of audio')
+        return '\n'.join(lines)
+
+
+def timed_stage(name: str):
+    """Method decorator: time the call under self.metrics.stage(name)."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.stage(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def profiled(kind: str | None, output: str | Path) -> Iterator[None]:
+    """Profile the block with cProfile (output.prof) or pyinstrument (output.html); None does nothing.
+
+    Both profilers only see the calling thread.
+    """
+    if kind is None:
+        yield
+        return
+    if kind not in PROFILERS:
+        raise ValueError(f'unknown profiler {kind!r}, choose from {", ".join(PROFILERS)}')
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if kind == 'pyinstrument':
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            path = output.with_suffix('.html')
+            path.write_text(profiler.output_html(), encoding='utf-8')
+            logger.info(f'profile written to {path}')
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        path = output.with_suffix('.prof')
+        profiler.dump_stats(path)
+        logger.info(f'profile written to {path}')
+
+
+class MetricsRegistry:
+    """Process-wide totals over finished jobs, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stage_wall: Dict[str, float] = {}
+        self._stage_cpu: Dict[str, float] = {}
+        self._stage_runs: Dict[str, int] = {}
+        self._jobs: Dict[str, int] = {}
+        self._audio_seconds = 0.0
+        self._last_rtf: float | None = None
+
+    def record(self, metrics: JobMetrics, outcome: str):
+        """Add one job run; outcome is how the run ended: completed, waiting_translation, retried, failed or cancelled."""
+        with self._lock:
+            self._jobs[outcome] = self._jobs.get(outcome, 0) + 1
+            for name, timing in metrics.stages.items():
+                self._stage_wall[name] = self._stage_wall.get(name, 0.0) + timing.wall
+                self._stage_cpu[name] = self._stage_cpu.get(name, 0.0) + timing.cpu
+                self._stage_runs[name] = self._stage_runs.get(name, 0) + timing.runs
+            if metrics.audio_duration and 'transcribe' in metrics.stages:
+                self._audio_seconds += metrics.audio_duration
+                self._last_rtf = metrics.real_time_factor
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            lines: List[str] = []
+
+            def metric(name: str, kind: str, help_text: str, samples: Dict[str, float], label: str | None = None):
+                lines.append(f'# HELP video_translator_{name} {help_text}')
+                lines.append(f'# TYPE video_translator_{name} {kind}')
+                for key, value in sorted(samples.items()):
+                    labels = f'{{{label}="{key}"}}' if label else ''
+                    lines.append(f'video_translator_{name}{labels} {value}')
+
+            metric('stage_seconds_total', 'counter', 'Wall time spent per pipeline stage.', self._stage_wall, 'stage')
+            metric('stage_cpu_seconds_total', 'counter', 'Process CPU time spent per pipeline stage.', self._stage_cpu, 'stage')
+            metric('stage_runs_total', 'counter', 'Completed runs per pipeline stage.', self._stage_runs, 'stage')
+            metric('jobs_total', 'counter', 'Job runs by how they ended.', self._jobs, 'status')
+            metric('transcribed_audio_seconds_total', 'counter', 'Seconds of audio transcribed.',
+                   {'': self._audio_seconds})
+            if self._last_rtf is not None:
+                metric('last_real_time_factor', 'gauge', 'Transcription wall time per audio second of the last job.',
+                       {'': self._last_rtf})
+            rss = peak_rss_mb()
+            if rss is not None:
+                metric('peak_rss_bytes', 'gauge', 'Peak resident set size of this process.', {'': int(rss * 1024 * 1024)})
+            return '\n'.join(lines) + '\n'
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    return _registry
@@ -0,0 +1,169 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# rough resident size of a loaded float16 model in MB, int8 is about half of it
+MODEL_SIZE_MB = {
+    'tiny': 75,
+    'tiny.en': 75,
+    'base': 145,
+    'base.en': 145,
+    'small': 484,
+    'small.en': 484,
+    'medium': 1530,
+    'medium.en': 1530,
+    'distil-large-v2': 1510,
+    'distil-large-v3': 1510,
+    'large-v3-turbo': 1620,
+    'turbo': 1620,
+    'large': 3090,
+    'large-v1': 3090,
+    'large-v2': 3090,
+    'large-v3': 3090,
+}
+COMPUTE_TYPE_FACTOR = {
+    'int8': 0.5,
+    'int8_float16': 0.5,
+    'int8_bfloat16': 0.5,
+    'int8_float32': 0.5,
+    'float16': 1.0,
+    'bfloat16': 1.0,
+    'float32': 2.0,
+}
+DEFAULT_BUDGET_MB = 8192
+
+
+class ModelKey(NamedTuple):
+    model_size: str
+    device: str
+    compute_type: str
+
+
+def estimate_model_mb(key: ModelKey) -> int:
+    base = MODEL_SIZE_MB.get(key.model_size, 1500)
+    return int(base * COMPUTE_TYPE_FACTOR.get(key.compute_type, 1.0))
+
+
+def _load_whisper(key: ModelKey) -> Any:
+    from faster_whisper import WhisperModel
+    return WhisperModel(key.model_size, device=key.device, compute_type=key.compute_type)
+
+
+@dataclass
+class _PoolEntry:
+    key: ModelKey
+    size_mb: int
+    model: Any = None
+    refs: int = 0
+    error: BaseException | None = None
+    ready: threading.Event = field(default_factory=threading.Event)
+
+
+class ModelPool:
+    """Process-wide registry of loaded whisper models, shared by key with refcounts.
+
+    Models nobody holds stay cached until the memory budget is exceeded, then the
+    least recently used idle ones are dropped.
+    """
+
+    def __init__(self, memory_budget_mb: int | None = None, loader: Callable[[ModelKey], Any] | None = None):
+        if memory_budget_mb is None:
+            memory_budget_mb = int(os.environ.get('VIDEO_TRANSLATOR_MODEL_BUDGET_MB', DEFAULT_BUDGET_MB))
+        self.memory_budget_mb = memory_budget_mb
+        self.loader = loader or _load_whisper
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[ModelKey, _PoolEntry]' = OrderedDict()
+
+    def acquire(self, model_size: str, device: str, compute_type: str) -> Any:
+        key = ModelKey(model_size, device, compute_type)
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if entry is None:
+                entry = _PoolEntry(key, estimate_model_mb(key))
+                self._entries[key] = entry
+            entry.refs += 1
+            self._entries.move_to_end(key)
+
+        if owner:
+            try:
+                logger.info(f'loading whisper model {key}...')
+                entry.model = self.loader(key)
+            except BaseException as e:
+                with self._lock:
+                    entry.error = e
+                    entry.refs -= 1
+                    self._entries.pop(key, None)
+                entry.ready.set()
+                raise
+            with self._lock:
+                self._evict_idle()
+            entry.ready.set()
+        else:
+            entry.ready.wait()
+            if entry.error is not None:
+                with self._lock:
+                    entry.refs -= 1
+                raise RuntimeError(f'loading {key} failed: {entry.error}')
+        return entry.model
+
+    def release(self, model_size: str, device: str, compute_type: str):
+        key = ModelKey(model_size, device, compute_type)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.refs == 0:
+                logger.warning(f'release of {key} without matching acquire')
+                return
+            entry.refs -= 1
+            self._evict_idle()
+
+    def clear(self):
+        """Drop every model that is not currently held."""
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.refs == 0 and e.ready.is_set()]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'budget_mb': self.memory_budget_mb,
+                'used_mb': self._used_mb(),
+                'models': [
+                    {'model_size': e.key.model_size, 'device': e.key.device,
+                     'compute_type': e.key.compute_type, 'refs': e.refs,
+                     'size_mb': e.size_mb, 'loaded': e.ready.is_set()}
+                    for e in self._entries.values()
+                ],
+            }
+
+    def _used_mb(self) -> int:
+        return sum(e.size_mb for e in self._entries.values())
+
+    def _evict_idle(self):
+        # caller holds self._lock; entries are kept in LRU order
+        for key in list(self._entries):
+            if self._used_mb() <= self.memory_budget_mb:
+                return
+            entry = self._entries[key]
+            if entry.refs == 0 and entry.ready.is_set():
+                logger.info(f'evicting idle whisper model {key}')
+                del self._entries[key]
+        if self._used_mb() > self.memory_budget_mb:
+            logger.warning(f'models in use take {self._used_mb()}MB, over the {self.memory_budget_mb}MB budget')
+
+
+_default_pool: ModelPool | None = None
+_default_pool_lock = threading.Lock()
+
+
+def get_model_pool() -> ModelPool:
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ModelPool()
+        return _default_pool
@@ -0,0 +1,140 @@
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+from .audio_processor import STREAM_SAMPLE_RATE
+from .utils import TaskCancelled
+
+logger = logging.getLogger(__name__)
+
+Segment = Tuple[float, float, str]
+
+# set once per worker process by _init_worker
+_worker_model = None
+
+
+def plan_chunks(duration: float, silent_periods: List[Tuple[float, float]], target_seconds: float = 300.0,
+                min_seconds: float = 60.0) -> List[Tuple[float, float]]:
+    """Split [0, duration) into chunks of about target_seconds, cutting in the middle of silences."""
+    if duration <= target_seconds + min_seconds:
+        return [(0.0, duration)]
+    cuts = [float(s + e) / 2 for s, e in silent_periods]
+    chunks = []
+    start = 0.0
+    i = 0
+    while duration - start > target_seconds + min_seconds:
+        target = start + target_seconds
+        while i < len(cuts) and cuts[i] < start + min_seconds:
+            i += 1
+        # walk the candidates up to twice the target and keep the one nearest to it
+        best = None
+        j = i
+        while j < len(cuts) and cuts[j] <= start + 2 * target_seconds and cuts[j] < duration - min_seconds:
+            if best is None or abs(cuts[j] - target) < abs(best - target):
+                best = cuts[j]
+            elif cuts[j] > target:
+                break
+            j += 1
+        if best is None:
+            logger.warning(f'no silence near {target:.1f}s, cutting mid-speech')
+            best = target
+        chunks.append((start, best))
+        start = best
+    chunks.append((start, duration))
+    return chunks
+
+
+def _init_worker(model_size: str, compute_type: str, cpu_threads: int, pids: Any = None):
+    global _worker_model
+    # reported before the slow model load, so a cancel can kill a worker that is still loading
+    if pids is not None:
+        pids.put(os.getpid())
+    from faster_whisper import WhisperModel
+    _worker_model = WhisperModel(model_size, device='cpu', compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def _transcribe_chunk(audio: np.ndarray, offset: float, options: Dict[str, Any]) -> List[Segment]:
+    segments, _ = _worker_model.transcribe(audio, **options) # type:ignore
+    return [(segment.start + offset, segment.end + offset, segment.text) for segment in segments]
+
+
+def merge_chunk_segments(chunks: List[Tuple[float, float]], results: List[List[Segment]]) -> List[Segment]:
+    """Stitch per-chunk results back together in chunk order.
+
+    A chunk owns the segments that start inside it. A segment the next chunk sees starting just
+    before the cut is only taken if the previous chunk lost it, i.e. it lies mostly past what is
+    already merged; repeated text overlapping the previous line is dropped as well.
+    """
+    merged: List[Segment] = []
+    for (cut_start, cut_end), segments in zip(chunks, results):
+        for start, end, text in sorted(segments, key=lambda s: s[0]):
+            if start >= cut_end:
+                continue
+            if start < cut_start and merged and (start + end) / 2 <= merged[-1][1]:
+                continue
+            if merged and merged[-1][2].strip() == text.strip() and start < merged[-1][1]:
+                continue
+            merged.append((start, end, text))
+    return merged
+
+
+def _kill_workers(pids: Any):
+    """Terminate every worker that reported its pid; the executor then breaks and stops the rest."""
+    while not pids.empty():
+        try:
+            os.kill(pids.get(), signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def transcribe_parallel(audio: np.ndarray, silent_periods: List[Tuple[float, float]], model_size: str,
+                        workers: int, compute_type: str = 'int8', cpu_threads: int | None = None,
+                        chunk_seconds: float = 300.0, overlap: float = 1.0,
+                        sample_rate: int = STREAM_SAMPLE_RATE, cancel_event: threading.Event | None = None,
+                        on_progress: Callable[[float], None] | None = None, **transcribe_options) -> List[Segment]:
+    duration = len(audio) / sample_rate
+    chunks = plan_chunks(duration, silent_periods, chunk_seconds)
+    # a short file has fewer chunks than workers, the cores are shared among the processes that actually run
+    workers = min(workers, len(chunks))
+    cpu_threads = cpu_threads or max(1, (os.cpu_count() or 1) // workers)
+    options = {'beam_size': 5, **transcribe_options}
+    logger.info(f'transcribing {duration:.1f}s in {len(chunks)} chunks on {workers} workers x {cpu_threads} threads')
+
+    context = multiprocessing.get_context()
+    pids = context.SimpleQueue()
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                               initargs=(model_size, compute_type, cpu_threads, pids))
+    try:
+        futures = []
+        for start, end in chunks:
+            # a little padding on both sides gives the model context, merge drops what leaks in
+            padded_start = max(0.0, start - overlap)
+            padded_end = min(duration, end + overlap)
+            piece = audio[int(padded_start * sample_rate):int(padded_end * sample_rate)]
+            futures.append(pool.submit(_transcribe_chunk, piece, padded_start, options))
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=1.0, return_when=FIRST_EXCEPTION)
+            for future in done:
+                # a failed chunk fails the whole file now, not after the others have run
+                if future.exception() is not None:
+                    raise future.exception() # type:ignore
+            if on_progress is not None:
+                on_progress(1 - len(pending) / len(futures))
+            if cancel_event is not None and cancel_event.is_set():
+                raise TaskCancelled('parallel transcription')
+        results = [future.result() for future in futures]
+    except BaseException:
+        # a running chunk can take minutes: drop the queued ones and kill the workers instead
+        # of waiting for them, which would also hold the transcribe slot
+        pool.shutdown(wait=False, cancel_futures=True)
+        _kill_workers(pids)
+        raise
+    pool.shutdown()
+    return merge_chunk_segments(chunks, results)
@@ -35,6 +35,13 @@ def main():
         '--debug',
         action='store_true',
     )
+
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help='同时处理的任务数'
+    )
     
     args = parser.parse_args()
     
@@ -51,7 +58,7 @@ url: http://{args.host}:{args.port}
     """)
     
     try:
-        run_server(host=args.host, port=args.port, debug=args.debug)
+        run_server(host=args.host, port=args.port, debug=args.debug, workers=args.workers)
     except KeyboardInterrupt:
         print("\n\nserver closed")
         sys.exit(0)
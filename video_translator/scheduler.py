@@ -0,0 +1,171 @@
+import heapq
+import itertools
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Tuple
+
+from .utils import TaskCancelled
+
+logger = logging.getLogger(__name__)
+
+# how many jobs may be inside each stage at the same time, stages not listed are unlimited
+DEFAULT_STAGE_LIMITS = {
+    'extract': 4,
+    'transcribe': 1,
+    'subtitle': 4,
+    'burn': 2,
+}
+
+
+class JobContext:
+    """Handed to every job function; gates stages and carries the cancellation flag."""
+
+    def __init__(self, scheduler: 'JobScheduler', task_id: str):
+        self.scheduler = scheduler
+        self.task_id = task_id
+        self.cancel_event = threading.Event()
+        self._cancel_hooks: List[Callable[[], Any]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            raise TaskCancelled(self.task_id)
+
+    def on_cancel(self, hook: Callable[[], Any]):
+        self._cancel_hooks.append(hook)
+        if self.cancelled:
+            hook()
+
+    def cancel(self):
+        self.cancel_event.set()
+        for hook in self._cancel_hooks:
+            try:
+                hook()
+            except Exception as e:
+                logger.warning(f'cancel hook of {self.task_id} failed: {e}')
+
+    @contextmanager
+    def stage(self, name: str):
+        self.check()
+        semaphore = self.scheduler.stage_semaphore(name)
+        if semaphore is None:
+            yield
+        else:
+            # poll so a job waiting for a busy stage can still be cancelled
+            while not semaphore.acquire(timeout=0.5):
+                self.check()
+            try:
+                self.check()
+                yield
+            finally:
+                semaphore.release()
+        self.check()
+
+
+class JobScheduler:
+    """Fixed pool of worker threads fed from a priority queue, FIFO within one priority.
+
+    Lower priority values run first. Worker threads are started on the first submit, so
+    `workers` and `stage_limits` can still be changed before that.
+    """
+
+    def __init__(self, workers: int = 2, stage_limits: Dict[str, int] | None = None):
+        self.workers = workers
+        self.stage_limits = dict(DEFAULT_STAGE_LIMITS if stage_limits is None else stage_limits)
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[int, int, str]] = []
+        self._jobs: Dict[str, Tuple[Callable, tuple]] = {}
+        self._running: Dict[str, JobContext] = {}
+        self._semaphores: Dict[str, threading.Semaphore] = {}
+        self._seq = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._stopping = False
+
+    def stage_semaphore(self, name: str) -> threading.Semaphore | None:
+        with self._cond:
+            if name not in self.stage_limits:
+                return None
+            if name not in self._semaphores:
+                self._semaphores[name] = threading.Semaphore(self.stage_limits[name])
+            return self._semaphores[name]
+
+    def start(self):
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, task_id: str, fn: Callable[..., Any], *args, priority: int = 0):
+        """Queue fn(ctx, *args); ctx is the job's JobContext."""
+        self.start()
+        with self._cond:
+            self._jobs[task_id] = (fn, args)
+            heapq.heappush(self._queue, (priority, next(self._seq), task_id))
+            self._cond.notify()
+
+    def queue_position(self, task_id: str) -> int | None:
+        """1-based position among waiting jobs, None once the job left the queue."""
+        with self._cond:
+            for position, (_, _, queued_id) in enumerate(sorted(self._queue), start=1):
+                if queued_id == task_id:
+                    return position
+        return None
+
+    def active(self) -> int:
+        """Jobs waiting in the queue or running right now."""
+        with self._cond:
+            return len(self._queue) + len(self._running)
+
+    def is_running(self, task_id: str) -> bool:
+        with self._cond:
+            return task_id in self._running
+
+    def cancel(self, task_id: str) -> bool:
+        with self._cond:
+            for i, (_, _, queued_id) in enumerate(self._queue):
+                if queued_id == task_id:
+                    self._queue.pop(i)
+                    heapq.heapify(self._queue)
+                    self._jobs.pop(task_id, None)
+                    return True
+            ctx = self._running.get(task_id)
+        if ctx is None:
+            return False
+        ctx.cancel()
+        return True
+
+    def shutdown(self, wait: bool = True):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                _, _, task_id = heapq.heappop(self._queue)
+                fn, args = self._jobs.pop(task_id)
+                ctx = JobContext(self, task_id)
+                self._running[task_id] = ctx
+            try:
+                fn(ctx, *args)
+            except Exception as e:
+                logger.error(f'job {task_id} crashed: {e}', exc_info=True)
+            finally:
+                with self._cond:
+                    self._running.pop(task_id, None)
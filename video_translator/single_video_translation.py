@@ -1,15 +1,32 @@
-from faster_whisper import WhisperModel
 from enum import Enum
 from pathlib import Path
-from typing import Tuple, List
-from .utils import Transcription, second_to_HMS
+from typing import Callable, Tuple, List
+from .utils import Transcription, TranscriptionTable, TaskCancelled
 import subprocess
-import json
+import threading
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import asdict
 import os
 import logging
 import numpy as np
-from .ass_subtitle_generator import AssGenerator, AssStyle, repair_ass_file
-from .audio_processor import detect_no_sound_period
+from .ass_subtitle_generator import AssGenerator, AssStyle, AssWriter
+from .metrics import JobMetrics, timed_stage
+from .ffmpeg_runner import FFmpegError, FFmpegProgress, FFmpegRunner
+from .vad import VAD_MODES, VadOptions, TimeMap, gate_audio
+from .line_segmenter import LineLimits, LineSegmenter, Word
+from .audio_processor import detect_no_sound_period, stream_pcm, SilenceDetector, STREAM_SAMPLE_RATE, STREAM_FRAME_SIZE, TrimPolicy, trim_silences
+from .model_pool import ModelPool, get_model_pool
+from .parallel_transcription import transcribe_parallel
+from .cache import TranscriptionCache, make_cache_key
+from .media_probe import MediaInfo, probe_media
+from .checkpoint import JobManifest, file_stamp
+from .translation_file import write_translation_file, load_translated_table, read_entries, apply_translations, with_translation
+from .machine_translation import MachineTranslator, TranslationStream
+from .subtitle_burner import (EncodeProfile, BURN_MODES, resolve_profile, burn_command, softsub_command,
+                              softsub_output, split_command, read_segment_list, concat_command)
 
 class Device(Enum):
     cuda = 'cuda'
@@ -18,7 +35,13 @@ class Device(Enum):
 
 
 class VideoTranslator:
-    def __init__(self, vid_path : str|Path , model_size : str, device : Device = Device.cpu, compute_type : str|None = None, verbose : bool = False, work_dir: str | Path | None = None):
+    def __init__(self, vid_path : str|Path , model_size : str, device : Device = Device.cpu, compute_type : str|None = None, verbose : bool = False, work_dir: str | Path | None = None,
+                 model_pool: ModelPool | None = None, stream_audio: bool = False, trim_policy: TrimPolicy | None = None,
+                 workers: int = 1, cache: TranscriptionCache | None = None,
+                 burn_mode: str = 'burn', encode_profile: EncodeProfile | str | None = None, burn_jobs: int | None = None,
+                 word_timestamps: bool = False, line_limits: LineLimits | None = None,
+                 vad: str | None = None, vad_options: VadOptions | None = None, ffmpeg_timeout: float | None = None,
+                 resume: bool = True, machine_translator: MachineTranslator | None = None, name: str | None = None):
         self.env_ready : bool = False
         self.logger = logging.getLogger(__name__)
         self.model_size : str = model_size
@@ -27,18 +50,98 @@ class VideoTranslator:
         self.vid_width : int = 1920
         self.vid_height : int = 1080
         self.vid_path = vid_path if type(vid_path) == Path else Path(vid_path)
-        self.vid_name = str(self.vid_path).split('/')[-1]
+        # wav/, ass/, out/ and checkpoints/ files are named after this; callers sharing a work_dir
+        # between inputs with the same file name pass a unique one
+        self.vid_name = name or str(self.vid_path).split('/')[-1]
+        # stream_audio keeps the decoded 16kHz audio in memory instead of writing wav/
+        self.stream_audio : bool = stream_audio
+        self.audio : np.ndarray | None = None
+        self.silent_periods : List[Tuple[float, float]] | None = None
+        self.transcriptions : TranscriptionTable = TranscriptionTable()
+        # False while the transcriptions are partial, e.g. whisper failed halfway; only complete ones are cached
+        self.transcription_complete : bool = False
+        self.trim_policy = trim_policy or TrimPolicy()
+        # workers > 1 splits the audio at silences and transcribes the chunks in separate processes
+        self.workers : int = workers
+        self.cache = cache
+        # word_timestamps regroups whisper's words into lines bounded by line_limits and the silences
+        self.word_timestamps : bool = word_timestamps
+        self.line_limits = line_limits or LineLimits()
+        # vad skips long silences before decoding: 'energy' cuts them out with our own detector,
+        # 'silero' hands the job to faster-whisper's vad_filter
+        if vad is not None and vad not in VAD_MODES:
+            raise ValueError(f'unknown vad mode {vad!r}, choose from {", ".join(VAD_MODES)}')
+        self.vad : str | None = vad
+        self.vad_options = vad_options or VadOptions()
+        if burn_mode not in BURN_MODES:
+            raise ValueError(f'unknown burn mode {burn_mode!r}, choose from {", ".join(BURN_MODES)}')
+        self.burn_mode : str = burn_mode
+        # None keeps ffmpeg's own encoder defaults
+        self.encode_profile : EncodeProfile | None = resolve_profile(encode_profile)
+        self.burn_jobs : int = burn_jobs or max(1, min(4, (os.cpu_count() or 1) // 2))
+        self.cache_key : str | None = None
+        # optional hooks for live consumers: each finished segment, and transcription progress in [0, 1]
+        self.on_segment : Callable[[Transcription], None] | None = None
+        self.on_progress : Callable[[float], None] | None = None
+        self.on_extract_progress : Callable[[float], None] | None = None
+        self.on_burn_progress : Callable[[float], None] | None = None
+        # seconds any single ffmpeg run may take before it is killed, None waits forever
+        self.ffmpeg_timeout : float | None = ffmpeg_timeout
+        self.media_info : MediaInfo | None = None
+        # resume keeps a manifest of finished stages under base_dir/checkpoints, so a rerun
+        # skips them and a crashed transcription continues after its last journaled segment
+        self.resume : bool = resume
+        self._manifest : JobManifest | None = None
+        # machine_translator puts a translation on top of every line without the manual file round trip
+        self.machine_translator = machine_translator
+        self.detected_language : str | None = None
+        self.metrics = JobMetrics()
+        self.cancel_event = threading.Event()
+        self._processes : set[subprocess.Popen] = set()
         self.env_setup(Path(work_dir) if work_dir is not None else None)
         if compute_type is not None:
             self.compute_type = compute_type
         else:
             self.compute_type = 'float16' if self.device == 'cuda' else 'int8'
             self.logger.warning(f'compute not specified, using {self.compute_type} as default')
-        try:
+        # the model is borrowed from a shared pool on first transcription, see `model`
+        self.model_pool = model_pool or get_model_pool()
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
             self.logger.info("loading whisper model...")
-            self.model = WhisperModel(self.model_size, device = self.device, compute_type = self.compute_type)
-        except Exception as e:
-            self.logger.error(f"Error: {e}")
+            self._model = self.model_pool.acquire(self.model_size, self.device, self.compute_type)
+        return self._model
+
+    def release_model(self):
+        if self._model is not None:
+            self._model = None
+            self.model_pool.release(self.model_size, self.device, self.compute_type)
+
+    def cancel(self):
+        # stop at the next segment / chunk and kill whatever ffmpeg is running right now
+        self.cancel_event.set()
+        for process in list(self._processes):
+            if process.poll() is None:
+                process.kill()
+
+    @property
+    def manifest(self) -> JobManifest | None:
+        if not self.resume:
+            return None
+        if self._manifest is None:
+            # a different input file or different transcription settings start a fresh manifest
+            fingerprint = {'video': file_stamp(self.vid_path), 'model_size': self.model_size,
+                           'compute_type': self.compute_type, **self._transcription_settings()}
+            self._manifest = JobManifest(self.base_dir / 'checkpoints' / f'{Path(self.vid_name).stem}.json',
+                                         fingerprint)
+        return self._manifest
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise TaskCancelled(self.vid_name)
 
     def env_setup(self, dir : Path | None = None):
         self.base_dir = (dir or Path(os.getcwd())).resolve()
@@ -50,123 +153,319 @@ class VideoTranslator:
         for folder in [self.wav_dir, self.ass_dir, self.out_dir]:
             folder.mkdir(parents=True, exist_ok=True)
 
+    def probe(self) -> MediaInfo:
+        # one ffprobe per input file, extraction, burning and progress all read from it
+        if self.media_info is None:
+            saved = self.manifest.get('probe') if self.manifest is not None else None
+            if saved is not None:
+                self.media_info = MediaInfo(**saved['info'])
+            else:
+                with self.metrics.stage('probe'):
+                    self.media_info = probe_media(self.vid_path, record_dir=self.wav_dir)
+                if self.manifest is not None:
+                    self.manifest.record('probe', info=asdict(self.media_info))
+            self.metrics.audio_duration = self.media_info.duration
+            if self.media_info.width and self.media_info.height:
+                self.vid_width = self.media_info.width
+                self.vid_height = self.media_info.height
+        return self.media_info
+
+    def _try_probe(self) -> MediaInfo | None:
+        try:
+            return self.probe()
+        except (OSError, RuntimeError, ValueError) as e:
+            self.logger.warning(f'could not probe {self.vid_path}: {e}')
+            return None
+
+    @timed_stage('extract')
     def get_audio_stream(self):
+        info = self._try_probe()
+        if info is not None and not info.has_audio:
+            raise ValueError(f'{self.vid_name} has no audio stream')
+        if self.stream_audio:
+            self._stream_audio_to_memory()
+            return
+        wav_path = self.wav_dir / f'{self.vid_name}_audio.wav'
+        if self.manifest is not None and self.manifest.get('audio') is not None:
+            self.logger.info(f'reusing audio extracted by an earlier run: {wav_path}')
+            return
         # ffmpeg -i movie.mp4 -vn -acodec pcm_s16le -ar 44100 -ac 1 movie_audio.wav
         input = self.vid_path
+        # no point upsampling low-rate sources, the silence detector works on any rate
+        sample_rate = min(44100, info.sample_rate) if info is not None and info.sample_rate else 44100
         try:
-            process = subprocess.Popen(['ffmpeg', '-y', '-i', input, '-vn', '-acodec', 'pcm_s16le', 
-                                        '-ar', '44100', '-ac', '1', f'{self.base_dir}/wav/{self.vid_name}_audio.wav'], stdout=subprocess.PIPE, text=True)
-            while True:
-                output = process.stdout.readline() # type:ignore
-                if output == '' and process.poll() is not None:
-                    break
-                if output:
-                    self.logger.info(output.strip())
-            ret = process.poll()
-            if ret != 0:
-                self.logger.error(f'shit happened when getting audio, error code {ret}')
+            self._run_ffmpeg(['ffmpeg', '-y', '-i', str(input), '-vn', '-acodec', 'pcm_s16le',
+                              '-ar', str(sample_rate), '-ac', '1', str(wav_path)],
+                             on_progress=self.on_extract_progress)
+            if self.manifest is not None:
+                self.manifest.record('audio', files={'wav': wav_path})
+        except FFmpegError as e:
+            self.logger.error(f'shit happened when getting audio, error code {e.returncode}\n{e.log}')
+        except TaskCancelled:
+            raise
         except FileNotFoundError as e:
             self.logger.error(f"FFmpeg not found: {e}")
         except Exception as e:
             self.logger.error(f"Unexpected error: {e}")
 
+    def _stream_audio_to_memory(self):
+        # one decode feeds both whisper and the silence detector, nothing touches the disk
+        detector = SilenceDetector(STREAM_SAMPLE_RATE, frame_size=STREAM_FRAME_SIZE)
+        duration = self.media_info.duration if self.media_info is not None else None
+        # with a known duration the whole buffer is allocated once instead of concatenating chunks
+        audio = np.empty(int(duration * STREAM_SAMPLE_RATE) + STREAM_SAMPLE_RATE if duration else 0, dtype=np.float32)
+        filled = 0
+        for chunk in stream_pcm(self.vid_path):
+            # leaving the loop closes the generator, which kills ffmpeg
+            self.check_cancelled()
+            samples = chunk.astype(np.float32) / 32768.0
+            detector.feed(samples)
+            if filled + len(samples) > len(audio):
+                audio = np.concatenate([audio[:filled], np.empty(max(len(samples), filled), dtype=np.float32)])
+            audio[filled:filled + len(samples)] = samples
+            filled += len(samples)
+            if self.on_extract_progress is not None and duration:
+                self.on_extract_progress(min(1.0, filled / (duration * STREAM_SAMPLE_RATE)))
+        self.audio = audio[:filled]
+        self.metrics.audio_duration = self.metrics.audio_duration or filled / STREAM_SAMPLE_RATE
+        self.silent_periods = detector.result()
+        if self.manifest is not None:
+            self.manifest.record('silence', periods=self.silent_periods)
+        self.logger.info(f'decoded {filled / STREAM_SAMPLE_RATE:.1f}s of audio in memory')
+
     def get_resolution(self):
-        # TODO: find a way to get resolution when extracting audio and get rid of this
-        cmd = [
-            "ffprobe", "-v", "error",
-            "-select_streams", "v:0",
-            "-show_entries", "stream=width,height",
-            "-of", "json",
-            self.vid_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        info = json.loads(result.stdout)
-        if len(info["streams"]) != 0:
-            stream = info["streams"][0]
-            self.vid_width = stream["width"]
-            self.vid_height = stream["height"]
-
-    def whisper_transcription(self) -> List[Transcription]:
+        self.probe()
+
+    @timed_stage('transcribe')
+    def whisper_transcription(self) -> TranscriptionTable:
+        manifest = self.manifest
+        journaled = manifest.journal_segments() if manifest is not None else []
+        done = manifest.get('transcribe') if manifest is not None else None
+        if done is not None and done['segments'] == len(journaled):
+            # finished in an earlier run, replay the journal instead of decoding again
+            self.logger.info(f'transcription of {self.vid_name} restored from checkpoint, {len(journaled)} segments')
+            self.detected_language = done.get('language')
+            self.transcriptions = TranscriptionTable()
+            self.transcription_complete = True
+            for start, end, text in journaled:
+                self.transcriptions.append(start, end, text)
+                if self.on_segment is not None:
+                    self.on_segment(self.transcriptions[-1])
+            return self.transcriptions
+        if self.workers > 1:
+            if self.device == 'cpu':
+                if self.word_timestamps:
+                    self.logger.warning('word timestamps are not used by parallel transcription, keeping whisper segments')
+                return self._parallel_transcription()
+            self.logger.warning('parallel transcription only runs on cpu, falling back to a single model')
         input_wav = f'{self.wav_dir}/{self.vid_name}_audio.wav'
-        transcriptions: list[Transcription] = []
+        audio = self.audio if self.audio is not None else input_wav
+        transcriptions = TranscriptionTable()
+        segmenter = LineSegmenter(self.line_limits, self.get_silent_periods()) if self.word_timestamps else None
+        options = {'beam_size': 5, 'word_timestamps': self.word_timestamps}
+
+        def add(start: float, end: float, text: str):
+            transcriptions.append(start, end, text)
+            if manifest is not None:
+                manifest.append_segment(start, end, text)
+            if self.on_segment is not None:
+                self.on_segment(transcriptions[-1])
+
+        # a crashed run left segments behind: keep them and decode only what comes after the last one
+        offset = 0.0
+        if manifest is not None:
+            manifest.restart_journal(journaled)
+        if journaled:
+            # the tail alone could be detected as another language, keep the one the first run found
+            saved = manifest.get('language')
+            if saved is not None:
+                self.detected_language = options['language'] = saved['language']
+            for start, end, text in journaled:
+                transcriptions.append(start, end, text)
+            offset = journaled[-1][1]
+            audio = self._decoded_audio()[int(offset * STREAM_SAMPLE_RATE):]
+            self.logger.info(f'resuming transcription of {self.vid_name} at {offset:.1f}s after {len(journaled)} segments')
+
+        time_map = None
+        if self.vad == 'silero':
+            options.update(vad_filter=True, vad_parameters=self.vad_options.silero_parameters())
+        elif self.vad == 'energy':
+            audio, time_map = self._gate_audio(audio, offset)
+
+        def original(t: float, end: bool = False) -> float:
+            return offset + (t if time_map is None else time_map.to_original(t, end))
+
+        finished = False
         try:
-            segments, info = self.model.transcribe(input_wav, beam_size = 5)
+            segments, info = self.model.transcribe(audio, **options)
             self.logger.info("Detected language '%s' with probability %f" % (info.language, info.language_probability))
+            self.detected_language = info.language
+            if manifest is not None:
+                manifest.record('language', language=info.language)
+            if self.on_segment is not None:
+                # replayed only now, so a streamed translation already knows the source language
+                for transcription in transcriptions:
+                    self.on_segment(transcription)
             for segment in segments:
+                self.check_cancelled()
                 self.logger.info("processing... now at '%s'" % (segment.text))
-                transcriptions.append(
-                    Transcription(start=second_to_HMS(segment.start), start_calc=segment.start,
-                                end = second_to_HMS(segment.end), end_calc=segment.end,
-                                text = segment.text)
-                    )
+                if segmenter is not None and segment.words:
+                    words = (Word(original(w.start), original(w.end, True), w.word) for w in segment.words)
+                    for line in segmenter.feed(words):
+                        add(*line)
+                else:
+                    add(original(segment.start), original(segment.end, True), segment.text)
+                if self.on_progress is not None and info.duration:
+                    self.on_progress(min(1.0, (offset + segment.end) / (offset + info.duration)))
+            finished = True
+        except TaskCancelled:
+            raise
         except Exception as e:
-            print(f'Error: {e}')
+            # a partial result must not be burned or recorded as done: the journal keeps the
+            # decoded segments and a rerun resumes after them
+            self.logger.error(f'transcription of {self.vid_name} failed after {len(transcriptions)} segments: {e}')
+            raise
+        finally:
+            if manifest is not None and not finished:
+                manifest.close()
+        if segmenter is not None:
+            for line in segmenter.finish():
+                add(*line)
+        if manifest is not None:
+            manifest.close()
+            if finished:
+                manifest.record('transcribe', files={'journal': manifest.journal_path}, segments=len(transcriptions),
+                                language=self.detected_language)
         self.transcriptions = transcriptions
+        self.transcription_complete = finished
         return transcriptions
     
-    def remove_silent_tail(self):
-        silent_periods = detect_no_sound_period(f'{self.wav_dir}/{self.vid_name}_audio.wav')
-        for transcription in self.transcriptions:
-            for start_silent, end_silent in silent_periods:
-                if start_silent > transcription.end_calc:
-                    break
-                if start_silent < transcription.end_calc < end_silent:
-                    transcription.end_calc = start_silent
-                    transcription.end = second_to_HMS(transcription.end_calc)
+    def _decoded_audio(self) -> np.ndarray:
+        if self.audio is not None:
+            return self.audio
+        from faster_whisper.audio import decode_audio
+        return decode_audio(f'{self.wav_dir}/{self.vid_name}_audio.wav', sampling_rate=STREAM_SAMPLE_RATE)
+
+    def _gate_audio(self, audio: np.ndarray | str, offset: float = 0.0) -> Tuple[np.ndarray, TimeMap]:
+        # offset is where audio starts in the file, the silences are shifted to match
+        if not isinstance(audio, np.ndarray):
+            audio = self._decoded_audio()
+        silent_periods = [(max(0.0, start - offset), end - offset) for start, end in self.get_silent_periods() if end > offset]
+        gated, time_map = gate_audio(audio, silent_periods, STREAM_SAMPLE_RATE, self.vad_options)
+        self.logger.info(f'vad kept {len(gated) / STREAM_SAMPLE_RATE:.1f}s of {len(audio) / STREAM_SAMPLE_RATE:.1f}s of audio')
+        return gated, time_map
+
+    def _parallel_transcription(self) -> TranscriptionTable:
+        audio = self._decoded_audio()
+        options = {}
+        if self.vad == 'silero':
+            options = {'vad_filter': True, 'vad_parameters': self.vad_options.silero_parameters()}
+        elif self.vad == 'energy':
+            # the chunks are already cut at silences, only whisper's own vad can go further per chunk
+            self.logger.warning('energy vad is not used by parallel transcription, use vad=silero instead')
+        # workers always run int8 on cpu, whatever compute_type the shared model uses
+        segments = transcribe_parallel(audio, self.get_silent_periods(), self.model_size, self.workers,
+                                       cancel_event=self.cancel_event, on_progress=self.on_progress, **options)
+        self.transcriptions = TranscriptionTable.from_segments(segments)
+        self.transcription_complete = True
+        if self.manifest is not None:
+            # the chunks only come back all at once, so there is nothing partial to journal
+            self.manifest.restart_journal([(t.start_calc, t.end_calc, t.text) for t in self.transcriptions])
+            self.manifest.record('transcribe', files={'journal': self.manifest.journal_path},
+                                 segments=len(self.transcriptions))
+        if self.on_segment is not None:
+            for transcription in self.transcriptions:
+                self.on_segment(transcription)
+        return self.transcriptions
+
+    def get_silent_periods(self) -> List[Tuple[float, float]]:
+        if self.silent_periods is None:
+            saved = self.manifest.get('silence') if self.manifest is not None else None
+            if saved is not None:
+                self.silent_periods = [(start, end) for start, end in saved['periods']]
+            else:
+                with self.metrics.stage('silence'):
+                    self.silent_periods = detect_no_sound_period(f'{self.wav_dir}/{self.vid_name}_audio.wav')
+                if self.manifest is not None:
+                    self.manifest.record('silence', periods=self.silent_periods)
+        return self.silent_periods
+
+    def _transcription_settings(self) -> dict:
+        # everything that changes what whisper or the silence detector produce
+        parallel = self.workers > 1 and self.device == 'cpu'
+        options = {'beam_size': 5, 'parallel': parallel, 'stream_audio': self.stream_audio}
+        if self.word_timestamps and not parallel:
+            options['line_limits'] = asdict(self.line_limits)
+        if self.vad is not None and not (parallel and self.vad == 'energy'):
+            options['vad'] = {'mode': self.vad, **asdict(self.vad_options)}
+        return options
+
+    def _get_cache_key(self) -> str:
+        if self.cache_key is None:
+            self.cache_key = make_cache_key(self.cache.file_digest(self.vid_path), # type:ignore
+                                            self.model_size, self.compute_type, self._transcription_settings())
+        return self.cache_key
+
+    def load_cached_transcription(self) -> bool:
+        if self.cache is None:
+            return False
+        try:
+            cached = self.cache.get(self._get_cache_key())
+        except OSError as e:
+            self.logger.warning(f'transcription cache unavailable: {e}')
+            return False
+        if cached is None:
+            return False
+        self.transcriptions, self.silent_periods, self.detected_language = cached
+        self.transcription_complete = True
+        self.logger.info(f'transcription cache hit for {self.vid_name}, {len(self.transcriptions)} segments')
+        return True
+
+    def save_cached_transcription(self):
+        # call before remove_silent_tail, the cache keeps whisper's untrimmed timings
+        if self.cache is None or not self.transcriptions:
+            return
+        if not self.transcription_complete:
+            # a cache hit would serve the truncated result to every later run
+            self.logger.warning(f'transcription of {self.vid_name} is incomplete, not caching it')
+            return
+        try:
+            self.cache.put(self._get_cache_key(), self.transcriptions, self.get_silent_periods(), self.detected_language)
+        except OSError as e:
+            self.logger.warning(f'could not write transcription cache: {e}')
+
+    @timed_stage('trim')
+    def remove_silent_tail(self, policy: TrimPolicy | None = None):
+        silent_periods = self.get_silent_periods()
+        table = self.transcriptions
+        new_starts, new_ends = trim_silences(table.starts, table.ends, silent_periods, policy or self.trim_policy)
+        table.set_times(new_starts, new_ends)
 
 
     def split_transcription(self):
-        self.translation_file = self.ass_dir / f'transcription_{Path(self.vid_name).stem}.json'
-        # 构建包含元数据的导出数据
-        export_data = {
-            "metadata": {
-                "video_path": str(self.vid_path),
-                "video_name": self.vid_name,
-                "width": self.vid_width,
-                "height": self.vid_height,
-                "model_size": self.model_size,
-                "device": self.device,
-                "compute_type": self.compute_type
-            },
-            "transcriptions": [
-                {
-                    "start": t.start,
-                    "end": t.end,
-                    "text": t.text,
-                    "translation": ""
-                }
-                for t in self.transcriptions
-            ]
+        self.translation_file = self.ass_dir / f'transcription_{Path(self.vid_name).stem}.jsonl'
+        # 元数据一行，之后每个片段一行，时间保留原始的秒数
+        metadata = {
+            "video_path": str(self.vid_path),
+            "video_name": self.vid_name,
+            "width": self.vid_width,
+            "height": self.vid_height,
+            "model_size": self.model_size,
+            "device": self.device,
+            "compute_type": self.compute_type
         }
-        
-        with open(self.translation_file, 'w', encoding="utf-8") as f:
-            json.dump(export_data, f, ensure_ascii=False, indent=4)
+        write_translation_file(self.translation_file, metadata, self.transcriptions)
         self.logger.info(f'Transcription and metadata saved to {self.translation_file}')
 
     def load_from_translation_file(self, translation_file: Path) -> bool:
+        """Replace the transcriptions with a full translation file, translations already on top."""
         try:
-            with open(translation_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            metadata = data["metadata"]
-            self.vid_path = Path(metadata["video_path"])
-            self.vid_name = metadata["video_name"]
-            self.vid_width = metadata["width"]
-            self.vid_height = metadata["height"]
-            
-            self.transcriptions = []
-            for t in data["transcriptions"]:
-                trans = Transcription(
-                    start=t["start"],
-                    start_calc = 0, # process that need this attr is always executed before translate file is generated, so it's good to set to 0
-                    end=t["end"],
-                    end_calc = 0,
-                    text=t["text"]
-                )
-                if t["translation"]:
-                    trans.text = t["translation"] + '\n' + trans.text
-                self.transcriptions.append(trans)
-            
+            metadata, self.transcriptions = load_translated_table(translation_file)
+            if metadata is not None:
+                self.vid_path = Path(metadata["video_path"])
+                self.vid_name = metadata["video_name"]
+                self.vid_width = metadata["width"]
+                self.vid_height = metadata["height"]
             self.translation_file = translation_file
             return True
         except Exception as e:
@@ -174,12 +473,11 @@ class VideoTranslator:
             return False
 
     def add_translation_to_subtitle(self) -> bool:
+        """Put the translations of self.translation_file (full or sparse) on the current, untranslated transcriptions."""
         try:
             with open(self.translation_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            for t, saved_t in zip(self.transcriptions, data["transcriptions"]):
-                if saved_t["translation"]:
-                    t.text = saved_t["translation"] + '\n' + t.text
+                _, entries = read_entries(f)
+                apply_translations(self.transcriptions, entries)
             return True
         except FileNotFoundError:
             self.logger.error(f'Translation file not found: {self.translation_file}')
@@ -187,54 +485,260 @@ class VideoTranslator:
         except Exception as e:
             self.logger.error(f'Failed to read translation: {e}')
             return False
+
+    @timed_stage('subtitle')
     def generate_subtitle(self, styles : List[AssStyle] | None = None):
         self.ass = AssGenerator(self.vid_name,self.transcriptions, styles)
         self.ass_path = self.ass.save(self.vid_width, self.vid_height, output_dir=self.ass_dir)
+        if self.manifest is not None:
+            self.manifest.record('subtitle', files={'ass': self.ass_path})
+
+    @contextmanager
+    def live_subtitle(self, styles : List[AssStyle] | None = None, trim: bool = False):
+        """Append every segment to the .ass file as soon as whisper_transcription produces it.
+
+        With trim=True each line gets the same silence trimming remove_silent_tail applies later,
+        so the file matches what generate_subtitle would have written.
+        """
+        self.probe()
+        self.ass = AssGenerator(self.vid_name, self.transcriptions, styles)
+        self.ass_path = self.ass_dir / f'{self.vid_name}.ass'
+        silent_periods = self.get_silent_periods() if trim else None
+        forward = self.on_segment
+
+        def on_segment(transcription: Transcription):
+            start, end = transcription.start_calc, transcription.end_calc
+            if silent_periods:
+                new_starts, new_ends = trim_silences([start], [end], silent_periods, self.trim_policy)
+                start, end = float(new_starts[0]), float(new_ends[0])
+            writer.write_segment(start, end, transcription.text)
+            writer.flush()
+            if forward is not None:
+                forward(transcription)
+
+        with AssWriter(self.ass_path, self.vid_width, self.vid_height, self.ass.default_title(), styles) as writer:
+            self.on_segment = on_segment
+            try:
+                yield writer
+            finally:
+                self.on_segment = forward
+        if self.manifest is not None:
+            self.manifest.record('subtitle', files={'ass': self.ass_path})
+        self.logger.info(f'Subtitle saved to: {self.ass_path} ({writer.count} lines)')
+
+    def _translation_identity(self) -> str | None:
+        return self.machine_translator.identity if self.machine_translator is not None else None
+
+    def _burn_settings(self, mode: str | None = None, profile: EncodeProfile | None = None) -> dict:
+        # everything that changes the burned file, a rerun only reuses it when all of it matches
+        mode = mode or self.burn_mode
+        profile = profile or self.encode_profile
+        return {'mode': mode, 'profile': asdict(profile) if profile is not None and mode != 'softsub' else None,
+                'translation': self._translation_identity()}
+
+    @contextmanager
+    def streamed_translation(self):
+        """Hand every segment to the machine translator as soon as whisper_transcription produces it.
+
+        The translator works through them in batches on its own thread while whisper keeps
+        decoding; generate_translated_subtitle then collects the results, inside the block or
+        after it. Lines that never went through on_segment (a cached transcription) are fed
+        on the way out.
+        """
+        translator = self.machine_translator
+        if translator is None:
+            raise RuntimeError('no machine translator configured')
+        stream = TranslationStream(translator, translator.source)
+        forward = self.on_segment
+
+        def on_segment(transcription: Transcription):
+            if stream.source is None:
+                # whisper has detected the language by the time the first segment arrives
+                stream.source = self.detected_language
+            stream.feed(transcription.text)
+            if forward is not None:
+                forward(transcription)
+
+        self.on_segment = on_segment
+        try:
+            yield stream
+            if stream.fed < len(self.transcriptions):
+                if stream.source is None:
+                    # a cache hit restores the language along with the lines
+                    stream.source = self.detected_language
+                stream.feed_many(self.transcriptions.texts[stream.fed:])
+        except BaseException:
+            stream.cancel()
+            raise
+        finally:
+            self.on_segment = forward
+            stream.close()
+
+    @timed_stage('subtitle')
+    def generate_translated_subtitle(self, stream: TranslationStream, styles : List[AssStyle] | None = None):
+        """Write the .ass while the translations come in, each line under its translation like a manual one."""
+        table = self.transcriptions
+        # a cached transcription never went through on_segment, its lines are fed here
+        if stream.fed < len(table) and not stream.closed:
+            stream.feed_many(table.texts[stream.fed:])
+        stream.close()
+        self.ass = AssGenerator(self.vid_name, table, styles)
+        self.ass_path = self.ass_dir / f'{self.vid_name}.ass'
+        texts, starts, ends = list(table.texts), table.starts.tolist(), table.ends.tolist()
+        with AssWriter(self.ass_path, self.vid_width, self.vid_height, self.ass.default_title(), styles) as writer:
+            for i, translation in zip(range(len(table)), stream.results()):
+                self.check_cancelled()
+                text = with_translation(texts[i], translation)
+                writer.write_segment(starts[i], ends[i], text)
+                table.set_text(i, text)
+        stats = stream.translator.stats
+        self.metrics.add('translate', stream.busy_seconds, stream.cpu_seconds)
+        if self.manifest is not None:
+            self.manifest.record('subtitle', files={'ass': self.ass_path})
+        self.logger.info(f'Translated subtitle saved to: {self.ass_path} ({writer.count} lines, '
+                         f'{stats["cached"]} cached, {stats["translated"]} translated in {stats["batches"]} batches)')
 
-    def compress_subtitle(self):
-        # ffmpeg -i input.mp4 -vf "ass=subtitle.ass" -c:a copy output.mp4
-        input_vid = str(self.vid_path)
-        ass_path = str(self.ass_path.resolve())
+    def _run_ffmpeg(self, cmd: List[str], on_progress: Callable[[float], None] | None = None,
+                    duration: float | None = None) -> FFmpegRunner:
+        """Run ffmpeg under the runner: progress as a fraction of duration (the input's by default), timeout, cancel."""
+        self.check_cancelled()
+        if on_progress is not None and duration is None:
+            info = self._try_probe()
+            duration = info.duration if info is not None else None
+
+        def report(progress: FFmpegProgress):
+            if on_progress is not None and progress.fraction is not None:
+                on_progress(progress.fraction)
+
+        runner = FFmpegRunner(cmd, duration=duration, on_progress=report, timeout=self.ffmpeg_timeout,
+                              cancel_event=self.cancel_event).start()
+        self._processes.add(runner.process) # type:ignore
+        try:
+            runner.wait()
+        finally:
+            runner.kill()
+            self._processes.discard(runner.process) # type:ignore
+        if runner.progress.speed:
+            self.logger.info(f'ffmpeg finished at {runner.progress.speed:.2f}x realtime')
+        return runner
+
+    @timed_stage('burn')
+    def compress_subtitle(self, mode: str | None = None, profile: EncodeProfile | str | None = None) -> float:
+        mode = mode or self.burn_mode
+        profile = resolve_profile(profile) or self.encode_profile
+        ass_path = self.ass_path.resolve()
         self.output_path = self.out_dir / f'w_sub_{self.vid_name}'
-        output_vid = str(self.output_path)
 
         if not os.path.exists(ass_path):
             raise FileNotFoundError(ass_path)
-        if repair_ass_file(ass_path):
-            self.logger.info("Repaired JSON-encoded ASS subtitle file before burning")
-        import shlex
-        cmd = [
-            "ffmpeg",
-            "-y",
-            "-i", input_vid,
-            "-vf", f"ass={shlex.quote(ass_path)}",
-            "-c:a", "copy",
-            output_vid
-        ]
-        self.logger.info("Running ffmpeg subtitle burn command: %s", cmd)
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode != 0:
-            raise RuntimeError(result.stderr.strip() or result.stdout.strip())
+
+        start = time.perf_counter()
+        if mode == 'softsub':
+            self.output_path = softsub_output(self.output_path)
+            cmd = softsub_command(self.vid_path, ass_path, self.output_path)
+            self.logger.info("Running ffmpeg subtitle mux command: %s", cmd)
+            self._run_ffmpeg(cmd, on_progress=self.on_burn_progress)
+        elif mode == 'segments':
+            self._burn_segments(ass_path, profile)
+        else:
+            cmd = burn_command(self.vid_path, ass_path, self.output_path, profile)
+            self.logger.info("Running ffmpeg subtitle burn command: %s", cmd)
+            self._run_ffmpeg(cmd, on_progress=self.on_burn_progress)
+        elapsed = time.perf_counter() - start
+        if self.manifest is not None and self.transcription_complete:
+            self.manifest.record('burn', **self._burn_settings(mode, profile),
+                                 files={'output': self.output_path, 'ass': ass_path})
+        self.logger.info(f'{mode} of {self.vid_name} took {elapsed:.1f}s')
+        return elapsed
+
+    def _burn_segments(self, ass_path: Path, profile: EncodeProfile | None):
+        info = self._try_probe()
+        # about two parts per parallel job keeps every process busy without tiny fragments
+        if info is not None and info.duration:
+            segment_seconds = min(600.0, max(30.0, info.duration / (2 * self.burn_jobs)))
+        else:
+            segment_seconds = 120.0
+        segment_dir = self.out_dir / f'.segments_{Path(self.vid_name).stem}'
+        shutil.rmtree(segment_dir, ignore_errors=True)
+        segment_dir.mkdir(parents=True)
+        try:
+            self._run_ffmpeg(split_command(self.vid_path, segment_dir, segment_seconds))
+            segments = read_segment_list(segment_dir)
+            burned = [path.with_name(f'burned_{path.name}') for path, _ in segments]
+            self.logger.info(f'burning {len(segments)} segments with {self.burn_jobs} parallel ffmpeg processes')
+            # overall progress is the share of the whole input the parts have encoded so far
+            total = info.duration if info is not None and info.duration else None
+            part_lengths = [next_offset - offset for (_, offset), (_, next_offset)
+                            in zip(segments, segments[1:] + [(None, total or 0.0)])]
+            done = [0.0] * len(segments)
+
+            def part_progress(i: int) -> Callable[[float], None]:
+                def report(fraction: float):
+                    done[i] = fraction * part_lengths[i]
+                    if self.on_burn_progress is not None and total:
+                        self.on_burn_progress(min(1.0, sum(done) / total))
+                return report
+
+            with ThreadPoolExecutor(max_workers=self.burn_jobs) as pool:
+                futures = [pool.submit(self._run_ffmpeg, burn_command(path, ass_path, out, profile, offset),
+                                       part_progress(i) if total else None, part_lengths[i] if total else None)
+                           for i, ((path, offset), out) in enumerate(zip(segments, burned))]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    # one failed segment sinks the whole burn, don't wait for the others
+                    for future in futures:
+                        future.cancel()
+                    for process in list(self._processes):
+                        if process.poll() is None:
+                            process.kill()
+                    raise
+            self._run_ffmpeg(concat_command(burned, segment_dir / 'concat.txt', self.output_path))
+        finally:
+            shutil.rmtree(segment_dir, ignore_errors=True)
 
     def singleVideoPipeline(self, manual_translate: bool = False, translation_file: Path | None = None):
         if translation_file and self.load_from_translation_file(translation_file):
+            # the loaded texts already carry the translations, applying them again would stack them twice
             self.logger.info("Restored state from translation file")
-            self.add_translation_to_subtitle()
             self.generate_subtitle()
             # self.compress_subtitle()
             return
         
-        self.get_audio_stream()
-        self.get_resolution()
-        self.whisper_transcription()
-        self.remove_silent_tail()
-        
-        if manual_translate:
-            self.split_transcription()
-            self.logger.info("Please translate the content in the generated file and run again with the translation file")
+        burned = self.manifest.get('burn') if self.manifest is not None and not manual_translate else None
+        if burned is not None and all(burned.get(k) == v for k, v in self._burn_settings().items()):
+            self.output_path = Path(burned['files']['output']['path'])
+            self.logger.info(f'{self.vid_name} was already burned to {self.output_path}, nothing to resume')
             return
-        
-        self.generate_subtitle()
+
+        machine_translate = self.machine_translator is not None and not manual_translate
+        with self.streamed_translation() if machine_translate else nullcontext() as translation:
+            cached = self.load_cached_transcription()
+            if not cached:
+                # a finished transcription in the manifest replays without needing the audio again
+                if self.manifest is None or self.manifest.get('transcribe') is None:
+                    self.get_audio_stream()
+                if manual_translate or machine_translate:
+                    # translated lines are only written once their translation is back
+                    self.whisper_transcription()
+                else:
+                    # the subtitle fills up while whisper runs, no separate generation pass afterwards
+                    with self.live_subtitle(trim=True):
+                        self.whisper_transcription()
+                self.save_cached_transcription()
+            self.get_resolution()
+            self.remove_silent_tail()
+
+            if manual_translate:
+                self.split_transcription()
+                self.logger.info("Please translate the content in the generated file and run again with the translation file")
+                return
+
+            if translation is not None:
+                self.generate_translated_subtitle(translation)
+            elif cached:
+                self.generate_subtitle()
         self.compress_subtitle()
 
 if __name__ == '__main__':
@@ -2,6 +2,8 @@ let currentTaskId = null;
 let currentFilePath = null;
 let currentOutputFile = null;
 let pollInterval = null;
+let eventSource = null;
+let lastEventId = 0;
 
 const uploadBox = document.getElementById('uploadBox');
 const fileInput = document.getElementById('fileInput');
@@ -16,6 +18,7 @@ const downloadSubtitleBtn = document.getElementById('downloadSubtitleBtn');
 const newVideoBtn = document.getElementById('newVideoBtn');
 const newVideoBtn2 = document.getElementById('newVideoBtn2');
 const retryBtn = document.getElementById('retryBtn');
+const cancelBtn = document.getElementById('cancelBtn');
 
 function initEventListeners() {
     uploadBox.addEventListener('click', () => fileInput.click());
@@ -29,6 +32,7 @@ function initEventListeners() {
     newVideoBtn.addEventListener('click', resetUI);
     newVideoBtn2.addEventListener('click', resetUI);
     retryBtn.addEventListener('click', () => location.reload());
+    cancelBtn.addEventListener('click', cancelTask);
     
     const translationUploadBox = document.getElementById('translationUploadBox');
     const translationFileInput = document.getElementById('translationFileInput');
@@ -84,24 +88,80 @@ function handleTranslationSelect() {
     }
 }
 
-// 上传视频
+// 上传视频：分块并发上传，断线后重新选择同一个文件会从已收到的分块继续
+const UPLOAD_CONCURRENCY = 4;
+const UPLOAD_RETRIES = 3;
+
 async function uploadVideo(file) {
-    const formData = new FormData();
-    formData.append('file', file);
-    
     document.getElementById('uploadProgress').style.display = 'block';
+    const progressFill = document.getElementById('uploadProgressFill');
+    const uploadStatus = document.getElementById('uploadStatus');
     
     try {
-        const response = await fetch('/api/upload', {
+        const createResponse = await fetch('/api/uploads', {
             method: 'POST',
-            body: formData
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                filename: file.name,
+                size: file.size,
+                fingerprint: `${file.lastModified}`
+            })
         });
+        const session = await createResponse.json();
+        if (!createResponse.ok) {
+            throw new Error(session.error || '未知错误');
+        }
+        
+        const chunkSize = session.chunk_size;
+        const totalChunks = Math.ceil(file.size / chunkSize);
+        const received = new Set(session.received);
+        const pending = [];
+        for (let i = 0; i < totalChunks; i++) {
+            if (!received.has(i)) pending.push(i);
+        }
+        let done = received.size;
+        const showProgress = () => {
+            const percent = totalChunks ? Math.round(done / totalChunks * 100) : 100;
+            progressFill.style.width = percent + '%';
+            uploadStatus.textContent = `上传中... ${percent}%`;
+        };
+        showProgress();
         
+        async function sendChunk(index) {
+            const offset = index * chunkSize;
+            const blob = file.slice(offset, Math.min(offset + chunkSize, file.size));
+            for (let attempt = 1; ; attempt++) {
+                try {
+                    const response = await fetch(`/api/uploads/${session.upload_id}?offset=${offset}`, {
+                        method: 'PUT',
+                        headers: { 'Content-Type': 'application/octet-stream' },
+                        body: blob
+                    });
+                    if (response.ok) return;
+                    const data = await response.json();
+                    throw new Error(data.error || response.statusText);
+                } catch (error) {
+                    if (attempt >= UPLOAD_RETRIES) throw error;
+                    await new Promise(resolve => setTimeout(resolve, 1000 * attempt));
+                }
+            }
+        }
+        
+        async function worker() {
+            while (pending.length > 0) {
+                await sendChunk(pending.shift());
+                done++;
+                showProgress();
+            }
+        }
+        await Promise.all(Array.from({ length: Math.min(UPLOAD_CONCURRENCY, pending.length) }, worker));
+        
+        const response = await fetch(`/api/uploads/${session.upload_id}/finalize`, { method: 'POST' });
         const data = await response.json();
         
         if (response.ok) {
             currentFilePath = data.filepath;
-            document.getElementById('uploadStatus').textContent = '上传成功！';
+            uploadStatus.textContent = data.deduplicated ? '上传成功！（服务器上已有相同文件）' : '上传成功！';
             setTimeout(() => {
                 document.getElementById('uploadProgress').style.display = 'none';
                 uploadBox.style.display = 'none';
@@ -145,7 +205,7 @@ async function startProcessing() {
             currentTaskId = data.task_id;
             configSection.style.display = 'none';
             progressSection.style.display = 'block';
-            pollTaskStatus();
+            watchTask();
         } else {
             alert('处理失败：' + (data.error || '未知错误'));
             startBtn.disabled = false;
@@ -156,6 +216,73 @@ async function startProcessing() {
     }
 }
 
+// 通过 SSE 接收任务状态和转录片段，不支持时退回轮询
+function watchTask() {
+    if (!window.EventSource) {
+        pollTaskStatus();
+        return;
+    }
+    if (eventSource) eventSource.close();
+
+    eventSource = new EventSource(`/api/task/${currentTaskId}/events?since=${lastEventId}`);
+    eventSource.addEventListener('status', (e) => {
+        lastEventId = Number(e.lastEventId) || lastEventId;
+        handleTaskStatus(JSON.parse(e.data));
+    });
+    eventSource.addEventListener('segment', (e) => {
+        lastEventId = Number(e.lastEventId) || lastEventId;
+        appendSegment(JSON.parse(e.data));
+    });
+    eventSource.onerror = () => {
+        // 服务器在任务结束后会关闭连接；其他情况下改用轮询
+        if (eventSource.readyState === EventSource.CLOSED) {
+            eventSource = null;
+            pollTaskStatus();
+        }
+    };
+}
+
+function stopWatching() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+    if (pollInterval) clearInterval(pollInterval);
+}
+
+// 处理一次状态更新
+function handleTaskStatus(task) {
+    updateProgress(task);
+
+    if (task.status === 'completed') {
+        stopWatching();
+        showComplete(task);
+    } else if (task.status === 'failed') {
+        stopWatching();
+        showError(task.error || '处理失败');
+    } else if (task.status === 'waiting_translation') {
+        stopWatching();
+        showTranslationWaiting(task);
+    } else if (task.status === 'cancelled') {
+        stopWatching();
+        showError('任务已取消');
+    }
+}
+
+// 显示新转录出的片段
+function appendSegment(segment) {
+    const list = document.getElementById('segmentPreview');
+    const item = document.createElement('li');
+    const time = document.createElement('span');
+    time.className = 'segment-time';
+    time.textContent = `${segment.start} → ${segment.end}`;
+    item.appendChild(time);
+    item.appendChild(document.createTextNode(segment.text));
+    list.appendChild(item);
+    list.style.display = 'block';
+    list.scrollTop = list.scrollHeight;
+}
+
 // 轮询任务状态
 function pollTaskStatus() {
     if (pollInterval) clearInterval(pollInterval);
@@ -166,18 +293,7 @@ function pollTaskStatus() {
             const task = await response.json();
             
             if (response.ok) {
-                updateProgress(task);
-                
-                if (task.status === 'completed') {
-                    clearInterval(pollInterval);
-                    showComplete(task);
-                } else if (task.status === 'failed') {
-                    clearInterval(pollInterval);
-                    showError(task.error || '处理失败');
-                } else if (task.status === 'waiting_translation') {
-                    clearInterval(pollInterval);
-                    showTranslationWaiting(task);
-                }
+                handleTaskStatus(task);
             }
         } catch (error) {
             console.error('状态查询失败：' + error.message);
@@ -193,7 +309,29 @@ function updateProgress(task) {
     
     progressFill.style.width = task.progress + '%';
     progressText.textContent = task.progress + '%';
-    statusMessage.textContent = task.message || '处理中...';
+    if (task.status === 'queued' && task.queue_position) {
+        statusMessage.textContent = `排队中，前面还有 ${task.queue_position - 1} 个任务`;
+    } else {
+        statusMessage.textContent = task.message || '处理中...';
+    }
+}
+
+// 取消任务
+async function cancelTask() {
+    if (!currentTaskId) return;
+    cancelBtn.disabled = true;
+
+    try {
+        const response = await fetch(`/api/task/${currentTaskId}/cancel`, { method: 'POST' });
+        const data = await response.json();
+        if (!response.ok) {
+            alert('取消失败：' + (data.error || '未知错误'));
+            cancelBtn.disabled = false;
+        }
+    } catch (error) {
+        alert('请求出错：' + error.message);
+        cancelBtn.disabled = false;
+    }
 }
 
 // 显示完成
@@ -205,6 +343,13 @@ function showComplete(task) {
     const completeMessage = document.getElementById('completeMessage');
     const subtitlePath = task.subtitle_file ? `\n字幕已保存到：${task.subtitle_file}` : '';
     completeMessage.textContent = `视频处理完成！\n字幕文件已压制到视频中。${subtitlePath}`;
+    
+    // 预览走 Range 请求，拖动进度条不需要下载整个文件
+    if (currentOutputFile) {
+        const previewVideo = document.getElementById('previewVideo');
+        previewVideo.src = `/api/preview/${currentTaskId}`;
+        previewVideo.style.display = 'block';
+    }
 }
 
 // 显示翻译等待状态
@@ -237,7 +382,7 @@ async function uploadTranslation(file) {
             document.getElementById('translationUploadStatus').textContent = '上传成功！处理中...';
             translationSection.style.display = 'none';
             progressSection.style.display = 'block';
-            pollTaskStatus();
+            watchTask();
         } else {
             alert('上传失败：' + (data.error || '未知错误'));
             document.getElementById('translationUploadProgress').style.display = 'none';
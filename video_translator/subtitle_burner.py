@@ -0,0 +1,89 @@
+import csv
+import shlex
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Tuple
+
+BURN_MODES = ('burn', 'segments', 'softsub')
+
+
+@dataclass
+class EncodeProfile:
+    codec: str = 'libx264'
+    preset: str = 'medium'
+    crf: int = 23
+    threads: int = 0  # 0 lets ffmpeg pick
+
+    def to_args(self) -> List[str]:
+        args = ['-c:v', self.codec, '-preset', self.preset, '-crf', str(self.crf)]
+        if self.threads:
+            args += ['-threads', str(self.threads)]
+        return args
+
+
+ENCODE_PROFILES = {
+    'fast': EncodeProfile(preset='veryfast', crf=23),
+    'balanced': EncodeProfile(preset='medium', crf=21),
+    'quality': EncodeProfile(preset='slow', crf=18),
+}
+
+
+def resolve_profile(profile: 'EncodeProfile | str | None') -> EncodeProfile | None:
+    if profile is None or isinstance(profile, EncodeProfile):
+        return profile
+    if profile not in ENCODE_PROFILES:
+        raise ValueError(f'unknown encode profile {profile!r}, choose from {", ".join(ENCODE_PROFILES)}')
+    return ENCODE_PROFILES[profile]
+
+
+def ass_filter(ass_path: str | Path, offset: float = 0.0) -> str:
+    quoted = shlex.quote(str(ass_path))
+    if not offset:
+        return f'ass={quoted}'
+    # shift the frames onto the full video's timeline so ass picks the right lines, then shift back
+    return f'setpts=PTS+{offset:.6f}/TB,ass={quoted},setpts=PTS-STARTPTS'
+
+
+def burn_command(input_vid: str | Path, ass_path: str | Path, output_vid: str | Path,
+                 profile: EncodeProfile | None = None, offset: float = 0.0) -> List[str]:
+    # ffmpeg -i input.mp4 -vf "ass=subtitle.ass" -c:a copy output.mp4
+    cmd = ['ffmpeg', '-y', '-i', str(input_vid), '-vf', ass_filter(ass_path, offset)]
+    if profile is not None:
+        cmd += profile.to_args()
+    return cmd + ['-c:a', 'copy', str(output_vid)]
+
+
+def softsub_output(output_vid: Path) -> Path:
+    # mp4/mov only carry mov_text, everything else goes into mkv which keeps the ass styling
+    if output_vid.suffix.lower() in ('.mp4', '.mov', '.mkv'):
+        return output_vid
+    return output_vid.with_suffix('.mkv')
+
+
+def softsub_command(input_vid: str | Path, ass_path: str | Path, output_vid: str | Path) -> List[str]:
+    codec = 'ass' if Path(output_vid).suffix.lower() == '.mkv' else 'mov_text'
+    return ['ffmpeg', '-y', '-i', str(input_vid), '-i', str(ass_path),
+            '-map', '0', '-map', '1:0', '-c', 'copy', '-c:s', codec, str(output_vid)]
+
+
+def split_command(input_vid: str | Path, segment_dir: Path, segment_seconds: float) -> List[str]:
+    # with stream copy the segmenter can only cut on keyframes, so every piece starts on one
+    suffix = Path(input_vid).suffix or '.mp4'
+    return ['ffmpeg', '-y', '-i', str(input_vid), '-map', '0:v:0', '-map', '0:a?', '-c', 'copy', '-f', 'segment',
+            '-segment_time', f'{segment_seconds:.3f}', '-reset_timestamps', '1',
+            '-segment_list', str(segment_dir / 'segments.csv'), '-segment_list_type', 'csv',
+            str(segment_dir / f'part_%05d{suffix}')]
+
+
+def read_segment_list(segment_dir: Path) -> List[Tuple[Path, float]]:
+    segments = []
+    with open(segment_dir / 'segments.csv', newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if row:
+                segments.append((segment_dir / row[0], float(row[1])))
+    return segments
+
+
+def concat_command(parts: List[Path], list_file: Path, output_vid: str | Path) -> List[str]:
+    list_file.write_text(''.join(f"file '{part.resolve()}'\n" for part in parts), encoding='utf-8')
+    return ['ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', str(list_file), '-c', 'copy', str(output_vid)]
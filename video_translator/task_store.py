@@ -0,0 +1,323 @@
+import abc
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# statuses after which a task no longer changes on its own and may expire
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled', 'waiting_translation')
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+class TaskStore(abc.ABC):
+    """Where web tasks live: fields as a JSON-able dict plus an append-only event log.
+
+    Every method is safe to call from any thread; the SQLite backend is also safe across
+    processes, which is what lets several server or worker processes share the tasks.
+    """
+
+    @abc.abstractmethod
+    def create(self, task_id: str, fields: Dict[str, Any], priority: int = 0):
+        ...
+
+    @abc.abstractmethod
+    def get(self, task_id: str) -> Dict[str, Any] | None:
+        ...
+
+    @abc.abstractmethod
+    def update(self, task_id: str, **fields) -> bool:
+        """Merge fields into the task in one atomic step; False if the task is gone."""
+        ...
+
+    @abc.abstractmethod
+    def claim(self, worker_id: str, task_id: str | None = None) -> Dict[str, Any] | None:
+        """Atomically move a queued task to processing: that one, or the lowest priority value, oldest first.
+
+        Tasks whose `not_before` timestamp is still in the future (waiting for a retry) are skipped.
+        """
+        ...
+
+    @abc.abstractmethod
+    def find(self, status: str) -> List[Dict[str, Any]]:
+        """Tasks with that status in claim order, each including its task_id."""
+        ...
+
+    @abc.abstractmethod
+    def queue_position(self, task_id: str) -> int | None:
+        """1-based position in the claim order, None unless the task is queued."""
+        ...
+
+    @abc.abstractmethod
+    def requeue_stale(self, timeout: float) -> List[str]:
+        """Put processing tasks nobody updated for timeout seconds back in the queue, counting an attempt."""
+        ...
+
+    @abc.abstractmethod
+    def append_event(self, task_id: str, event_type: str, data: Any) -> int:
+        ...
+
+    @abc.abstractmethod
+    def events_since(self, task_id: str, since: int = 0) -> List[Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    def expire(self, ttl: float = DEFAULT_TTL) -> int:
+        """Drop finished tasks (and their events) not updated for ttl seconds."""
+        ...
+
+    def __contains__(self, task_id: str) -> bool:
+        return self.get(task_id) is not None
+
+
+class MemoryTaskStore(TaskStore):
+    """Single-process store, the old behaviour: everything is gone on restart."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        self._events: Dict[str, List[Dict[str, Any]]] = {}
+
+    def create(self, task_id, fields, priority=0):
+        with self._lock:
+            self._tasks[task_id] = dict(fields)
+            self._meta[task_id] = {'priority': priority, 'created': time.time(), 'updated': time.time()}
+            self._events[task_id] = []
+
+    def get(self, task_id):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return dict(task) if task is not None else None
+
+    def update(self, task_id, **fields):
+        with self._lock:
+            if task_id not in self._tasks:
+                return False
+            task = self._tasks[task_id]
+            # None removes the field, like json_patch in the SQLite store
+            for key, value in fields.items():
+                if value is None:
+                    task.pop(key, None)
+                else:
+                    task[key] = value
+            self._meta[task_id]['updated'] = time.time()
+            return True
+
+    def claim(self, worker_id, task_id=None):
+        with self._lock:
+            now = time.time()
+            if task_id is None:
+                queued = [t for t in self._queued() if self._tasks[t].get('not_before', 0) <= now]
+                if not queued:
+                    return None
+                task_id = queued[0]
+            task = self._tasks.get(task_id)
+            if task is None or task.get('status') != 'queued' or task.get('not_before', 0) > now:
+                return None
+            task.update(status='processing', worker=worker_id)
+            self._meta[task_id]['updated'] = time.time()
+            return {'task_id': task_id, **task}
+
+    def _order(self, task_id):
+        return self._meta[task_id]['priority'], self._meta[task_id]['created']
+
+    def _queued(self) -> List[str]:
+        return sorted((t for t, task in self._tasks.items() if task.get('status') == 'queued'), key=self._order)
+
+    def find(self, status):
+        with self._lock:
+            found = sorted((t for t, task in self._tasks.items() if task.get('status') == status), key=self._order)
+            return [{'task_id': t, **self._tasks[t]} for t in found]
+
+    def queue_position(self, task_id):
+        with self._lock:
+            queued = self._queued()
+            return queued.index(task_id) + 1 if task_id in queued else None
+
+    def requeue_stale(self, timeout):
+        cutoff = time.time() - timeout
+        with self._lock:
+            stale = [t for t, task in self._tasks.items()
+                     if task.get('status') == 'processing' and self._meta[t]['updated'] < cutoff]
+            for task_id in stale:
+                task = self._tasks[task_id]
+                task.update(status='queued', attempts=task.get('attempts', 0) + 1)
+                self._meta[task_id]['updated'] = time.time()
+            return stale
+
+    def append_event(self, task_id, event_type, data):
+        with self._lock:
+            events = self._events.setdefault(task_id, [])
+            events.append({'id': len(events) + 1, 'type': event_type, 'data': data})
+            return len(events)
+
+    def events_since(self, task_id, since=0):
+        with self._lock:
+            return list(self._events.get(task_id, [])[since:])
+
+    def expire(self, ttl=DEFAULT_TTL):
+        cutoff = time.time() - ttl
+        with self._lock:
+            stale = [t for t, task in self._tasks.items()
+                     if task.get('status') in FINISHED_STATUSES and self._meta[t]['updated'] < cutoff]
+            for task_id in stale:
+                del self._tasks[task_id], self._meta[task_id]
+                self._events.pop(task_id, None)
+            return len(stale)
+
+
+class SqliteTaskStore(TaskStore):
+    """SQLite in WAL mode: readers never wait for the writer, writes are single statements.
+
+    status and priority live in their own indexed columns, everything else is a JSON
+    document merged with json_patch, so a progress update never rewrites a stale copy.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id TEXT PRIMARY KEY,
+            status TEXT,
+            priority INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL,
+            updated REAL NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, priority, created);
+        CREATE INDEX IF NOT EXISTS tasks_updated ON tasks (status, updated);
+        CREATE TABLE IF NOT EXISTS events (
+            task_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (task_id, seq)
+        ) WITHOUT ROWID;
+    '''
+
+    READY = "coalesce(json_extract(data, '$.not_before'), 0) <= ?"
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # one connection per thread; autocommit, so every statement is its own transaction
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_task(row) -> Dict[str, Any]:
+        task_id, status, data = row
+        return {**json.loads(data), 'status': status, 'task_id': task_id}
+
+    def create(self, task_id, fields, priority=0):
+        now = time.time()
+        data = {k: v for k, v in fields.items() if k != 'status'}
+        self._connection().execute(
+            'INSERT OR REPLACE INTO tasks (task_id, status, priority, created, updated, data) VALUES (?, ?, ?, ?, ?, ?)',
+            (task_id, fields.get('status'), priority, now, now, json.dumps(data, ensure_ascii=False)))
+
+    def get(self, task_id):
+        row = self._connection().execute(
+            'SELECT task_id, status, data FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+        if row is None:
+            return None
+        task = self._row_to_task(row)
+        del task['task_id']
+        return task
+
+    def update(self, task_id, **fields):
+        status = fields.pop('status', None)
+        # merge-patch drops keys set to None, which reads back the same through .get()
+        cursor = self._connection().execute(
+            'UPDATE tasks SET status = coalesce(?, status), updated = ?, data = json_patch(data, ?) WHERE task_id = ?',
+            (status, time.time(), json.dumps(fields, ensure_ascii=False), task_id))
+        return cursor.rowcount > 0
+
+    def claim(self, worker_id, task_id=None):
+        patch = json.dumps({'worker': worker_id})
+        now = time.time()
+        if task_id is not None:
+            row = self._connection().execute(
+                "UPDATE tasks SET status = 'processing', updated = ?, data = json_patch(data, ?) "
+                f"WHERE task_id = ? AND status = 'queued' AND {self.READY} RETURNING task_id, status, data",
+                (now, patch, task_id, now)).fetchone()
+        else:
+            row = self._connection().execute(
+                "UPDATE tasks SET status = 'processing', updated = ?, data = json_patch(data, ?) "
+                f"WHERE task_id = (SELECT task_id FROM tasks WHERE status = 'queued' AND {self.READY} "
+                "ORDER BY priority, created LIMIT 1) AND status = 'queued' "
+                "RETURNING task_id, status, data",
+                (now, patch, now)).fetchone()
+        return self._row_to_task(row) if row is not None else None
+
+    def find(self, status):
+        rows = self._connection().execute(
+            'SELECT task_id, status, data FROM tasks WHERE status = ? ORDER BY priority, created', (status,))
+        return [self._row_to_task(row) for row in rows]
+
+    def queue_position(self, task_id):
+        conn = self._connection()
+        row = conn.execute("SELECT priority, created FROM tasks WHERE task_id = ? AND status = 'queued'",
+                           (task_id,)).fetchone()
+        if row is None:
+            return None
+        ahead = conn.execute("SELECT count(*) FROM tasks WHERE status = 'queued' AND (priority, created) < (?, ?)",
+                             row).fetchone()[0]
+        return ahead + 1
+
+    def requeue_stale(self, timeout):
+        now = time.time()
+        rows = self._connection().execute(
+            "UPDATE tasks SET status = 'queued', updated = ?, "
+            "data = json_set(data, '$.attempts', coalesce(json_extract(data, '$.attempts'), 0) + 1) "
+            "WHERE status = 'processing' AND updated < ? RETURNING task_id",
+            (now, now - timeout)).fetchall()
+        return [row[0] for row in rows]
+
+    def append_event(self, task_id, event_type, data):
+        row = self._connection().execute(
+            'INSERT INTO events (task_id, seq, type, data) '
+            'SELECT ?, coalesce(max(seq), 0) + 1, ?, ? FROM events WHERE task_id = ? RETURNING seq',
+            (task_id, event_type, json.dumps(data, ensure_ascii=False), task_id)).fetchone()
+        return row[0]
+
+    def events_since(self, task_id, since=0):
+        rows = self._connection().execute(
+            'SELECT seq, type, data FROM events WHERE task_id = ? AND seq > ? ORDER BY seq',
+            (task_id, since)).fetchall()
+        return [{'id': seq, 'type': event_type, 'data': json.loads(data)} for seq, event_type, data in rows]
+
+    def expire(self, ttl=DEFAULT_TTL):
+        conn = self._connection()
+        placeholders = ', '.join('?' * len(FINISHED_STATUSES))
+        cutoff = time.time() - ttl
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            stale = [row[0] for row in conn.execute(
+                f'SELECT task_id FROM tasks WHERE status IN ({placeholders}) AND updated < ?',
+                (*FINISHED_STATUSES, cutoff))]
+            conn.executemany('DELETE FROM events WHERE task_id = ?', ((t,) for t in stale))
+            conn.executemany('DELETE FROM tasks WHERE task_id = ?', ((t,) for t in stale))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return len(stale)
+
+
+def open_task_store(url: str | Path | None) -> TaskStore:
+    """'memory' (or None) for the in-process store, anything else is a SQLite file path."""
+    if url is None or str(url) == 'memory':
+        return MemoryTaskStore()
+    return SqliteTaskStore(url)
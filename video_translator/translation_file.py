@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, NamedTuple, Tuple
+
+from .utils import TranscriptionTable, HMS_to_second
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 'video-translator/translation'
+VERSION = 2
+
+
+class TranslationFileError(ValueError):
+    def __init__(self, message: str, line: int | None = None):
+        super().__init__(f'line {line}: {message}' if line is not None else message)
+        self.line = line
+
+
+class TranslationEntry(NamedTuple):
+    index: int
+    # None in sparse files, which only carry the translation
+    start: float | None
+    end: float | None
+    text: str | None
+    translation: str
+
+
+def with_translation(text: str, translation: str) -> str:
+    # the translation goes on top, the original line below it
+    return f'{translation}\n{text}' if translation else text
+
+
+def write_translation_file(path: str | Path, metadata: Dict[str, Any], table: TranscriptionTable,
+                           translations: Dict[int, str] | None = None):
+    """One metadata line, then one JSON object per segment with the exact float times."""
+    path = Path(path)
+    tmp = path.with_suffix('.tmp')
+    translations = translations or {}
+    header = {**metadata, 'format': FORMAT, 'version': VERSION, 'segments': len(table)}
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'metadata': header}, ensure_ascii=False) + '\n')
+        for i, (start, end, text) in enumerate(zip(table.starts.tolist(), table.ends.tolist(), table.texts)):
+            entry = {'index': i, 'start': start, 'end': end, 'text': text, 'translation': translations.get(i, '')}
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    os.replace(tmp, path)
+
+
+def _time(value: Any, line: int) -> float | None:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            # files from before version 2 store H:MM:SS.ss strings
+            return HMS_to_second(value)
+        except (ValueError, IndexError):
+            pass
+    raise TranslationFileError(f'bad time {value!r}', line)
+
+
+def _entry(obj: Any, position: int, line: int) -> TranslationEntry:
+    if not isinstance(obj, dict):
+        raise TranslationFileError('expected a JSON object', line)
+    index = obj.get('index', position)
+    if not isinstance(index, int) or isinstance(index, bool) or index < 0:
+        raise TranslationFileError(f'bad index {index!r}', line)
+    translation = obj.get('translation', '')
+    if translation is None:
+        translation = ''
+    if not isinstance(translation, str):
+        raise TranslationFileError('translation must be a string', line)
+    text = obj.get('text')
+    if text is not None and not isinstance(text, str):
+        raise TranslationFileError('text must be a string', line)
+    return TranslationEntry(index, _time(obj.get('start'), line), _time(obj.get('end'), line), text, translation)
+
+
+def read_entries(source: IO[str]) -> Tuple[Dict[str, Any] | None, Iterator[TranslationEntry]]:
+    """Metadata (None for sparse files) and a lazy iterator over the segment entries.
+
+    Reads JSONL line by line; the old indented JSON export is detected on the first line
+    and parsed whole, which is the only case that holds the entire file in memory.
+    """
+    first = source.readline()
+    while first and not first.strip():
+        first = source.readline()
+    try:
+        head = json.loads(first) if first.strip() else None
+    except json.JSONDecodeError:
+        head = None
+        if first.lstrip().startswith('{'):
+            return _read_legacy(first + source.read())
+        raise TranslationFileError('not a JSON lines file', 1)
+
+    if isinstance(head, dict) and 'transcriptions' in head:
+        # an old-style export that happens to fit on one line
+        return _read_legacy(first + source.read())
+
+    metadata = None
+    if isinstance(head, dict) and 'metadata' in head:
+        metadata = head['metadata']
+        if not isinstance(metadata, dict):
+            raise TranslationFileError('metadata must be an object', 1)
+        version = metadata.get('version', VERSION)
+        if not isinstance(version, int) or isinstance(version, bool):
+            raise TranslationFileError(f'file version must be an integer, got {version!r}', 1)
+        if version > VERSION:
+            raise TranslationFileError(f'file version {version} is newer than this program', 1)
+        head = None
+
+    def entries() -> Iterator[TranslationEntry]:
+        position = 0
+        if head is not None:
+            yield _entry(head, position, 1)
+            position += 1
+        for line, raw in enumerate(source, start=2):
+            if not raw.strip():
+                continue
+            try:
+                obj = json.loads(raw)
+            except json.JSONDecodeError as e:
+                raise TranslationFileError(f'invalid JSON ({e.msg})', line) from None
+            yield _entry(obj, position, line)
+            position += 1
+
+    return metadata, entries()
+
+
+def _read_legacy(content: str) -> Tuple[Dict[str, Any], Iterator[TranslationEntry]]:
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise TranslationFileError(f'invalid JSON ({e.msg})', e.lineno) from None
+    if not isinstance(data, dict) or 'metadata' not in data or 'transcriptions' not in data:
+        raise TranslationFileError('expected "metadata" and "transcriptions"')
+    entries = data['transcriptions']
+    if not isinstance(entries, list):
+        raise TranslationFileError('"transcriptions" must be a list')
+    if not isinstance(data['metadata'], dict):
+        raise TranslationFileError('metadata must be an object')
+    return {**data['metadata'], 'segments': len(entries)}, (_entry(obj, i, None) for i, obj in enumerate(entries)) # type:ignore
+
+
+def load_translated_table(path: str | Path) -> Tuple[Dict[str, Any] | None, TranscriptionTable]:
+    """Read a full translation file into a table whose texts already carry the translations."""
+    table = TranscriptionTable()
+    with open(path, 'r', encoding='utf-8') as f:
+        metadata, entries = read_entries(f)
+        for entry in entries:
+            if entry.start is None or entry.end is None or entry.text is None:
+                raise TranslationFileError(f'segment {entry.index} has no times or text, is this a partial file?')
+            if entry.index != len(table):
+                raise TranslationFileError(f'segment {entry.index} out of order, expected {len(table)}')
+            table.append(entry.start, entry.end, with_translation(entry.text, entry.translation))
+    if metadata is not None and metadata.get('segments', len(table)) != len(table):
+        raise TranslationFileError(f'metadata promises {metadata["segments"]} segments, found {len(table)}')
+    return metadata, table
+
+
+def apply_translations(table: TranscriptionTable, entries: Iterable[TranslationEntry]) -> int:
+    """Put translations from full or sparse entries on top of an untranslated table; returns how many."""
+    # copied, so a segment listed twice doesn't stack its translations
+    texts = list(table.texts)
+    applied = 0
+    for entry in entries:
+        if entry.index >= len(table):
+            raise TranslationFileError(f'segment {entry.index} does not exist, there are {len(table)}')
+        if entry.translation:
+            table.set_text(entry.index, with_translation(texts[entry.index], entry.translation))
+            applied += 1
+    return applied
+
+
+def merge_translation_upload(upload: IO[str], base_path: str | Path, output_path: str | Path) -> Dict[str, Any]:
+    """Validate an uploaded translation (full, or only the changed segments) and merge it into base_path.
+
+    The upload is checked line by line while its translations, and any corrected
+    original texts, are collected by index; base_path is then streamed once into
+    output_path with those swapped in. Nothing is written when the upload is invalid.
+    """
+    metadata, entries = read_entries(upload)
+    updates: Dict[int, Tuple[str | None, str]] = {}
+    for entry in entries:
+        updates[entry.index] = (entry.text, entry.translation)
+    changed = len(updates)
+    corrected = 0
+
+    output_path = Path(output_path)
+    tmp = output_path.with_suffix('.tmp')
+    count = 0
+    try:
+        with open(base_path, 'r', encoding='utf-8') as base, open(tmp, 'w', encoding='utf-8') as out:
+            base_metadata, base_entries = read_entries(base)
+            header = dict(base_metadata or {})
+            if metadata is not None and metadata.get('segments', header.get('segments')) != header.get('segments'):
+                raise TranslationFileError(f'upload has {metadata["segments"]} segments, '
+                                           f'the transcription has {header.get("segments")}')
+            header.update(format=FORMAT, version=VERSION)
+            out.write(json.dumps({'metadata': header}, ensure_ascii=False) + '\n')
+            for entry in base_entries:
+                text, translation = updates.pop(entry.index, (None, entry.translation))
+                # full uploads carry the original text too, a user may have fixed a transcription error
+                if text is None:
+                    text = entry.text
+                elif text != entry.text:
+                    corrected += 1
+                out.write(json.dumps({'index': entry.index, 'start': entry.start, 'end': entry.end,
+                                      'text': text, 'translation': translation}, ensure_ascii=False) + '\n')
+                count += 1
+        if updates:
+            raise TranslationFileError(f'segment {min(updates)} does not exist, there are {count}')
+        os.replace(tmp, output_path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    logger.info(f'merged {changed} uploaded translations ({corrected} corrected texts) into {output_path}')
+    return {'segments': count, 'updated': changed, 'corrected': corrected, 'sparse': metadata is None}
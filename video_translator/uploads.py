@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+COPY_BLOCK = 1024 * 1024
+# partial uploads nobody touched for this long are dropped
+STALE_SECONDS = 24 * 3600
+
+
+def blake2b_file(path: Path) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        while block := f.read(COPY_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class UploadManager:
+    """Chunked, resumable uploads written straight into upload_dir.
+
+    A session is keyed by the client's fingerprint (name, size, mtime), so re-sending the
+    same file after a dropped connection picks up the chunks already on disk. Chunks are
+    fixed-size and offset-addressed, each one is streamed into a preallocated .part file
+    in COPY_BLOCK pieces. Finished files are hashed and identical content is stored once.
+    """
+
+    def __init__(self, upload_dir: str | Path, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 digest: Callable[[Path], str] = blake2b_file):
+        self.upload_dir = Path(upload_dir)
+        self.partial_dir = self.upload_dir / '.partial'
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.digest = digest
+        self._lock = threading.Lock()
+        self._index_path = self.partial_dir / 'hashes.json'
+
+    def _state_path(self, upload_id: str) -> Path:
+        return self.partial_dir / f'{upload_id}.json'
+
+    def _data_path(self, upload_id: str) -> Path:
+        return self.partial_dir / f'{upload_id}.part'
+
+    def _load(self, upload_id: str) -> Dict[str, Any]:
+        if not upload_id.isalnum():
+            raise KeyError(upload_id)
+        try:
+            return json.loads(self._state_path(upload_id).read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            raise KeyError(upload_id) from None
+
+    def _save(self, state: Dict[str, Any]):
+        path = self._state_path(state['upload_id'])
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(state), encoding='utf-8')
+        os.replace(tmp, path)
+
+    def chunk_count(self, size: int) -> int:
+        return (size + self.chunk_size - 1) // self.chunk_size
+
+    def create(self, filename: str, size: int, fingerprint: str) -> Dict[str, Any]:
+        """Start an upload, or return the existing session for the same fingerprint."""
+        if size < 0:
+            raise ValueError('negative size')
+        upload_id = hashlib.blake2b(f'{filename}:{size}:{fingerprint}'.encode(), digest_size=16).hexdigest()
+        with self._lock:
+            self.purge_stale()
+            try:
+                state = self._load(upload_id)
+                if not self._data_path(upload_id).exists():
+                    raise KeyError(upload_id)
+            except KeyError:
+                state = {'upload_id': upload_id, 'filename': filename, 'size': size,
+                         'chunk_size': self.chunk_size, 'received': []}
+                with open(self._data_path(upload_id), 'wb') as f:
+                    f.truncate(size)
+                self._save(state)
+        return state
+
+    def write_chunk(self, upload_id: str, offset: int, stream: IO[bytes], length: int | None) -> Dict[str, Any]:
+        state = self._load(upload_id)
+        chunk_size, size = state['chunk_size'], state['size']
+        if offset % chunk_size or not 0 <= offset < size:
+            raise ValueError(f'offset {offset} is not a chunk boundary of this upload')
+        expected = min(chunk_size, size - offset)
+        if length is not None and length != expected:
+            raise ValueError(f'chunk at {offset} must be {expected} bytes, got {length}')
+
+        written = 0
+        with open(self._data_path(upload_id), 'r+b') as f:
+            f.seek(offset)
+            while written < expected:
+                block = stream.read(min(COPY_BLOCK, expected - written))
+                if not block:
+                    break
+                f.write(block)
+                written += len(block)
+        if written != expected:
+            # the connection dropped mid-chunk, the client sends it again
+            raise ValueError(f'chunk at {offset} ended after {written} of {expected} bytes')
+
+        with self._lock:
+            state = self._load(upload_id)
+            index = offset // chunk_size
+            if index not in state['received']:
+                state['received'].append(index)
+                self._save(state)
+        return state
+
+    def status(self, upload_id: str) -> Dict[str, Any]:
+        return self._load(upload_id)
+
+    def finalize(self, upload_id: str, target_name: str) -> Tuple[Path, bool]:
+        """Move the finished upload to upload_dir/target_name; returns (path, deduplicated)."""
+        state = self._load(upload_id)
+        missing = self.chunk_count(state['size']) - len(set(state['received']))
+        if missing:
+            raise ValueError(f'{missing} chunks still missing')
+
+        target = self.upload_dir / target_name
+        stem, suffix, n = target.stem, target.suffix, 1
+        while target.exists():
+            target = self.upload_dir / f'{stem}_{n}{suffix}'
+            n += 1
+        os.replace(self._data_path(upload_id), target)
+        self._state_path(upload_id).unlink(missing_ok=True)
+        # hashing the final path lets a digest cache keyed by path be reused by later stages
+        digest = self.digest(target)
+
+        with self._lock:
+            index = self._read_index()
+            existing = index.get(digest)
+            if existing and existing != target.name and (self.upload_dir / existing).exists():
+                target.unlink()
+                logger.info(f'upload {target_name} is identical to {existing}, keeping one copy')
+                return self.upload_dir / existing, True
+            index[digest] = target.name
+            tmp = self._index_path.with_suffix('.tmp')
+            tmp.write_text(json.dumps(index), encoding='utf-8')
+            os.replace(tmp, self._index_path)
+        return target, False
+
+    def _read_index(self) -> Dict[str, str]:
+        try:
+            return json.loads(self._index_path.read_text(encoding='utf-8'))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def purge_stale(self, max_age: float = STALE_SECONDS):
+        cutoff = time.time() - max_age
+        for state_path in self.partial_dir.glob('*.json'):
+            if state_path == self._index_path:
+                continue
+            data_path = state_path.with_suffix('.part')
+            newest = max(p.stat().st_mtime for p in (state_path, data_path) if p.exists())
+            if newest < cutoff:
+                state_path.unlink(missing_ok=True)
+                data_path.unlink(missing_ok=True)
+                logger.info(f'dropped stale partial upload {state_path.stem}')
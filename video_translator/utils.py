@@ -1,11 +1,111 @@
-from dataclasses import dataclass
-@dataclass
+from typing import Iterable, Iterator, List, Tuple
+import numpy as np
+
+VIDEO_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'flv', 'wmv'}
+
+class TaskCancelled(Exception):
+    pass
+
 class Transcription:
-    start : str
-    start_calc : float
-    end : str
-    end_calc : float
-    text : str
+    """One segment. Only the float times are stored, the ASS timestamps are formatted on access."""
+    __slots__ = ('start_calc', 'end_calc', 'text')
+
+    def __init__(self, start_calc: float, end_calc: float, text: str):
+        self.start_calc = start_calc
+        self.end_calc = end_calc
+        self.text = text
+
+    @property
+    def start(self) -> str:
+        return second_to_HMS(self.start_calc)
+
+    @property
+    def end(self) -> str:
+        return second_to_HMS(self.end_calc)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Transcription):
+            return NotImplemented
+        return (self.start_calc, self.end_calc, self.text) == (other.start_calc, other.end_calc, other.text)
+
+    def __repr__(self) -> str:
+        return f'Transcription(start_calc={self.start_calc!r}, end_calc={self.end_calc!r}, text={self.text!r})'
+
+class TranscriptionTable:
+    """Columnar segment store: start/end as float64 arrays plus a list of texts.
+
+    Indexing or iterating hands out detached Transcription records; edits go through
+    set_text / set_times / shift / clip so the columns stay the single source of truth.
+    """
+    __slots__ = ('_starts', '_ends', '_size', 'texts')
+
+    def __init__(self, capacity: int = 64):
+        self._starts = np.empty(capacity, dtype=np.float64)
+        self._ends = np.empty(capacity, dtype=np.float64)
+        self._size = 0
+        self.texts: List[str] = []
+
+    @classmethod
+    def from_arrays(cls, starts: Iterable[float], ends: Iterable[float], texts: Iterable[str]) -> 'TranscriptionTable':
+        starts = np.asarray(starts, dtype=np.float64)
+        table = cls(capacity=max(len(starts), 1))
+        table._starts[:len(starts)] = starts
+        table._ends[:len(starts)] = np.asarray(ends, dtype=np.float64)
+        table._size = len(starts)
+        table.texts = list(texts)
+        if len(table.texts) != table._size:
+            raise ValueError('starts, ends and texts must have the same length')
+        return table
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[Tuple[float, float, str]]) -> 'TranscriptionTable':
+        table = cls()
+        for start, end, text in segments:
+            table.append(start, end, text)
+        return table
+
+    @property
+    def starts(self) -> np.ndarray:
+        return self._starts[:self._size]
+
+    @property
+    def ends(self) -> np.ndarray:
+        return self._ends[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def __getitem__(self, i: int) -> Transcription:
+        if i < 0:
+            i += self._size
+        if not 0 <= i < self._size:
+            raise IndexError(i)
+        return Transcription(float(self._starts[i]), float(self._ends[i]), self.texts[i])
+
+    def __iter__(self) -> Iterator[Transcription]:
+        for i in range(self._size):
+            yield Transcription(float(self._starts[i]), float(self._ends[i]), self.texts[i])
+
+    def append(self, start: float, end: float, text: str):
+        if self._size == len(self._starts):
+            capacity = max(64, 2 * self._size)
+            self._starts = np.resize(self._starts, capacity)
+            self._ends = np.resize(self._ends, capacity)
+        self._starts[self._size] = start
+        self._ends[self._size] = end
+        self.texts.append(text)
+        self._size += 1
+
+    def set_text(self, i: int, text: str):
+        self.texts[i] = text
+
+    def set_times(self, starts: np.ndarray, ends: np.ndarray):
+        self._starts[:self._size] = starts
+        self._ends[:self._size] = ends
+
 def second_to_HMS(seconds: float) -> str:
         h = int(seconds // 3600)
         m = int((seconds % 3600) // 60)
@@ -22,4 +122,19 @@ def second_to_HMS(seconds: float) -> str:
                     m = 0
                     h += 1
 
-        return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
\ No newline at end of file
+        return f"{h}:{m:02d}:{s:02d}.{cs:02d}"
+
+def format_HMS(seconds: np.ndarray) -> List[str]:
+    # same rounding as second_to_HMS: centiseconds of the fractional part, carried into the seconds
+    seconds = np.asarray(seconds, dtype=np.float64)
+    whole = np.trunc(seconds)
+    cs = np.round((seconds - whole) * 100).astype(np.int64)
+    total = whole.astype(np.int64) + (cs == 100)
+    cs[cs == 100] = 0
+    h, rest = np.divmod(total, 3600)
+    m, s = np.divmod(rest, 60)
+    return [f"{hh}:{mm:02d}:{ss:02d}.{cc:02d}" for hh, mm, ss, cc in zip(h.tolist(), m.tolist(), s.tolist(), cs.tolist())]
+
+def HMS_to_second(hms: str) -> float:
+    h, m, s = hms.strip().split(':')
+    return int(h) * 3600 + int(m) * 60 + float(s)
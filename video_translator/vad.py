@@ -0,0 +1,73 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+VAD_MODES = ('energy', 'silero')
+
+
+@dataclass
+class VadOptions:
+    # only silences at least this long are cut out of what the model sees
+    min_silence: float = 1.0
+    # audio kept on both sides of every cut so word onsets and tails survive
+    padding: float = 0.2
+
+    def silero_parameters(self) -> Dict[str, Any]:
+        """The same settings in the form faster-whisper's vad_filter takes them."""
+        return {'min_silence_duration_ms': int(self.min_silence * 1000), 'speech_pad_ms': int(self.padding * 1000)}
+
+
+def speech_regions(silent_periods: List[Tuple[float, float]], duration: float,
+                   options: VadOptions | None = None) -> List[Tuple[float, float]]:
+    """Complement of the long silent periods within [0, duration), padded on both sides."""
+    options = options or VadOptions()
+    regions = []
+    start = 0.0
+    for sil_start, sil_end in silent_periods:
+        if sil_end - sil_start < max(options.min_silence, 2 * options.padding):
+            continue
+        cut_start, cut_end = max(start, sil_start + options.padding), min(duration, sil_end - options.padding)
+        if cut_end <= cut_start:
+            continue
+        if cut_start > start:
+            regions.append((start, cut_start))
+        start = cut_end
+    if start < duration:
+        regions.append((start, duration))
+    return regions
+
+
+class TimeMap:
+    """Maps times on the gated (concatenated speech) timeline back onto the original one."""
+
+    def __init__(self, regions: List[Tuple[float, float]]):
+        spans = np.asarray(regions, dtype=np.float64).reshape(-1, 2)
+        self.orig_starts = spans[:, 0]
+        lengths = spans[:, 1] - spans[:, 0]
+        self.gated_starts = np.concatenate(([0.0], np.cumsum(lengths)[:-1])) if len(spans) else np.zeros(0)
+
+    def to_original(self, t: float, end: bool = False) -> float:
+        return float(self.map_array(np.array([t]), end)[0])
+
+    def map_array(self, t: np.ndarray, end: bool = False) -> np.ndarray:
+        if len(self.gated_starts) == 0:
+            return np.asarray(t, dtype=np.float64)
+        # a time sitting exactly on a join belongs to the region before it when it ends something
+        idx = np.searchsorted(self.gated_starts, t, side='left' if end else 'right') - 1
+        idx = np.clip(idx, 0, len(self.gated_starts) - 1)
+        return self.orig_starts[idx] + (t - self.gated_starts[idx])
+
+
+def gate_audio(audio: np.ndarray, silent_periods: List[Tuple[float, float]], sample_rate: int,
+               options: VadOptions | None = None) -> Tuple[np.ndarray, TimeMap]:
+    """Drop the long silences from audio; returns the speech-only samples and the map back."""
+    duration = len(audio) / sample_rate
+    regions = speech_regions(silent_periods, duration, options)
+    if regions == [(0.0, duration)]:
+        return audio, TimeMap(regions)
+    pieces = [audio[int(round(start * sample_rate)):int(round(end * sample_rate))] for start, end in regions]
+    gated = np.concatenate(pieces) if pieces else audio[:0]
+    # rebuild the regions from the sample counts so rounding can't make the map drift
+    regions = [(start, start + len(piece) / sample_rate) for (start, _), piece in zip(regions, pieces)]
+    return gated, TimeMap(regions)
@@ -2,14 +2,22 @@
 Flask 网页服务器，提供视频翻译程序的 GUI 界面
 """
 
+import io
 import os
 import json
 import logging
+import threading
 from pathlib import Path
-from threading import Thread
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
 from werkzeug.utils import secure_filename
-from .single_video_translation import VideoTranslator, Device
+from .scheduler import JobScheduler
+from .jobs import JobRunner, Worker, TERMINAL_STATUSES, default_worker_id
+from .cache import TranscriptionCache
+from .metrics import get_metrics_registry
+from .task_store import DEFAULT_TTL, open_task_store
+from .translation_file import TranslationFileError, merge_translation_upload
+from .uploads import UploadManager
+from .utils import VIDEO_EXTENSIONS
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -22,85 +30,64 @@ app = Flask(__name__, template_folder='templates', static_folder='static')
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 UPLOAD_FOLDER = PROJECT_ROOT / 'uploads'
 OUTPUT_FOLDER = PROJECT_ROOT / 'outputs'
-ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'flv', 'wmv'}
+ALLOWED_EXTENSIONS = VIDEO_EXTENSIONS
 MAX_FILE_SIZE = 5 * 1024 * 1024 * 1024  # 5GB
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
+# 前面有 Apache / lighttpd 等支持 X-Sendfile 的服务器时，文件内容交给它们直接发送
+app.config['USE_X_SENDFILE'] = os.environ.get('VIDEO_TRANSLATOR_X_SENDFILE', '') == '1'
 
 # 创建必要的目录
 UPLOAD_FOLDER.mkdir(exist_ok=True)
 OUTPUT_FOLDER.mkdir(exist_ok=True)
 
-# 全局任务管理
-tasks = {}
+# 转录缓存：同一个视频（即使换了文件名）再次提交时跳过 ffmpeg 和 whisper
+transcription_cache = TranscriptionCache(OUTPUT_FOLDER / '.cache')
+# 分块上传：直接写进 uploads/，断线后可以续传，内容相同的文件只保留一份
+upload_manager = UploadManager(UPLOAD_FOLDER, digest=transcription_cache.file_digest)
+
+# 任务状态和事件保存在 SQLite（WAL）里，重启后仍在，多个服务进程可以共用同一个库；
+# 设为 memory 则和以前一样只放在内存里
+task_store = open_task_store(os.environ.get('VIDEO_TRANSLATOR_TASK_DB') or OUTPUT_FOLDER / 'tasks.db')
+# 结束超过这么多秒的任务会被清理
+TASK_TTL = float(os.environ.get('VIDEO_TRANSLATOR_TASK_TTL', DEFAULT_TTL))
+# 有新事件时唤醒本进程的 SSE 连接，其他进程写入的事件靠定时轮询发现
+task_events_cond = threading.Condition()
+# 任务队列：固定数量的工作线程，转录等重负载阶段单独限流
+scheduler = JobScheduler(workers=int(os.environ.get('VIDEO_TRANSLATOR_WORKERS', 2)))
+# 设为 cprofile 或 pyinstrument 时，每个任务的性能分析结果写到 outputs/.profiles
+PROFILER = os.environ.get('VIDEO_TRANSLATOR_PROFILE') or None
+metrics_registry = get_metrics_registry()
+# 设为 1 时网页服务只负责收任务，转录和压制交给 `video-translator worker` 进程（可以在别的机器上）
+REMOTE_WORKERS = os.environ.get('VIDEO_TRANSLATOR_REMOTE_WORKERS', '') == '1'
+
+def notify_events():
+    with task_events_cond:
+        task_events_cond.notify_all()
+
+job_runner = JobRunner(task_store, OUTPUT_FOLDER, cache=transcription_cache, worker_id=default_worker_id(),
+                       profiler=PROFILER, max_attempts=int(os.environ.get('VIDEO_TRANSLATOR_MAX_ATTEMPTS', 3)),
+                       on_event=notify_events)
+# 本进程内的 worker：从任务库领取任务交给 scheduler，重启后库里排队的任务也会被它接着跑
+local_worker = Worker(job_runner, scheduler)
 
 def allowed_file(filename):
     """检查文件是否被允许"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def process_video_task(task_id, video_path, model_size, device, manual_translate=False):
-    """后台处理视频的任务函数"""
-    try:
-        tasks[task_id]['status'] = 'processing'
-        tasks[task_id]['progress'] = 10
-        
-        # 设置输出目录
-        output_dir = (OUTPUT_FOLDER / Path(video_path).stem).resolve()
-        output_dir.mkdir(exist_ok=True)
-
-        # 创建转录器实例
-        translator = VideoTranslator(
-            video_path,
-            model_size=model_size,
-            device=Device(device),
-            verbose=True,
-            work_dir=output_dir
-        )
-        
-        tasks[task_id]['progress'] = 20
-        tasks[task_id]['message'] = '初始化环境...'
-        
-        tasks[task_id]['progress'] = 30
-        tasks[task_id]['message'] = '提取音频...'
-        translator.get_audio_stream()
-        
-        tasks[task_id]['progress'] = 50
-        tasks[task_id]['message'] = '获取视频分辨率...'
-        translator.get_resolution()
-        
-        tasks[task_id]['progress'] = 60
-        tasks[task_id]['message'] = '生成转录...'
-        translator.whisper_transcription()
-        
-        if manual_translate:
-            tasks[task_id]['progress'] = 80
-            tasks[task_id]['message'] = '等待翻译...'
-            translator.split_transcription()
-            tasks[task_id]['translation_file'] = str(translator.translation_file)
-            tasks[task_id]['status'] = 'waiting_translation'
-            tasks[task_id]['progress'] = 100
-        else:
-            tasks[task_id]['progress'] = 80
-            tasks[task_id]['message'] = '生成字幕...'
-            translator.generate_subtitle()
-            tasks[task_id]['subtitle_file'] = str(translator.ass_path)
-            
-            tasks[task_id]['progress'] = 90
-            tasks[task_id]['message'] = '压制字幕到视频...'
-            translator.compress_subtitle()
-            
-            tasks[task_id]['output_file'] = str(translator.output_path)
-            tasks[task_id]['status'] = 'completed'
-            tasks[task_id]['progress'] = 100
-            tasks[task_id]['message'] = '完成！'
-        
-    except Exception as e:
-        logger.error(f"Task {task_id} failed: {str(e)}", exc_info=True)
-        tasks[task_id]['status'] = 'failed'
-        tasks[task_id]['error'] = str(e)
-        tasks[task_id]['progress'] = 0
+def task_status(task_id, task=None):
+    return job_runner.task_status(task_id, task)
+
+def update_task(task_id, **fields):
+    """更新任务状态，同时推送一条 status 事件"""
+    job_runner.update_task(task_id, **fields)
+
+def submit_task():
+    """通知本进程的 worker 有新任务；REMOTE_WORKERS 时任务只进库，由独立的 worker 进程领取"""
+    if not REMOTE_WORKERS:
+        local_worker.start().wake()
 
 # 路由
 
@@ -138,6 +125,62 @@ def upload_video():
         logger.error(f"Upload error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """开始（或续传）一个分块上传，返回已收到的分块"""
+    data = request.json or {}
+    filename = secure_filename(data.get('filename', ''))
+    if not filename:
+        return jsonify({'error': '文件名为空'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': '不支持的文件格式，请上传视频文件'}), 400
+    try:
+        size = int(data.get('size', -1))
+        if size > MAX_FILE_SIZE:
+            return jsonify({'error': '文件过大'}), 413
+        state = upload_manager.create(filename, size, str(data.get('fingerprint', '')))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(state), 200
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """写入一个分块，位置由 offset 参数指定"""
+    try:
+        offset = int(request.args.get('offset', ''))
+        state = upload_manager.write_chunk(upload_id, offset, request.stream, request.content_length)
+    except KeyError:
+        return jsonify({'error': '上传不存在'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'received': len(state['received'])}), 200
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """查询上传进度，用于续传"""
+    try:
+        return jsonify(upload_manager.status(upload_id)), 200
+    except KeyError:
+        return jsonify({'error': '上传不存在'}), 404
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """所有分块到齐后合成最终文件"""
+    try:
+        state = upload_manager.status(upload_id)
+        filepath, deduplicated = upload_manager.finalize(upload_id, state['filename'])
+    except KeyError:
+        return jsonify({'error': '上传不存在'}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    filepath = filepath.resolve()
+    return jsonify({
+        'success': True,
+        'filename': filepath.name,
+        'filepath': str(filepath),
+        'deduplicated': deduplicated
+    }), 200
+
 @app.route('/api/process', methods=['POST'])
 def process_video():
     """开始处理视频"""
@@ -147,6 +190,7 @@ def process_video():
         model_size = data.get('model_size', 'large-v3')
         device = data.get('device', 'cpu')
         manual_translate = data.get('manual_translate', False)
+        priority = int(data.get('priority', 0))
         
         if not filepath or not Path(filepath).exists():
             return jsonify({'error': '视频文件不存在'}), 400
@@ -154,23 +198,25 @@ def process_video():
         # 生成任务 ID
         task_id = Path(filepath).stem + '_' + str(int(__import__('time').time()))
         
+        # 顺便清理过期的任务
+        task_store.expire(TASK_TTL)
+        
         # 创建任务
-        tasks[task_id] = {
+        task = {
             'status': 'queued',
             'progress': 0,
             'message': '等待中...',
+            'job': 'transcription',
             'filepath': filepath,
             'model_size': model_size,
-            'device': device
+            'device': device,
+            'manual_translate': manual_translate,
+            'priority': priority
         }
+        task_store.create(task_id, task, priority=priority)
         
-        # 在后台线程中处理
-        thread = Thread(
-            target=process_video_task,
-            args=(task_id, filepath, model_size, device, manual_translate),
-            daemon=True
-        )
-        thread.start()
+        # 任务已经在库里，由 worker 领取处理
+        submit_task()
         
         return jsonify({
             'success': True,
@@ -185,111 +231,159 @@ def process_video():
 def get_task_status(task_id):
     """获取任务状态"""
     try:
-        if task_id not in tasks:
+        task = task_store.get(task_id)
+        if task is None:
             return jsonify({'error': '任务不存在'}), 404
         
-        task = tasks[task_id]
-        return jsonify({
-            'task_id': task_id,
-            'status': task.get('status'),
-            'progress': task.get('progress', 0),
-            'message': task.get('message', ''),
-            'error': task.get('error'),
-            'translation_file': task.get('translation_file'),
-            'subtitle_file': task.get('subtitle_file'),
-            'output_file': task.get('output_file')
-        }), 200
+        return jsonify(task_status(task_id, task)), 200
     
     except Exception as e:
         logger.error(f"Status check error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/task/<task_id>/events', methods=['GET'])
+def task_event_stream(task_id):
+    """SSE：推送状态变化和每个新转录片段，任务结束后关闭连接"""
+    if task_id not in task_store:
+        return jsonify({'error': '任务不存在'}), 404
+
+    since = request.headers.get('Last-Event-ID') or request.args.get('since') or 0
+    try:
+        since = int(since)
+    except ValueError:
+        since = 0
+
+    def generate():
+        sent = since
+        idle = 0.0
+        while True:
+            task = task_store.get(task_id)
+            finished = task is None or task.get('status') in TERMINAL_STATUSES
+            pending = task_store.events_since(task_id, sent)
+            if not pending:
+                if finished:
+                    return
+                if idle >= 15:
+                    # 保活，防止代理断开空闲连接
+                    idle = 0.0
+                    yield ': ping\n\n'
+                # 本进程的事件会立刻唤醒，其他进程写的事件最多晚一秒
+                with task_events_cond:
+                    task_events_cond.wait(timeout=1)
+                idle += 1
+                continue
+            idle = 0.0
+            for event in pending:
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+            sent = pending[-1]['id']
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/task/<task_id>/cancel', methods=['POST'])
+def cancel_task(task_id):
+    """取消排队中或正在运行的任务"""
+    task = task_store.get(task_id)
+    if task is None:
+        return jsonify({'error': '任务不存在'}), 404
+
+    if task.get('status') not in ('queued', 'processing'):
+        return jsonify({'error': '任务已结束，无法取消'}), 400
+
+    running = scheduler.is_running(task_id)
+    if scheduler.cancel(task_id):
+        if running:
+            # 运行中的任务由工作线程自己收尾
+            update_task(task_id, message='正在取消...')
+        else:
+            # 已经被本进程领取，还没开始跑
+            update_task(task_id, status='cancelled', message='已取消')
+    elif task.get('status') == 'queued':
+        # 还在库里排队，直接标记，worker 领取时会跳过
+        update_task(task_id, status='cancelled', message='已取消')
+    else:
+        # 在别的进程里运行，那边下一次心跳时会看到这个标记
+        update_task(task_id, cancel_requested=True, message='正在取消...')
+    return jsonify({'success': True}), 200
+
 @app.route('/api/upload-translation/<task_id>', methods=['POST'])
 def upload_translation(task_id):
     """上传翻译文件并继续处理"""
     try:
-        if task_id not in tasks:
+        task = task_store.get(task_id)
+        if task is None:
             return jsonify({'error': '任务不存在'}), 404
         
         if 'file' not in request.files:
             return jsonify({'error': '没有选择文件'}), 400
         
-        file = request.files['file']
-        if not file.filename.endswith('.json'):
-            return jsonify({'error': '请上传 JSON 格式的翻译文件'}), 400
+        if task.get('status') in ('queued', 'processing'):
+            return jsonify({'error': '任务正在处理中，请稍后再上传'}), 400
         
-        # 验证 JSON 格式
-        translation_data = json.load(file)
-        if 'metadata' not in translation_data or 'transcriptions' not in translation_data:
-            return jsonify({'error': '翻译文件格式不正确'}), 400
+        # 以最近一次合并后的翻译为底稿，这样可以只上传改动过的片段
+        base_path = task.get('translation_path') or task.get('translation_file')
+        if not base_path or not Path(base_path).exists():
+            return jsonify({'error': '转录文件不存在'}), 400
+        
+        file = request.files['file']
+        if not file.filename.endswith(('.jsonl', '.json')):
+            return jsonify({'error': '请上传 JSONL（或旧版 JSON）格式的翻译文件'}), 400
         
-        # 保存翻译文件
-        task = tasks[task_id]
-        translation_path = OUTPUT_FOLDER / Path(task['filepath']).stem / f'translation_{task_id}.json'
+        # 边读边校验，合并进底稿后再保存，不合法的文件不会写入
+        translation_path = OUTPUT_FOLDER / Path(task['filepath']).stem / f'translation_{task_id}.jsonl'
         translation_path.parent.mkdir(parents=True, exist_ok=True)
-        file.seek(0)
-        file.save(translation_path)
+        upload = io.TextIOWrapper(file.stream, encoding='utf-8')
+        try:
+            merged = merge_translation_upload(upload, base_path, translation_path)
+        except (TranslationFileError, UnicodeDecodeError) as e:
+            return jsonify({'error': f'翻译文件格式不正确：{e}'}), 400
         
         # 继续处理
-        thread = Thread(
-            target=continue_with_translation,
-            args=(task_id, translation_path),
-            daemon=True
-        )
-        thread.start()
+        update_task(task_id, status='queued', message='等待中...', job='translation',
+                    translation_path=str(translation_path), cancel_requested=None, attempts=None,
+                    not_before=None)
+        submit_task()
         
         return jsonify({
             'success': True,
-            'message': '翻译文件已上传，开始处理...'
+            'message': '翻译文件已上传，开始处理...',
+            'segments': merged['segments'],
+            'updated': merged['updated'],
+            'corrected': merged['corrected']
         }), 200
     
-    except json.JSONDecodeError:
-        return jsonify({'error': 'JSON 格式错误'}), 400
     except Exception as e:
         logger.error(f"Translation upload error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-def continue_with_translation(task_id, translation_path):
-    """使用翻译文件继续处理"""
-    try:
-        task = tasks[task_id]
-        task['status'] = 'processing'
-        task['progress'] = 50
-        task['message'] = '加载翻译...'
-        
-        output_dir = (OUTPUT_FOLDER / Path(task['filepath']).stem).resolve()
-        output_dir.mkdir(exist_ok=True)
-        translator = VideoTranslator(
-            task['filepath'],
-            model_size=task['model_size'],
-            device=Device(task['device']),
-            work_dir=output_dir
-        )
-        
-        task['progress'] = 60
-        task['message'] = '应用翻译...'
-        if translator.load_from_translation_file(translation_path):
-            task['progress'] = 80
-            task['message'] = '生成字幕...'
-            translator.generate_subtitle()
-            task['subtitle_file'] = str(translator.ass_path)
-            
-            task['progress'] = 90
-            task['message'] = '压制字幕到视频...'
-            translator.compress_subtitle()
-            
-            task['output_file'] = str(translator.output_path)
-            task['status'] = 'completed'
-            task['progress'] = 100
-            task['message'] = '完成！'
-        else:
-            raise Exception('无法加载翻译文件')
-    
-    except Exception as e:
-        logger.error(f"Continue with translation error: {str(e)}", exc_info=True)
-        task['status'] = 'failed'
-        task['error'] = str(e)
-        task['progress'] = 0
+def serve_file(file_path, as_attachment=True):
+    """支持 Range 和 If-None-Match 的文件响应，ETag 由文件大小和修改时间得出"""
+    stat = file_path.stat()
+    return send_file(file_path, as_attachment=as_attachment, conditional=True,
+                     etag=f'{stat.st_size:x}-{stat.st_mtime_ns:x}', last_modified=stat.st_mtime, max_age=0)
+
+def task_file_path(task_id, file_type):
+    """找到任务生成的文件，返回 (路径, 错误响应)"""
+    task = task_store.get(task_id)
+    if task is None:
+        return None, (jsonify({'error': '任务不存在'}), 404)
+
+    file_key = {
+        'video': 'output_file',
+        'subtitle': 'subtitle_file',
+        'translation': 'translation_file'
+    }.get(file_type)
+    if file_key is None:
+        return None, (jsonify({'error': '不支持的下载类型'}), 400)
+
+    file_value = task.get(file_key)
+    if not file_value:
+        return None, (jsonify({'error': '文件尚未生成'}), 404)
+
+    file_path = Path(file_value).resolve()
+    if not file_path.exists():
+        return None, (jsonify({'error': '文件不存在'}), 404)
+    return file_path, None
 
 @app.route('/api/download/<path:filepath>', methods=['GET'])
 def download_file(filepath):
@@ -299,7 +393,7 @@ def download_file(filepath):
         if not file_path.exists():
             return jsonify({'error': '文件不存在'}), 404
         
-        return send_file(file_path, as_attachment=True)
+        return serve_file(file_path)
     
     except Exception as e:
         logger.error(f"Download error: {str(e)}")
@@ -309,31 +403,33 @@ def download_file(filepath):
 def download_task_file(task_id, file_type):
     """按任务下载生成文件，避免把本机绝对路径放进 URL。"""
     try:
-        if task_id not in tasks:
-            return jsonify({'error': '任务不存在'}), 404
+        file_path, error = task_file_path(task_id, file_type)
+        if error is not None:
+            return error
+        return serve_file(file_path)
 
-        file_key = {
-            'video': 'output_file',
-            'subtitle': 'subtitle_file',
-            'translation': 'translation_file'
-        }.get(file_type)
-        if file_key is None:
-            return jsonify({'error': '不支持的下载类型'}), 400
-
-        file_value = tasks[task_id].get(file_key)
-        if not file_value:
-            return jsonify({'error': '文件尚未生成'}), 404
-
-        file_path = Path(file_value).resolve()
-        if not file_path.exists():
-            return jsonify({'error': '文件不存在'}), 404
+    except Exception as e:
+        logger.error(f"Task download error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-        return send_file(file_path, as_attachment=True)
+@app.route('/api/preview/<task_id>', methods=['GET'])
+def preview_task_video(task_id):
+    """在线预览压制好的视频，浏览器按 Range 只拉取需要的片段"""
+    try:
+        file_path, error = task_file_path(task_id, 'video')
+        if error is not None:
+            return error
+        return serve_file(file_path, as_attachment=False)
 
     except Exception as e:
-        logger.error(f"Task download error: {str(e)}")
+        logger.error(f"Preview error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 文本格式的各阶段耗时统计，只统计本进程执行的任务（REMOTE_WORKERS 时为空）"""
+    return Response(metrics_registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/models', methods=['GET'])
 def get_models():
     """获取可用的模型列表"""
@@ -346,8 +442,12 @@ def get_devices():
     devices = ['cpu', 'cuda']
     return jsonify({'devices': devices}), 200
 
-def run_server(host='127.0.0.1', port=5000, debug=False):
+def run_server(host='127.0.0.1', port=5000, debug=False, workers=None):
     """运行 Flask 服务器"""
+    if workers is not None:
+        scheduler.workers = workers
+    if not REMOTE_WORKERS:
+        local_worker.start()
     logger.info(f"Starting server at http://{host}:{port}")
     app.run(host=host, port=port, debug=debug)
 